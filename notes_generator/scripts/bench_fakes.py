@@ -0,0 +1,167 @@
+"""
+bench_fakes.py
+--------------
+Stand-ins for the slow external parts of the pipeline, used by benchmark_pipeline.py.
+
+FakeLLMServer: a local HTTP server that answers LLM requests after a configurable latency,
+    failing a configurable fraction of them. gemini_api.py sends its requests here instead of
+    to Gemini (llm_backend.HTTPBackend) when LLM_HTTP_URL (or NOTES_LLM_HTTP_URL) points at it.
+FakeWhisper: an object with the same transcribe() interface as a Whisper model that sleeps
+    in proportion to the audio length and returns placeholder segments. transcriber.py uses it
+    when WHISPER_MODEL (or NOTES_WHISPER_MODEL) is "fake". Its speed is set with
+    NOTES_FAKE_WHISPER_RTF (seconds of audio per second of "transcription", default 50).
+
+The server can also be run on its own:
+    python bench_fakes.py [--port 8765] [--latency 0.5] [--jitter 0.2] [--error-rate 0.05]
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+# Whisper's sample rate; the fake model gets the same 16 kHz arrays as the real one
+SAMPLE_RATE = 16000
+
+
+class FakeLLMServer:
+    """
+    Threaded HTTP server that imitates an LLM endpoint.
+    POST JSON {"prompt": ..., "text": ...} -> {"text": ..., "input_tokens": ..., "output_tokens": ...}
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, jitter=0.0, error_rate=0.0, seed=None):
+        """
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port (0 = pick a free one).
+            latency (float): Seconds before each response.
+            jitter (float): Extra random latency, uniform in [0, jitter] seconds.
+            error_rate (float): Fraction of requests answered with HTTP 500 (or 429).
+            seed (int): Seed for reproducible latencies and errors.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/generate"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like a real API endpoint
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    delay = fake.latency + fake._random.uniform(0, fake.jitter)
+                    fail = fake._random.random() < fake.error_rate
+                    if fail:
+                        fake.errors += 1
+                time.sleep(delay)
+                if fail:
+                    self.send_error(fake._random.choice((429, 500)))
+                    return
+                text = request.get("text", "")
+                # Formatting keeps the text, summaries shorten it; a quarter is a fair middle
+                reply = "## Notes\n\n" + text[:max(200, len(text) // 4)]
+                body = json.dumps({
+                    "text": reply,
+                    "input_tokens": (len(request.get("prompt", "")) + len(text)) // 4,
+                    "output_tokens": len(reply) // 4,
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Starts serving in a background thread. Returns self."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+class FakeWhisper:
+    """
+    Imitates a loaded Whisper model: transcribe() sleeps for len(audio) / realtime_factor
+    and returns one placeholder sentence per `segment_seconds` of audio.
+    """
+
+    def __init__(self, realtime_factor=None, segment_seconds=5.0):
+        if realtime_factor is None:
+            realtime_factor = float(os.environ.get("NOTES_FAKE_WHISPER_RTF", 50))
+        self.realtime_factor = realtime_factor
+        self.segment_seconds = segment_seconds
+        self.device = SimpleNamespace(type="cpu")
+
+    def transcribe(self, audio, **kwargs):
+        if isinstance(audio, str):
+            raise TypeError("FakeWhisper needs decoded audio, not a file path")
+        duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration / self.realtime_factor)
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(duration, start + self.segment_seconds)
+            text = f" At {start:.0f} seconds the speaker explains point number {len(segments) + 1} of the session."
+            segments.append({"id": len(segments), "start": start, "end": end, "text": text})
+            start = end
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": "en"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stand-in LLM server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeLLMServer(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"Fake LLM server listening on {server.url} (set NOTES_LLM_HTTP_URL to use it)")
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+benchmark_pipeline.py
+---------------------
+Offline end-to-end benchmark of the pipeline: no real recordings, Whisper model or Gemini quota needed.
+
+1. Generates `--count` synthetic Zoom-like .mp4 files of `--duration` seconds with ffmpeg's
+   lavfi sources (benchmark_profiles.make_synthetic_video).
+2. Starts the stand-in LLM server (bench_fakes.FakeLLMServer) with the given latency and error rate.
+3. Runs the real watchers (or the orchestrator) as subprocesses against a scratch folder, using
+   the NOTES_* environment overrides in config.py, with the fake transcriber unless
+   `--whisper-model` names a real model. With `--replicas N`, N copies of each run side by side
+   with DISTRIBUTED_WORKERS on, claiming jobs through lease files (leases.py).
+4. Drops the videos into the watched folder (optionally staggered) and waits for every summary.
+5. Stops the pipeline and reports per-stage latency (from the metrics file, metrics.py),
+   end-to-end latency per video and throughput, as a table and optionally as JSON.
+   `--compare` prints the change against an earlier JSON result.
+
+Usage:
+    python benchmark_pipeline.py [--mode watchers|orchestrator] [--count 3] [--duration 300]
+        [--llm-latency 0.5] [--llm-jitter 0.2] [--llm-error-rate 0.0] [--whisper-model fake]
+        [--whisper-rtf 50] [--stagger 0] [--replicas 1] [--timeout 900] [--json results.json]
+        [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+WATCHER_SCRIPTS = ("video_watcher", "audio_watcher", "transcript_watcher")
+
+
+def scratch_environment(workdir, args, llm_url):
+    """
+    Returns the environment for the pipeline processes: every folder inside `workdir`,
+    the fake LLM server, and the chosen Whisper model.
+    """
+    env = dict(os.environ)
+    env.update({
+        "NOTES_VIDEOS_DIR": str(workdir / "videos"),
+        "NOTES_AUDIO_DIR": str(workdir / "audio"),
+        "NOTES_TRANSCRIPTS_DIR": str(workdir / "transcripts"),
+        "NOTES_LOG_DIR": str(workdir / "logs"),
+        "NOTES_STATE_DIR": str(workdir / "state"),
+        "NOTES_LLM_HTTP_URL": llm_url,
+        "NOTES_WHISPER_MODEL": args.whisper_model,
+        "NOTES_FAKE_WHISPER_RTF": str(args.whisper_rtf),
+        "NOTES_GEMINI_RPM": str(args.rpm),
+        # A warm cache would hide the LLM cost being measured
+        "NOTES_GEMINI_CACHE": "0",
+        # Videos are moved in atomically, so there is no copy to wait out
+        "NOTES_READY_STABLE_SECONDS": "0",
+        # Several copies of each process share the folders through lease files
+        "NOTES_DISTRIBUTED": "1" if args.replicas > 1 else "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def start_pipeline(mode, env, log_dir, replicas=1):
+    """
+    Starts the watchers or the orchestrator, `replicas` copies of each. Returns {name: Popen}.
+    """
+    scripts = WATCHER_SCRIPTS if mode == "watchers" else ("orchestrator",)
+    processes = {}
+    for script in scripts:
+        for i in range(replicas):
+            name = script if i == 0 else f"{script}-{i+1}"
+            log = open(log_dir / f"{name}.log", "w", encoding="utf-8")
+            processes[name] = subprocess.Popen([sys.executable, str(SCRIPTS_DIR / f"{script}.py")],
+                                               stdout=log, stderr=subprocess.STDOUT, env=env, cwd=str(SCRIPTS_DIR))
+    return processes
+
+
+def wait_until_registered(pid_dir, processes, timeout=120):
+    """
+    Waits for every pipeline process to register in the PID registry, i.e. to finish starting up.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for name, process in processes.items():
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited during startup (code {process.returncode}); see its log")
+        if len(list(pid_dir.glob("*.json"))) >= len(processes):
+            return
+        time.sleep(0.2)
+    raise TimeoutError("pipeline processes did not start in time")
+
+
+def stop_pipeline(processes, stop_file, timeout=60):
+    """
+    Creates the stop file and waits for the processes to exit, killing any that don't.
+    """
+    stop_file.touch()
+    deadline = time.time() + timeout
+    for process in processes.values():
+        try:
+            process.wait(timeout=max(0.1, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def drop_videos(sources, videos_dir, stagger):
+    """
+    Moves the synthetic videos into the watched folder one by one (atomically, so watchers
+    never see a partial file). Returns {stem: drop time}.
+    """
+    dropped = {}
+    for i, source in enumerate(sources):
+        if i and stagger:
+            time.sleep(stagger)
+        staging = videos_dir.parent / (source.name + ".part")
+        shutil.copyfile(source, staging)
+        os.replace(staging, videos_dir / source.name)
+        dropped[source.stem] = time.time()
+    return dropped
+
+
+def wait_for_notes(dropped, summary_dir, processes, timeout):
+    """
+    Polls for each video's summary note. Returns {stem: completion time} for those that finished.
+    """
+    done = {}
+    deadline = time.time() + timeout
+    while len(done) < len(dropped) and time.time() < deadline:
+        for stem in dropped:
+            if stem not in done and (summary_dir / f"{stem}.md").exists():
+                done[stem] = time.time()
+        if any(p.poll() is not None for p in processes.values()):
+            break
+        time.sleep(0.2)
+    return done
+
+
+def read_spans(metrics_file):
+    """
+    Returns the span records from a metrics JSONL file.
+    """
+    spans = []
+    if metrics_file.exists():
+        with open(metrics_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "span":
+                    spans.append(record)
+    return spans
+
+
+def summarize(values):
+    """
+    Count, mean, p50, p95 and max of a list of durations in seconds.
+    """
+    from metrics import percentile
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 0.5), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def stage_stats(spans):
+    """
+    Per-span-name latency summary, error count and media throughput.
+    """
+    stats = {}
+    for name in sorted({s["name"] for s in spans}):
+        named = [s for s in spans if s["name"] == name]
+        ok = [s for s in named if s.get("ok", True)]
+        entry = summarize([s["duration"] for s in ok])
+        entry["errors"] = len(named) - len(ok)
+        media = sum(s.get("media_seconds") or 0 for s in ok)
+        if media:
+            entry["media_seconds"] = round(media, 1)
+            entry["realtime_x"] = round(media / sum(s["duration"] for s in ok if s.get("media_seconds")), 1)
+        stats[name] = entry
+    return stats
+
+
+def run(args):
+    """
+    Runs one benchmark and returns the results dict.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="notes_bench_"))
+    for sub in ("videos", "audio", "transcripts", "logs", "state", "sources"):
+        (workdir / sub).mkdir()
+    # Point config at the scratch folder before anything imports it
+    from bench_fakes import FakeLLMServer
+    server = FakeLLMServer(latency=args.llm_latency, jitter=args.llm_jitter,
+                           error_rate=args.llm_error_rate, seed=args.seed).start()
+    env = scratch_environment(workdir, args, server.url)
+    os.environ.update({k: v for k, v in env.items() if k.startswith("NOTES_")})
+    from benchmark_profiles import make_synthetic_video
+
+    print(f"[benchmark] Working in {workdir}")
+    print(f"[benchmark] Generating {args.count} synthetic videos of {args.duration}s...")
+    sources = [make_synthetic_video(workdir / "sources" / f"bench_{i+1:02d}.mp4", args.duration)
+               for i in range(args.count)]
+
+    processes = start_pipeline(args.mode, env, workdir / "logs", args.replicas)
+    try:
+        wait_until_registered(workdir / "state" / "run", processes)
+        print(f"[benchmark] Pipeline up ({args.mode}); dropping videos...")
+        started = time.time()
+        dropped = drop_videos(sources, workdir / "videos", args.stagger)
+        done = wait_for_notes(dropped, workdir / "transcripts" / "summary", processes, args.timeout)
+        wall = time.time() - started
+    finally:
+        stop_pipeline(processes, workdir / "state" / "STOP_PIPELINE")
+        server.stop()
+
+    latencies = {stem: done[stem] - dropped[stem] for stem in done}
+    media_seconds = args.duration * len(done)
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "keep")},
+        "completed": len(done),
+        "timed_out": len(done) < len(dropped),
+        "wall_seconds": round(wall, 3),
+        "throughput_media_min_per_wall_min": round(media_seconds / wall, 2) if done else 0.0,
+        "end_to_end": summarize(list(latencies.values())),
+        "videos": {stem: round(latency, 3) for stem, latency in sorted(latencies.items())},
+        "stages": stage_stats(read_spans(workdir / "state" / "metrics" / "metrics.jsonl")),
+        "llm": {"requests": server.requests, "errors": server.errors},
+    }
+    if args.keep:
+        results["workdir"] = str(workdir)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_results(results):
+    """
+    Prints the results as aligned text tables.
+    """
+    e2e = results["end_to_end"]
+    print(f"\nCompleted {results['completed']}/{results['config']['count']} videos in {results['wall_seconds']:.1f}s "
+          f"({results['throughput_media_min_per_wall_min']} media min / wall min)"
+          + ("  [TIMED OUT]" if results["timed_out"] else ""))
+    if e2e["count"]:
+        print(f"End-to-end latency: mean {e2e['mean']:.2f}s, p50 {e2e['p50']:.2f}s, p95 {e2e['p95']:.2f}s, max {e2e['max']:.2f}s")
+    print(f"LLM stub: {results['llm']['requests']} requests, {results['llm']['errors']} errors injected")
+    print(f"\n{'stage':<14} {'count':>6} {'errors':>6} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'x realtime':>11}")
+    for name, s in results["stages"].items():
+        if not s["count"]:
+            print(f"{name:<14} {0:>6} {s['errors']:>6}")
+            continue
+        print(f"{name:<14} {s['count']:>6} {s['errors']:>6} {s['mean']:>8.2f} {s['p50']:>8.2f} {s['p95']:>8.2f} "
+              f"{s.get('realtime_x', ''):>11}")
+
+
+def print_comparison(results, baseline):
+    """
+    Prints the change of the headline numbers against an earlier result.
+    """
+    def change(new, old):
+        if not old:
+            return ""
+        return f"{(new - old) / old:+.1%}"
+
+    rows = [("throughput (media min/wall min)", results["throughput_media_min_per_wall_min"],
+             baseline.get("throughput_media_min_per_wall_min"))]
+    for key in ("p50", "p95"):
+        rows.append((f"end-to-end {key} s", results["end_to_end"].get(key), baseline.get("end_to_end", {}).get(key)))
+    for name, s in results["stages"].items():
+        old = baseline.get("stages", {}).get(name, {})
+        rows.append((f"{name} p50 s", s.get("p50"), old.get("p50")))
+    print(f"\n{'metric':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+    for label, new, old in rows:
+        if new is None:
+            continue
+        print(f"{label:<34} {old if old is not None else '-':>10} {new:>10} {change(new, old):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark with synthetic media and stubbed backends.")
+    parser.add_argument("--mode", choices=("watchers", "orchestrator"), default="watchers")
+    parser.add_argument("--count", type=int, default=3, help="Number of synthetic videos.")
+    parser.add_argument("--duration", type=int, default=300, help="Length of each video in seconds.")
+    parser.add_argument("--stagger", type=float, default=0.0, help="Seconds between dropping videos.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM seconds per request.")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Extra random stub latency (seconds).")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of stub requests that fail.")
+    parser.add_argument("--rpm", type=float, default=0, help="LLM requests per minute limit (0 = unlimited).")
+    parser.add_argument("--whisper-model", default="fake", help='Whisper model, or "fake" for the stand-in.')
+    parser.add_argument("--whisper-rtf", type=float, default=50, help="Fake transcriber speed (x realtime).")
+    parser.add_argument("--replicas", type=int, default=1,
+                        help="Copies of each watcher (or orchestrator), sharing the work through leases.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for stub latencies and errors.")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds to wait for all notes.")
+    parser.add_argument("--json", type=Path, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", type=Path, help="Earlier JSON result to compare against.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch folder (logs, outputs).")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    sys.exit(0 if not results["timed_out"] else 1)
+
+
+if __name__ == "__main__":
+    main()
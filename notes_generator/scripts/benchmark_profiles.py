@@ -0,0 +1,101 @@
+"""
+benchmark_profiles.py
+---------------------
+Compares the audio extraction profiles in converter.py on synthetic inputs.
+
+Generates Zoom-like .mp4 files (low-frame-rate test pattern video, AAC stereo audio) with
+ffmpeg's lavfi sources, extracts their audio with each profile, and reports encode time,
+output size and speed relative to real time. Nothing is written to the configured folders;
+everything happens in a temporary directory.
+
+Usage:
+    python benchmark_profiles.py [--durations 60,600] [--profiles mp3,speech,flac,copy] [--json results.json]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import ffmpeg
+
+from converter import PROFILES, extract_audio
+
+
+def make_synthetic_video(path, duration):
+    """
+    Writes a synthetic .mp4 of `duration` seconds: 320x240 test pattern at 5 fps with
+    a 44.1 kHz stereo AAC track (a tone mixed with low-level noise, so it isn't trivially compressible).
+    """
+    video = ffmpeg.input(f'testsrc=size=320x240:rate=5:duration={duration}', f='lavfi')
+    tone = ffmpeg.input(f'sine=frequency=220:sample_rate=44100:duration={duration}', f='lavfi')
+    noise = ffmpeg.input(f'anoisesrc=color=pink:amplitude=0.05:sample_rate=44100:duration={duration}', f='lavfi')
+    audio = ffmpeg.filter([tone, noise], 'amix', inputs=2)
+    (
+        ffmpeg
+        .output(video, audio, str(path), vcodec='libx264', preset='ultrafast',
+                acodec='aac', audio_bitrate='128k', ac=2)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return path
+
+
+def run_benchmark(durations, profiles):
+    """
+    Extracts audio from one synthetic input per duration with every profile.
+    Returns:
+        list: One result dict per (duration, profile).
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="notes_profiles_") as tmp:
+        tmp = Path(tmp)
+        for duration in durations:
+            source = make_synthetic_video(tmp / f"synthetic_{duration}s.mp4", duration)
+            for profile in profiles:
+                out_dir = tmp / profile
+                out_dir.mkdir(exist_ok=True)
+                start = time.perf_counter()
+                out_path = extract_audio(source, profile, output_dir=out_dir, quiet=True, reuse_duplicates=False)
+                elapsed = time.perf_counter() - start
+                results.append({
+                    "duration_s": duration,
+                    "profile": profile,
+                    "output": out_path.suffix,
+                    "encode_s": round(elapsed, 3),
+                    "size_bytes": out_path.stat().st_size,
+                    "realtime_x": round(duration / elapsed, 1) if elapsed else None,
+                })
+    return results
+
+
+def print_table(results):
+    """
+    Prints the results as an aligned text table.
+    """
+    print(f"\n{'duration':>9} {'profile':<8} {'output':<6} {'encode s':>9} {'size KiB':>9} {'x realtime':>11}")
+    for r in results:
+        print(f"{r['duration_s']:>8}s {r['profile']:<8} {r['output']:<6} {r['encode_s']:>9.2f} "
+              f"{r['size_bytes'] / 1024:>9.0f} {r['realtime_x']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio extraction profiles on synthetic inputs.")
+    parser.add_argument("--durations", default="60,600", help="Comma-separated input lengths in seconds.")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profiles to compare.")
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    durations = [int(d) for d in args.durations.split(",")]
+    profiles = args.profiles.split(",")
+    results = run_benchmark(durations, profiles)
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
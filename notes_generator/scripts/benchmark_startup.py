@@ -0,0 +1,278 @@
+"""
+benchmark_startup.py
+--------------------
+Measures what starting the pipeline's scripts costs, and what the warm worker pools save.
+
+1. Cold imports: for each script that used to be started once per file (converter.py,
+   transcriber.py, editor.py), the wall time of a fresh `python -c "import ..."` loading the
+   script and the third-party modules its jobs need, against a bare interpreter. The heaviest
+   top-level imports are taken from `python -X importtime`.
+2. Warm workers: for each stage's pool (warm_pool.py), the time until a newly started worker
+   answers its first job (including any initializer, e.g. loading the Whisper model), the
+   round trip of a job to a warm worker, and the latency per job with a fresh worker for
+   every job (WORKER_MAX_JOBS = 1). Each pool is measured in its own process, so each gets its
+   own fork server.
+3. Entry points: for each watcher and the orchestrator, the time from launch until it is
+   registered in the PID registry, and the time it takes to exit once STOP_PIPELINE is created.
+
+Everything runs against a scratch folder (the NOTES_* overrides in config.py), with the
+benchmark stand-in Whisper model. Scripts whose dependencies are not installed are reported
+as unavailable.
+
+Usage:
+    python benchmark_startup.py [--repeat 5] [--skip-watchers] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+# Scripts that were started once per file, and the pool stage that now runs their jobs
+JOB_SCRIPTS = {
+    "converter": "convert",
+    "transcriber": "transcribe",
+    "editor": "edit",
+}
+ENTRY_POINTS = ("video_watcher", "audio_watcher", "transcript_watcher", "orchestrator")
+
+
+def scratch_environment(workdir):
+    """
+    Returns the environment for the measured processes: every folder inside `workdir`, the
+    stand-in Whisper model and an LLM endpoint that is never called.
+    """
+    env = dict(os.environ)
+    env.update({
+        "NOTES_VIDEOS_DIR": str(workdir / "videos"),
+        "NOTES_AUDIO_DIR": str(workdir / "audio"),
+        "NOTES_TRANSCRIPTS_DIR": str(workdir / "transcripts"),
+        "NOTES_LOG_DIR": str(workdir / "logs"),
+        "NOTES_STATE_DIR": str(workdir / "state"),
+        "NOTES_WHISPER_MODEL": "fake",
+        "NOTES_LLM_HTTP_URL": "http://127.0.0.1:9",
+        "NOTES_GEMINI_CACHE": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def _run_python(code, env, flags=()):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *flags, "-c", code], env=env, cwd=str(SCRIPTS_DIR),
+                            capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+
+def _import_code(script):
+    """Code importing `script` after the third-party modules its stage preloads (skipping missing ones)."""
+    from warm_pool import STAGES
+    preload = STAGES[JOB_SCRIPTS[script]]["preload"] if script in JOB_SCRIPTS else ()
+    lines = [f"try:\n    import {name}\nexcept ImportError:\n    pass\n" for name in preload]
+    return "".join(lines) + f"import {script}\n"
+
+
+def heaviest_imports(stderr, count=3):
+    """
+    Parses `python -X importtime` output into the `count` top-level imports with the largest
+    cumulative time. Returns [(module, seconds)].
+    """
+    totals = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+        # Nested imports are indented under the module that imported them
+        if match and not match.group(2).startswith(" "):
+            totals.append((match.group(2), int(match.group(1)) / 1e6))
+    return sorted(totals, key=lambda t: t[1], reverse=True)[:count]
+
+
+def measure_imports(env, repeat):
+    """
+    Times cold imports of the per-file scripts. Returns one result dict per script, plus the
+    bare interpreter as "(interpreter)".
+    """
+    results = [{"script": "(interpreter)",
+                "import_s": round(statistics.median(_run_python("pass", env)[0] for _ in range(repeat)), 3)}]
+    for script in JOB_SCRIPTS:
+        code = _import_code(script)
+        elapsed, result = _run_python(code, env)
+        if result.returncode != 0:
+            error = (result.stderr.strip().splitlines() or ["exited with code %d" % result.returncode])[-1]
+            results.append({"script": script, "error": error})
+            continue
+        times = [elapsed] + [_run_python(code, env)[0] for _ in range(repeat - 1)]
+        _, profiled = _run_python(code, env, flags=("-X", "importtime"))
+        results.append({
+            "script": script,
+            "import_s": round(statistics.median(times), 3),
+            "heaviest": [(name, round(seconds, 3)) for name, seconds in heaviest_imports(profiled.stderr)],
+        })
+    return results
+
+
+def measure_pool(stage, repeat):
+    """
+    Measures one stage's warm pool in this process (run with --measure-pool).
+    Returns:
+        dict: ready_s, round_trip_ms and fresh_worker_s, or error.
+    """
+    from warm_pool import stage_pool
+    result = {"stage": stage}
+    pool = stage_pool(stage)
+    try:
+        start = time.perf_counter()
+        pool.start()
+        pool.ping().result()
+        result["ready_s"] = round(time.perf_counter() - start, 3)
+        round_trips = []
+        for _ in range(repeat * 10):
+            start = time.perf_counter()
+            pool.ping().result()
+            round_trips.append(time.perf_counter() - start)
+        result["round_trip_ms"] = round(statistics.median(round_trips) * 1000, 2)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    finally:
+        pool.shutdown()
+    fresh = stage_pool(stage, max_jobs=1)
+    try:
+        fresh.ping().result()
+        per_job = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fresh.ping().result()
+            per_job.append(time.perf_counter() - start)
+        result["fresh_worker_s"] = round(statistics.median(per_job), 3)
+    finally:
+        fresh.shutdown()
+    result["start_method"] = pool.start_method
+    return result
+
+
+def measure_pools(env, repeat):
+    """
+    Measures every stage's pool, each in a process of its own. Returns one result dict per stage.
+    """
+    results = []
+    for stage in JOB_SCRIPTS.values():
+        process = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--measure-pool", stage,
+                                  "--repeat", str(repeat)], env=env, cwd=str(SCRIPTS_DIR), capture_output=True, text=True)
+        lines = process.stdout.strip().splitlines()
+        try:
+            results.append(json.loads(lines[-1]))
+        except (IndexError, ValueError):
+            results.append({"stage": stage, "error": (process.stderr.strip().splitlines() or ["no result"])[-1]})
+    return results
+
+
+def measure_entry_point(script, env, workdir, timeout=60):
+    """
+    Starts one watcher (or the orchestrator), waits until it registers in the PID registry,
+    then creates STOP_PIPELINE and waits for it to exit.
+    Returns:
+        dict: ready_s and stop_s, or error.
+    """
+    state = workdir / "state"
+    stop_file = state / "STOP_PIPELINE"
+    stop_file.unlink(missing_ok=True)
+    pid_file = state / "run" / f"{script}.json"
+    pid_file.unlink(missing_ok=True)
+    log_path = workdir / "logs" / f"{script}.log"
+    with open(log_path, "w", encoding="utf-8") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, str(SCRIPTS_DIR / f"{script}.py")], stdout=log,
+                                   stderr=subprocess.STDOUT, env=env, cwd=str(SCRIPTS_DIR))
+        try:
+            while not pid_file.exists():
+                if process.poll() is not None:
+                    lines = log_path.read_text(encoding="utf-8", errors="ignore").strip().splitlines()
+                    return {"script": script, "error": (lines or [f"exited with code {process.returncode}"])[-1]}
+                if time.perf_counter() - start > timeout:
+                    return {"script": script, "error": "did not start in time"}
+                time.sleep(0.01)
+            ready = time.perf_counter() - start
+            stop_file.touch()
+            start = time.perf_counter()
+            process.wait(timeout=timeout)
+            return {"script": script, "ready_s": round(ready, 3), "stop_s": round(time.perf_counter() - start, 3)}
+        except subprocess.TimeoutExpired:
+            return {"script": script, "ready_s": round(ready, 3), "error": "did not stop in time"}
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+def print_tables(imports, pools, entry_points):
+    """
+    Prints the results as aligned text tables.
+    """
+    print(f"\nCold start per file (a fresh interpreter importing the script)")
+    print(f"{'script':<14} {'import s':>9}  heaviest imports (cumulative s)")
+    for r in imports:
+        if "error" in r:
+            print(f"{r['script']:<14} {'-':>9}  unavailable: {r['error']}")
+        else:
+            heaviest = ", ".join(f"{name} {seconds:.3f}" for name, seconds in r.get("heaviest", []))
+            print(f"{r['script']:<14} {r['import_s']:>9.3f}  {heaviest}")
+
+    print(f"\nWarm workers (warm_pool.py)")
+    print(f"{'stage':<11} {'method':<11} {'ready s':>8} {'job ms':>8} {'fresh worker/job s':>19}")
+    for r in pools:
+        if "error" in r:
+            print(f"{r['stage']:<11} unavailable: {r['error']}")
+        else:
+            print(f"{r['stage']:<11} {r['start_method']:<11} {r['ready_s']:>8.3f} {r['round_trip_ms']:>8.2f} "
+                  f"{r['fresh_worker_s']:>19.3f}")
+
+    if entry_points:
+        print(f"\nEntry points")
+        print(f"{'script':<19} {'ready s':>8} {'stop s':>7}")
+        for r in entry_points:
+            if "error" in r and "ready_s" not in r:
+                print(f"{r['script']:<19} unavailable: {r['error']}")
+            else:
+                stop = f"{r['stop_s']:>7.3f}" if "stop_s" in r else f"{'-':>7}  {r['error']}"
+                print(f"{r['script']:<19} {r['ready_s']:>8.3f} {stop}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark script import times and warm worker startup.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the median is reported).")
+    parser.add_argument("--skip-watchers", action="store_true", help="Don't measure the watchers and orchestrator.")
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file.")
+    parser.add_argument("--measure-pool", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_pool:
+        # Child process of measure_pools(): report one stage as a JSON line
+        print(json.dumps(measure_pool(args.measure_pool, args.repeat)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="notes_startup_") as tmp:
+        workdir = Path(tmp)
+        for name in ("videos", "audio", "transcripts", "logs", "state"):
+            (workdir / name).mkdir()
+        env = scratch_environment(workdir)
+        # warm_pool (for STAGES) reads config, which must see the scratch folders
+        os.environ.update(env)
+        imports = measure_imports(env, args.repeat)
+        pools = measure_pools(env, args.repeat)
+        entry_points = [] if args.skip_watchers else [measure_entry_point(s, env, workdir) for s in ENTRY_POINTS]
+    print_tables(imports, pools, entry_points)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"imports": imports, "pools": pools, "entry_points": entry_points}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
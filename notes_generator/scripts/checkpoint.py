@@ -0,0 +1,129 @@
+"""
+checkpoint.py
+-------------
+Per-transcript checkpoints for editor.py, at chunk granularity.
+
+Every formatted chunk, summary chunk and the polished summary is saved to
+CHECKPOINT_DIR/<transcript name>.json as soon as Gemini returns it. If editor.py dies
+part-way (an API error, STOP_PIPELINE, a crash), the next run for the same transcript only
+requests the chunks that are missing, then the polish step.
+
+Each saved result records a hash of the text it was produced from, and the checkpoint as a
+whole records a fingerprint of the model and prompts. A result is only reused if its input is
+unchanged, so editing the transcript (or changing how it is chunked) invalidates the affected
+chunks, and changing a prompt or the model discards the whole checkpoint. Because results are
+matched by content, the same checkpoint works whether the chunks come from the finished .txt
+or from a segment stream. The checkpoint is deleted once both notes are written.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from config import CHECKPOINT_DIR, FORMAT_PROMPT, SUMMARY_PROMPT
+
+# Result kinds stored in a checkpoint
+FORMAT = "format"
+SUMMARY = "summary"
+POLISH = "polish"
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def fingerprint(model_names, prompts=(FORMAT_PROMPT, SUMMARY_PROMPT)):
+    """
+    Hashes the settings every result in a checkpoint depends on: the models and the prompts.
+    """
+    return _hash(*model_names, *prompts)
+
+
+class EditorCheckpoint:
+    """
+    Chunk results for one transcript, written through to a JSON file.
+    Safe to update from several ChunkPool threads at once.
+    """
+
+    def __init__(self, transcript_path, fingerprint, checkpoint_dir=CHECKPOINT_DIR):
+        """
+        Args:
+            transcript_path (Path): The transcript being edited.
+            fingerprint (str): fingerprint() of the current models and prompts.
+            checkpoint_dir (Path): Folder holding the checkpoint files.
+        """
+        self.path = checkpoint_dir / (transcript_path.name + '.json')
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._results = {FORMAT: {}, SUMMARY: {}, POLISH: {}}
+        self._load()
+
+    def _load(self):
+        """
+        Reads an existing checkpoint if it was written with the current model and prompts.
+        """
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[checkpoint] Ignoring unreadable checkpoint {self.path.name}: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            print(f"[checkpoint] Prompts or model changed since {self.path.name} was written, starting over.")
+            return
+        for kind in self._results:
+            self._results[kind] = dict(data.get(kind, {}))
+        saved = len(self._results[FORMAT]) + len(self._results[SUMMARY])
+        if saved:
+            print(f"[checkpoint] Found {len(self._results[FORMAT])} formatted and "
+                  f"{len(self._results[SUMMARY])} summary chunks from an earlier run of {self.path.stem}.")
+
+    def get(self, kind, index, input_text):
+        """
+        Returns the saved result for (kind, index) if it was produced from `input_text`, else None.
+        """
+        with self._lock:
+            entry = self._results[kind].get(str(index))
+        if entry is not None and entry["input"] == _hash(input_text):
+            return entry["text"]
+        return None
+
+    def put(self, kind, index, input_text, text):
+        """
+        Saves one result and writes the checkpoint file (atomically, via a temporary file).
+        """
+        with self._lock:
+            self._results[kind][str(index)] = {"input": _hash(input_text), "text": text}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"fingerprint": self.fingerprint, **self._results}, f)
+            os.replace(tmp_path, self.path)
+        return text
+
+    def cached(self, kind, index, input_text, func, *args):
+        """
+        Returns the saved result for (kind, index, input_text), or calls func(*args) and saves its result.
+        """
+        saved = self.get(kind, index, input_text)
+        if saved is not None:
+            return saved
+        return self.put(kind, index, input_text, func(*args))
+
+    def remove(self):
+        """
+        Deletes the checkpoint file once the transcript is fully edited.
+        """
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
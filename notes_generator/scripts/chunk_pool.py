@@ -0,0 +1,57 @@
+"""
+chunk_pool.py
+-------------
+Bounded thread pool used by editor.py to send chunk requests in parallel.
+
+Gemini calls are network bound, so a small thread pool is enough to overlap them.
+The pool caps how many requests are in flight at once; the requests-per-minute and
+tokens-per-minute limits are applied to every call by gemini_api.py (rate_limit.py), shared
+with other processes. Results are returned as futures, so callers can collect them back in
+chunk order.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from config import EDITOR_MAX_CONCURRENCY
+
+
+class ChunkPool:
+    """
+    Thread pool with a concurrency cap.
+    Use as a context manager so worker threads are shut down when done.
+    """
+
+    def __init__(self, max_workers=EDITOR_MAX_CONCURRENCY):
+        """
+        Args:
+            max_workers (int): Maximum number of requests in flight at once.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk-pool")
+        self._futures = []
+
+    def submit(self, fn, *args):
+        """
+        Schedules fn(*args) on the pool.
+        Returns:
+            Future: The pending result.
+        """
+        future = self._executor.submit(fn, *args)
+        self._futures.append(future)
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Shuts down the worker threads. Pending requests are cancelled if wait is False.
+        """
+        if not wait:
+            for future in self._futures:
+                future.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # On error, don't keep sending the remaining chunks
+        self.shutdown(wait=exc_type is None)
+        return False
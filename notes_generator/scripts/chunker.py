@@ -0,0 +1,196 @@
+"""
+chunker.py
+----------
+Token-budget-aware transcript chunker used by editor.py.
+
+Fixed 500-line chunks vary wildly in size because Whisper's line lengths do: some chunks
+are tiny and waste a round trip (plus a resend of the ~2 KB FORMAT_PROMPT), others are big
+enough to get truncated output. Instead, the transcript is packed into chunks up to a token
+budget, breaking only between Whisper segments (lines, i.e. pauses) and preferring to break
+at the end of a sentence. Lines longer than the budget are split at sentences, then words.
+
+The default budget is derived from the model's context and output limits in config.py.
+Token counts are estimated (about 4 characters per token), which is close enough for
+budgeting and needs no API call.
+
+iter_chunks() does the same packing over a stream of lines, handing out each chunk as soon
+as it is full, so the editor can start on a transcript that is still being written.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+
+from config import (
+    MODEL_CONTEXT_TOKENS, MODEL_OUTPUT_TOKENS, FORMAT_OUTPUT_RATIO, CHUNK_SAFETY_FACTOR,
+    CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS, FORMAT_PROMPT,
+)
+
+# Rough characters per token for English text
+CHARS_PER_TOKEN = 4
+# Only move a break back to a sentence end if the chunk stays at least this full
+MIN_FILL_FOR_SENTENCE_BREAK = 0.7
+
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s*$')
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a text.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def default_budget(prompt=FORMAT_PROMPT):
+    """
+    Derives the chunk budget (input tokens) from the model limits:
+    the formatted output of a chunk has to fit in the output limit, and prompt + chunk
+    + output have to fit in the context window. CHUNK_TARGET_TOKENS overrides this.
+    """
+    if CHUNK_TARGET_TOKENS:
+        return CHUNK_TARGET_TOKENS
+    by_output = MODEL_OUTPUT_TOKENS / FORMAT_OUTPUT_RATIO
+    by_context = MODEL_CONTEXT_TOKENS - estimate_tokens(prompt) - MODEL_OUTPUT_TOKENS
+    return max(1, int(min(by_output, by_context) * CHUNK_SAFETY_FACTOR))
+
+
+@dataclass
+class ChunkStats:
+    """
+    Size statistics for a chunked transcript.
+    """
+    count: int
+    budget: int
+    total_tokens: int
+    min_tokens: int
+    mean_tokens: int
+    max_tokens: int
+    prompt_tokens: int
+
+    def describe(self):
+        """One-line summary for log output."""
+        return (f"{self.count} chunks (budget {self.budget} tokens): "
+                f"min {self.min_tokens} / mean {self.mean_tokens} / max {self.max_tokens} tokens, "
+                f"{self.total_tokens} transcript + {self.prompt_tokens} prompt tokens sent per pass")
+
+
+def _split_long_unit(unit, budget):
+    """
+    Splits a line that is over budget at sentence ends, then at spaces.
+    """
+    pieces = []
+    for sentence in _SENTENCE_SPLIT.split(unit):
+        if estimate_tokens(sentence) <= budget:
+            pieces.append(sentence)
+            continue
+        words, current = sentence.split(' '), []
+        for word in words:
+            if current and estimate_tokens(' '.join(current + [word])) > budget:
+                pieces.append(' '.join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(' '.join(current))
+    return [p if p.endswith('\n') else p + '\n' for p in pieces]
+
+
+def _line_units(line, budget):
+    """
+    Splits one transcript line into the smallest pieces a chunk may break between.
+    A line is normally one unit (a Whisper segment); blank lines are dropped.
+    """
+    if estimate_tokens(line) > budget:
+        return _split_long_unit(line.rstrip('\n'), budget)
+    if line.strip():
+        return [line]
+    return []
+
+
+def iter_chunks(lines, budget=None, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Packs transcript lines into chunks of at most `budget` tokens, yielding each chunk as soon
+    as it is complete. Lines are only read as far as needed, so `lines` can be a stream that is
+    still growing (segment_stream.follow_segments). The chunks are the same as chunk_transcript()'s.
+    Args:
+        lines (iterable): Transcript lines, with their trailing newlines.
+        budget (int): Token budget per chunk (default: default_budget()).
+        overlap_tokens (int): Tokens of trailing context repeated at the start of the next chunk.
+    Yields:
+        str: Chunk texts in transcript order.
+    """
+    budget = budget or default_budget()
+    lines = iter(lines)
+    units = []
+    exhausted = False
+    start = 0
+    while True:
+        end, size = start, 0
+        while True:
+            if end == len(units):
+                # Need more input to know where this chunk ends
+                if exhausted:
+                    break
+                try:
+                    units.extend(_line_units(next(lines), budget))
+                except StopIteration:
+                    exhausted = True
+                continue
+            if end == start or size + estimate_tokens(units[end]) <= budget:
+                size += estimate_tokens(units[end])
+                end += 1
+            else:
+                break
+        if start >= len(units):
+            return
+        if end < len(units):
+            # Prefer to end the chunk on a sentence boundary if that keeps it reasonably full
+            fill = size
+            for cut in range(end, start + 1, -1):
+                if _SENTENCE_END.search(units[cut - 1].rstrip()):
+                    if fill >= budget * MIN_FILL_FOR_SENTENCE_BREAK:
+                        end = cut
+                    break
+                fill -= estimate_tokens(units[cut - 1])
+        yield ''.join(units[start:end])
+        if end >= len(units):
+            return
+        # Start the next chunk a few units early to carry some context over
+        next_start, carried = end, 0
+        while overlap_tokens and next_start - 1 > start and carried + estimate_tokens(units[next_start - 1]) <= overlap_tokens:
+            next_start -= 1
+            carried += estimate_tokens(units[next_start])
+        # Drop units that no later chunk can include
+        del units[:next_start]
+        start = 0
+
+
+def chunk_transcript(text, budget=None, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Packs a transcript into chunks of at most `budget` tokens.
+    Args:
+        text (str): The raw transcript.
+        budget (int): Token budget per chunk (default: default_budget()).
+        overlap_tokens (int): Tokens of trailing context repeated at the start of the next chunk.
+    Returns:
+        list: Chunk texts in transcript order.
+    """
+    return list(iter_chunks(text.splitlines(keepends=True), budget, overlap_tokens))
+
+
+def chunk_stats(chunks, budget=None, prompt=FORMAT_PROMPT):
+    """
+    Computes size statistics for a list of chunks.
+    Returns:
+        ChunkStats: Count, token totals and the prompt overhead of one pass over the chunks.
+    """
+    sizes = [estimate_tokens(c) for c in chunks] or [0]
+    return ChunkStats(
+        count=len(chunks),
+        budget=budget or default_budget(),
+        total_tokens=sum(sizes),
+        min_tokens=min(sizes),
+        mean_tokens=round(sum(sizes) / len(sizes)),
+        max_tokens=max(sizes),
+        prompt_tokens=estimate_tokens(prompt) * len(chunks),
+    )
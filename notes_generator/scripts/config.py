@@ -2,26 +2,257 @@
 """
 Central configuration for all folder paths and settings used in the notes generator pipeline.
 Update these values to change locations globally.
+
+A few settings can also be overridden with NOTES_* environment variables (see _env below),
+so benchmark_pipeline.py can run the real scripts against a scratch folder without editing this file.
 """
+import os
 from pathlib import Path
 
+
+def _env(name, default, cast=str):
+    """Returns NOTES_<name> from the environment (converted with `cast`) if set, else `default`."""
+    value = os.environ.get("NOTES_" + name)
+    return cast(value) if value not in (None, "") else default
+
+# Folder for the pipeline's own state: ledger, metrics, PID registry and STOP_PIPELINE file
+STATE_DIR = _env("STATE_DIR", Path(__file__).resolve().parent.parent, Path)
+
 # Folder to watch for new .mp4 video files
-WATCHED_VIDEOS_DIR = Path(r"C:\Users\bhupi\Videos\Zoom_Trainings")
-# File to keep track of processed video files
+WATCHED_VIDEOS_DIR = _env("VIDEOS_DIR", Path(r"C:\Users\bhupi\Videos\Zoom_Trainings"), Path)
+# Legacy log of processed video files (imported into LEDGER_DB on first run)
 PROCESSED_VIDEOS_FILE = WATCHED_VIDEOS_DIR / "processed_videos.txt"
 
 # Folder to save .mp3 audio files
-AUDIO_DIR = Path(r"G:\Other computers\My Computer\Documents\Trainings_Audios")
-# File to keep track of processed audio files
+AUDIO_DIR = _env("AUDIO_DIR", Path(r"G:\Other computers\My Computer\Documents\Trainings_Audios"), Path)
+# Legacy log of processed audio files (imported into LEDGER_DB on first run)
 PROCESSED_AUDIO_FILE = AUDIO_DIR / "processed_audios.txt"
 
 # Folder to save transcript markdown files
-TRANSCRIPTS_DIR = Path(r"G:\Other computers\My Computer\Documents\Trainings_Transcripts")
-# File to keep track of processed transcript files
+TRANSCRIPTS_DIR = _env("TRANSCRIPTS_DIR", Path(r"G:\Other computers\My Computer\Documents\Trainings_Transcripts"), Path)
+# Legacy log of processed transcript files (imported into LEDGER_DB on first run)
 PROCESSED_TRANSCRIPTS_FILE = TRANSCRIPTS_DIR / "processed_transcripts.txt"
 
+# SQLite job ledger shared by all stages (replaces the processed_*.txt files above,
+# which are migrated into it automatically the first time each stage runs)
+LEDGER_DB = STATE_DIR / "pipeline_ledger.sqlite3"
+# Performance metrics (metrics.py): spans and counters from every stage are appended to
+# METRICS_FILE, and each process writes Prometheus textfiles to METRICS_DIR
+METRICS_ENABLED = True
+METRICS_DIR = STATE_DIR / "metrics"
+METRICS_FILE = METRICS_DIR / "metrics.jsonl"
+# Minimum seconds between rewrites of a process's Prometheus textfile
+METRICS_PROM_INTERVAL = 15
+# Records are buffered in memory and appended to METRICS_FILE at most this many seconds
+# later (sooner once METRICS_FLUSH_LINES are waiting, and at exit)
+METRICS_FLUSH_INTERVAL = 2
+METRICS_FLUSH_LINES = 500
+# Rolling window (minutes) for the dashboard's throughput, latency and error-rate panel
+METRICS_WINDOW_MINUTES = 60
+# Folder where running watchers register their PIDs (pid_registry.py), read by the dashboard
+PID_DIR = STATE_DIR / "run"
+
 # Log directory
-LOG_DIR = Path(r"G:\Other computers\My Computer\Documents\Personal_Projects\notes_generator\logs")
+LOG_DIR = _env("LOG_DIR", Path(r"G:\Other computers\My Computer\Documents\Personal_Projects\notes_generator\logs"), Path)
+
+# Creating this file tells every watcher to exit (like `stop_pipeline.py`, which uses the
+# control channels instead and only falls back to this file)
+STOP_FILE = STATE_DIR / "STOP_PIPELINE"
+# Each running process listens for stop/drain/pause/resume commands (control.py) on a Unix socket
+# in PID_DIR, or a named pipe on Windows; the secret clients must prove they know is kept here
+CONTROL_KEY_FILE = PID_DIR / "control.key"
+# Seconds a control client waits for a process to acknowledge a command
+CONTROL_TIMEOUT = _env("CONTROL_TIMEOUT", 5, float)
+
+# How watchers detect new files: "auto" (filesystem events via watchdog, falling back to
+# polling if events are unavailable or turn out to miss files), "events" or "polling"
+WATCH_BACKEND = "auto"
+# Seconds between directory scans when polling
+WATCH_POLL_INTERVAL = 5
+# A watched file counts as fully written once its size and modification time have not changed
+# for this many seconds (readiness.py); files an upstream stage marked complete go through at once
+READY_STABLE_SECONDS = _env("READY_STABLE_SECONDS", 10, float)
+# Seconds before re-checking a file that is stable but still locked by another program
+READY_LOCK_RECHECK_SECONDS = 5
+
+# Distributed workers (leases.py): turn on to run several copies of a watcher, on this machine or
+# on others that see the same folders; each job is then claimed through a lease file first
+DISTRIBUTED_WORKERS = _env("DISTRIBUTED", False, lambda v: v.lower() not in ("0", "false", "no"))
+# Name of this worker in lease files (None = <host>-<pid>)
+WORKER_ID = _env("WORKER_ID", None)
+# A lease not renewed for this many seconds is taken over by another worker; keep it well
+# above the sync delay of a shared cloud drive
+LEASE_TTL = _env("LEASE_TTL", 120, float)
+# Seconds between renewals of the leases a worker holds
+LEASE_HEARTBEAT = _env("LEASE_HEARTBEAT", 20, float)
+# Seconds between clear-outs of a lease folder: expired leases, and finished ones whose file is gone
+LEASE_PRUNE_INTERVAL = 3600
+
+# Content-hash deduplication (dedup.py): a renamed or re-downloaded copy of a recording reuses
+# the audio, transcript and notes made from the original instead of being processed again
+DEDUP_ENABLED = True
+# Blocks hashed for the fast fingerprint, and their size in bytes
+DEDUP_SAMPLE_BLOCKS = 8
+DEDUP_BLOCK_SIZE = 64 * 1024
+# Reused outputs at least this large are hard-linked, smaller ones (notes) copied
+DEDUP_LINK_MIN_BYTES = 1024 * 1024
+
+# Parallel video conversion in video_watcher.py (conversion_pool.py)
+# Conversions run at once and ffmpeg threads per conversion (None = derive from the CPU core count)
+CONVERT_WORKERS = None
+CONVERT_THREADS_PER_JOB = None
+# Hold back new conversions while this many audio files wait to be transcribed (None = no limit)
+CONVERT_MAX_PENDING_AUDIO = 8
+
+# Warm worker processes (warm_pool.py) that the watchers run converter, Whisper and editor jobs in
+# How workers are started: "forkserver", "spawn" or "fork" (None = forkserver where the OS has it, else spawn)
+WORKER_START_METHOD = _env("WORKER_START_METHOD", None)
+# Jobs a worker runs before it is replaced by a fresh one (None = no limit, 1 = a new process per file)
+WORKER_MAX_JOBS = _env("WORKER_MAX_JOBS", None, int)
+# Seconds a cancelled job's worker gets to exit before it is killed
+WORKER_KILL_TIMEOUT = 5
+
+# Backlog ordering (scheduler.py): shortest predicted job first, with aging
+SCHEDULER_ENABLED = True
+# Seconds of predicted run time a job gains in priority per second it waits (0 = pure shortest-first)
+SCHEDULER_AGING = 1.0
+# Seconds of work per unit (second of media for convert/transcribe, character for edit) used
+# until a stage has finished jobs to learn from, and how many recent jobs the rate is learned from
+SCHEDULER_DEFAULT_RATES = {
+    "convert": 0.05,
+    "transcribe": 0.5,
+    "edit": 0.002,
+}
+SCHEDULER_HISTORY = 50
+
+# Worker threads per stage when running the single-process orchestrator (orchestrator.py)
+ORCHESTRATOR_WORKERS = {
+    "convert": 1,
+    "transcribe": 1,
+    "edit": 2,
+}
+
+# Audio extraction profile used by converter.py:
+#   "auto"   - pick per file from an ffprobe of the input ("copy" for AAC/MP3 tracks, else "speech")
+#   "speech" - 16 kHz mono Opus at a low bitrate, enough for Whisper
+#   "flac"   - 16 kHz mono FLAC (lossless, larger)
+#   "copy"   - stream-copy the source audio track with no re-encode
+#   "mp3"    - full-quality libmp3lame (the original behaviour)
+AUDIO_PROFILE = "auto"
+# Audio file types the audio watcher picks up
+AUDIO_PATTERNS = ("*.mp3", "*.opus", "*.m4a", "*.flac")
+
+# Combined convert+transcribe mode for the orchestrator: decode each video's audio straight
+# to 16 kHz mono PCM and hand it to Whisper in memory, skipping the .mp3 encode and re-decode
+STREAMING_HANDOFF = False
+# In streaming mode, still write an .mp3 to AUDIO_DIR for archival (a second output of the same ffmpeg run)
+STREAMING_ARCHIVE_MP3 = True
+
+# Whisper model used by transcriber.py and the transcription worker
+# ("fake" = bench_fakes.FakeWhisper, a stand-in for benchmarks that needs no model download)
+WHISPER_MODEL = _env("WHISPER_MODEL", "tiny")
+# Segmented transcription for long recordings: split at silences and transcribe the pieces
+# in parallel across a process pool (CPU only; skipped when a CUDA GPU is available)
+TRANSCRIBE_SEGMENTED = True
+# Recordings at least this long (seconds) are transcribed in segments
+SEGMENTED_MIN_SECONDS = 20 * 60
+# Target and bounds for segment length (seconds)
+SEGMENT_TARGET_SECONDS = 7.5 * 60
+SEGMENT_MIN_SECONDS = 5 * 60
+SEGMENT_MAX_SECONDS = 10 * 60
+# Overlap added when no silence is found and a segment has to be cut mid-speech
+SEGMENT_OVERLAP_SECONDS = 2
+# Audio quieter than this (dBFS) counts as silence
+SILENCE_THRESHOLD_DB = -35
+# Worker processes and torch threads per worker (None = derive from the CPU core count)
+SEGMENT_WORKERS = None
+SEGMENT_THREADS_PER_WORKER = None
+# Seconds the transcription worker keeps an idle model loaded before freeing it (None = never unload)
+WHISPER_IDLE_TIMEOUT = 600
+
+# Stream transcript segments to the editor while transcription is still running: the
+# transcriber appends each finished piece to <stem>.segments.jsonl in TRANSCRIPTS_DIR and the
+# editor sends every chunk to Gemini as soon as it is full (segment_stream.py)
+STREAM_TRANSCRIPTS = False
+# While writing a stream, the transcriber touches it every STREAM_HEARTBEAT seconds, even when
+# a piece takes long; the editor gives up on a stream with no new segments or heartbeat for
+# STREAM_IDLE_TIMEOUT seconds (its transcriber died)
+STREAM_HEARTBEAT = 30
+STREAM_IDLE_TIMEOUT = 5 * 60
+# Seconds between checks for new segments
+STREAM_POLL_INTERVAL = 1
+
+# Concurrent chunk dispatch in editor.py
+# Send format/summary chunk requests in parallel (False = one request at a time)
+EDITOR_CONCURRENT = True
+# Maximum number of Gemini requests in flight at once
+EDITOR_MAX_CONCURRENCY = 4
+
+# Shared, adaptive rate limit for LLM requests (rate_limit.py), coordinated across processes
+# through RATE_LIMIT_DB so all editors together stay just under the quota
+# Gemini requests started per minute (None or 0 = no limit)
+GEMINI_REQUESTS_PER_MINUTE = _env("GEMINI_RPM", 15, float)
+# Gemini input tokens per minute (None or 0 = no limit)
+GEMINI_TOKENS_PER_MINUTE = _env("GEMINI_TPM", 250_000, float)
+RATE_LIMIT_DB = STATE_DIR / "rate_limit.sqlite3"
+# Requests may start up to this many seconds of quota ahead of an even spacing
+RATE_LIMIT_BURST_SECONDS = 4
+# A 429 halves the rate, down to this fraction of the quota...
+RATE_LIMIT_MIN_FACTOR = 0.1
+# ...and every successful request raises it again by this fraction of the quota
+RATE_LIMIT_RECOVERY = 0.05
+# Throttled (429) and transient (5xx, timeout, connection) LLM errors are retried this many
+# times, waiting an exponentially growing, jittered delay between attempts
+LLM_MAX_RETRIES = 6
+LLM_BACKOFF_BASE = 2
+LLM_BACKOFF_MAX = 120
+
+# LLM backend (llm_backend.py): "gemini", or "http" for a local endpoint speaking the JSON protocol
+# of the bench_fakes.py stand-in server. Defaults to "http" when LLM_HTTP_URL is set.
+LLM_HTTP_URL = _env("LLM_HTTP_URL", None)
+LLM_BACKEND = _env("LLM_BACKEND", "http" if LLM_HTTP_URL else "gemini")
+# Seconds before a single LLM request is abandoned
+LLM_TIMEOUT = 120
+# Model per call type: formatting chunks, summarizing chunks (and merging summaries), the final polish
+LLM_MODEL = _env("LLM_MODEL", "models/gemini-2.5-flash-lite")
+LLM_MODELS = {
+    "format": LLM_MODEL,
+    "summary": LLM_MODEL,
+    "polish": LLM_MODEL,
+}
+
+# On-disk cache of Gemini responses, keyed by a hash of model, prompt and chunk text
+GEMINI_CACHE_ENABLED = _env("GEMINI_CACHE", True, lambda v: v.lower() not in ("0", "false", "no"))
+# (NOTES_GEMINI_CACHE=0 turns it off; test and benchmark runs point NOTES_GEMINI_CACHE_FILE, or
+# NOTES_TRANSCRIPTS_DIR, at a scratch folder so they never write into the tree)
+GEMINI_CACHE_FILE = _env("GEMINI_CACHE_FILE", TRANSCRIPTS_DIR / ".gemini_cache.sqlite3", Path)
+# Least recently used entries are evicted once the cache grows past this size
+GEMINI_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Step 2 of editor.py merges the chunk summaries in a tree: parallel groups of SUMMARY_REDUCE_FAN_IN,
+# level by level, until they fit in one final polish call
+SUMMARY_REDUCE_FAN_IN = 4
+# Maximum merge requests in flight at once (None = EDITOR_MAX_CONCURRENCY)
+SUMMARY_REDUCE_CONCURRENCY = None
+# Summaries totalling at most this many tokens go straight to the final call (None = derive from the model limits)
+SUMMARY_REDUCE_MAX_TOKENS = None
+
+# Per-transcript checkpoints of finished chunk results, so an interrupted editor.py run
+# resumes where it stopped (checkpoint.py). Removed once both notes are written.
+CHECKPOINT_DIR = TRANSCRIPTS_DIR / ".checkpoints"
+
+# Token-budget chunking of transcripts (chunker.py)
+# Model limits the default chunk budget is derived from (gemini-2.5-flash-lite)
+MODEL_CONTEXT_TOKENS = 1_048_576
+MODEL_OUTPUT_TOKENS = 65_536
+# Formatted output is roughly this many times longer than its input chunk
+FORMAT_OUTPUT_RATIO = 1.5
+# Fraction of the theoretical maximum to actually use, to stay well clear of truncation
+CHUNK_SAFETY_FACTOR = 0.25
+# Fixed chunk budget in tokens (None = derive from the limits above)
+CHUNK_TARGET_TOKENS = None
+# Tokens of context repeated at the start of the next chunk (0 = no overlap)
+CHUNK_OVERLAP_TOKENS = 0
 
 # Prompts for Gemini API (editor.py)
 FORMAT_PROMPT = (
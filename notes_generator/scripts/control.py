@@ -0,0 +1,311 @@
+"""
+control.py
+----------
+Control channel of a running pipeline process: stop, drain, pause and resume commands, each
+acknowledged by the process.
+
+Every watcher (and the orchestrator) calls serve() on startup. It listens on a Unix socket in
+PID_DIR (a named pipe on Windows), and records the address in its PID registry entry
+(pid_registry.py), so stop_pipeline.py sends a command straight to the process instead of
+creating STOP_PIPELINE and scanning the process list. Clients prove they know the secret in
+CONTROL_KEY_FILE (multiprocessing's HMAC handshake), which is created on first use, readable by
+the current user only.
+
+Commands, and what the process does:
+    stop-now  Cancels the jobs in progress (their partial output is discarded, and they are
+              redone on the next start) and exits. Same as creating STOP_PIPELINE.
+    drain     Takes no new jobs, lets the jobs in progress finish, then exits.
+    pause     Takes no new jobs until resumed; jobs in progress carry on.
+    resume    Takes new jobs again.
+    status    Changes nothing.
+Each reply is a dict: {"ok", "name", "pid", "state", "in_flight", "message"}, with state one
+of "running", "paused", "draining" or "stopping".
+
+The process's loops don't poll: they wait on the Controller, which wakes them as soon as a
+command arrives.
+
+Usage:
+    control = serve("audio_watcher")          # in the watcher
+    send(record["control"], "drain")          # in a client, with a PID registry record
+"""
+
+import atexit
+import os
+import secrets
+import sys
+import tempfile
+import threading
+from multiprocessing.connection import Listener, Client, AuthenticationError, answer_challenge, deliver_challenge
+from pathlib import Path
+
+from config import PID_DIR, CONTROL_KEY_FILE, CONTROL_TIMEOUT
+import pid_registry
+
+RUNNING, PAUSED, DRAINING, STOPPING = "running", "paused", "draining", "stopping"
+COMMANDS = ("stop-now", "drain", "pause", "resume", "status")
+# Longest usable AF_UNIX socket path (108 bytes on Linux, 104 on macOS, including the terminator)
+_MAX_SOCKET_PATH = 100
+
+
+class ControlError(Exception):
+    """
+    A process could not be reached on its control channel, or did not acknowledge a command.
+    """
+
+
+def _authkey(path=CONTROL_KEY_FILE):
+    """
+    Returns the shared secret, creating it if no process has yet. Several processes starting at
+    once all end up with the same key: it is linked into place, which fails if it already exists.
+    """
+    path = Path(path)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_hex(32).encode())
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        tmp_path.unlink()
+    return path.read_bytes()
+
+
+def _address(pid_dir=PID_DIR):
+    """
+    Returns (family, address) for this process's listener.
+    """
+    if sys.platform == "win32":
+        return "AF_PIPE", rf"\\.\pipe\notes_pipeline-{os.getpid()}"
+    Path(pid_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(pid_dir) / f"control-{os.getpid()}.sock"
+    if len(str(path)) > _MAX_SOCKET_PATH:
+        path = Path(tempfile.gettempdir()) / f"notes_pipeline-{os.getpid()}.sock"
+    # Left behind by a crashed process that had the same PID
+    path.unlink(missing_ok=True)
+    return "AF_UNIX", str(path)
+
+
+class Controller:
+    """
+    State of one process as set by control commands ("running", "paused", "draining" or
+    "stopping"), and the waits its loops use to follow it.
+    """
+
+    def __init__(self, name, in_flight=None):
+        """
+        Args:
+            name (str): Process name, e.g. "video_watcher".
+            in_flight (callable): Returns the number of jobs in progress, for replies (optional).
+        """
+        self.name = name
+        self.in_flight = in_flight
+        self.state = RUNNING
+        self.address = None
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._listener = None
+        self._authkey = None
+        self._closed = False
+
+    @property
+    def accepting(self):
+        """True while new jobs may be started (possibly after a pause)."""
+        return self.state in (RUNNING, PAUSED)
+
+    @property
+    def stopping(self):
+        """True once stop-now was requested."""
+        return self.state == STOPPING
+
+    def subscribe(self, callback):
+        """
+        Calls callback(state) after every state change, e.g. to wake a thread blocked elsewhere.
+        """
+        self._listeners.append(callback)
+
+    def request(self, command):
+        """
+        Applies a command.
+        Returns:
+            dict: The acknowledgement (see the module docstring).
+        """
+        with self._cond:
+            before = self.state
+            ok, message = True, ""
+            if command == "stop-now":
+                self.state = STOPPING
+            elif command == "drain":
+                if self.state == STOPPING:
+                    ok, message = False, "already stopping"
+                else:
+                    self.state = DRAINING
+            elif command == "pause":
+                if self.state == RUNNING:
+                    self.state = PAUSED
+                elif self.state != PAUSED:
+                    ok, message = False, f"already {self.state}"
+            elif command == "resume":
+                if self.state == PAUSED:
+                    self.state = RUNNING
+                elif self.state != RUNNING:
+                    ok, message = False, f"already {self.state}"
+            elif command != "status":
+                ok, message = False, f"unknown command {command!r}"
+            changed = self.state != before
+            if changed:
+                print(f"[{self.name}] Control: {command} ({before} -> {self.state}).")
+            self._cond.notify_all()
+        if changed:
+            for callback in list(self._listeners):
+                try:
+                    callback(self.state)
+                except Exception as e:
+                    print(f"[control] Error notifying a listener of {self.state}: {e}")
+        reply = {"ok": ok, "name": self.name, "pid": os.getpid(), "state": self.state, "message": message}
+        if self.in_flight is not None:
+            try:
+                reply["in_flight"] = self.in_flight()
+            except Exception:
+                pass
+        return reply
+
+    def wait_until_runnable(self):
+        """
+        Blocks while paused.
+        Returns:
+            bool: True to go on with the next job, False if the process is draining or stopping.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.state != PAUSED)
+            return self.state == RUNNING
+
+    def wait_for(self, future):
+        """
+        Waits for a job's future, unless stop-now is requested first (drain lets it finish).
+        Returns:
+            bool: True if the job finished, False if the process is stopping.
+        """
+        def wake(_):
+            with self._cond:
+                self._cond.notify_all()
+
+        future.add_done_callback(wake)
+        with self._cond:
+            self._cond.wait_for(lambda: future.done() or self.state == STOPPING)
+        return future.done()
+
+    def serve(self, pid_dir=PID_DIR):
+        """
+        Starts listening for commands. Returns the address clients connect to.
+        """
+        family, address = _address(pid_dir)
+        # No authkey on the Listener: its accept() would run the handshake on the accept thread,
+        # where one client that connects and stalls would block every other
+        self._listener = Listener(address, family=family)
+        self._authkey = _authkey()
+        self.address = address
+        thread = threading.Thread(target=self._serve_loop, args=(self._listener,), name="control", daemon=True)
+        thread.start()
+        atexit.register(self.close)
+        return address
+
+    def _serve_loop(self, listener):
+        while not self._closed:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                if self._closed:
+                    return
+                print(f"[control] Could not accept a control connection: {e}")
+                continue
+            thread = threading.Thread(target=self._handle, args=(conn,), name="control-connection", daemon=True)
+            thread.start()
+
+    def _handle(self, conn):
+        """
+        Authenticates one connection and answers its command. Runs in a thread of its own, so a
+        client that stalls only ties up this thread.
+        """
+        try:
+            with conn:
+                deliver_challenge(conn, self._authkey)
+                answer_challenge(conn, self._authkey)
+                if not conn.poll(CONTROL_TIMEOUT):
+                    return
+                message = conn.recv()
+                command = message.get("command") if isinstance(message, dict) else message
+                conn.send(self.request(command))
+        except AuthenticationError as e:
+            print(f"[control] Rejected a control connection: {e}")
+        except (OSError, EOFError) as e:
+            print(f"[control] Control connection failed: {e}")
+
+    def close(self):
+        """
+        Stops listening and removes the socket.
+        """
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+
+def serve(name, in_flight=None, pid_dir=PID_DIR):
+    """
+    Starts the control channel of the current process and registers the process under `name`
+    in the PID registry, with the channel's address.
+    Args:
+        name (str): Process name, e.g. "video_watcher".
+        in_flight (callable): Returns the number of jobs in progress (optional).
+    Returns:
+        Controller: The process's controller.
+    """
+    controller = Controller(name, in_flight)
+    try:
+        address = controller.serve(pid_dir)
+    except OSError as e:
+        # Still registered, so it can be found and stopped with STOP_PIPELINE
+        print(f"[control] Could not open a control channel ({e}); only STOP_PIPELINE will stop this process.")
+        address = None
+    pid_registry.register(name, pid_dir, control=address)
+    return controller
+
+
+def send(address, command, timeout=CONTROL_TIMEOUT):
+    """
+    Sends a command to the process listening on `address` and returns its acknowledgement.
+    Raises:
+        ControlError: If the process can't be reached or does not answer within `timeout` seconds.
+    """
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown control command {command!r}; expected one of {', '.join(COMMANDS)}")
+    family = "AF_PIPE" if address.startswith("\\\\") else "AF_UNIX"
+    authkey = _authkey()
+    result = {}
+
+    def exchange():
+        try:
+            with Client(address, family=family, authkey=authkey) as conn:
+                conn.send({"command": command})
+                if conn.poll(timeout):
+                    result["reply"] = conn.recv()
+        except (OSError, EOFError, AuthenticationError) as e:
+            result["error"] = e
+
+    # Connecting and the handshake have no timeout of their own and hang on a stopped or wedged
+    # process, so the whole exchange runs against one deadline (a thread left hanging is a daemon)
+    thread = threading.Thread(target=exchange, name="control-send", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if "reply" in result:
+        return result["reply"]
+    if "error" in result:
+        raise ControlError(str(result["error"])) from result["error"]
+    raise ControlError(f"no acknowledgement within {timeout}s")
@@ -0,0 +1,223 @@
+"""
+conversion_pool.py
+------------------
+Runs several conversions at once for video_watcher.py.
+
+When many recordings arrive together (e.g. a week of trainings syncing in), converting them
+one after another leaves most cores idle. The pool runs up to CONVERT_WORKERS conversions in
+parallel, each limited to CONVERT_THREADS_PER_JOB ffmpeg threads, so workers x threads fits the
+CPU. Conversions are converter.extract_audio() calls in warm worker processes (warm_pool.py),
+started with the watcher, so a video doesn't wait for a fresh Python to import ffmpeg-python and
+numpy. One thread per job waits on its result, instead of polling it.
+
+Backpressure: a conversion only starts while fewer than CONVERT_MAX_PENDING_AUDIO audio files
+(counting conversions in progress) are waiting to be transcribed. submit() blocks until there
+is room, so the remaining videos stay queued in the watcher instead of flooding the audio stage.
+
+cancel_all() terminates every running conversion, ffmpeg included, when the pipeline is stopped. Cancelled
+videos go back to "queued" in the job ledger and their partial output is deleted, so they are
+converted again on the next start (their lease, with DISTRIBUTED_WORKERS, is released so another
+worker can take them). When the process is drained instead (control.py), drain() first lets the
+conversions in progress finish, so no partial work is thrown away.
+"""
+
+import os
+import threading
+from concurrent.futures import CancelledError
+
+from config import (
+    AUDIO_DIR, AUDIO_PATTERNS, STOP_FILE, CONVERT_WORKERS, CONVERT_THREADS_PER_JOB, CONVERT_MAX_PENDING_AUDIO,
+)
+from control import DRAINING
+from converter import remove_partial
+from job_ledger import JobLedger, DONE, FAILED
+from warm_pool import stage_pool, JobCancelled
+
+# Seconds between checks of the audio backlog while submit() waits
+_WAIT_INTERVAL = 2
+
+
+def pool_settings(workers=CONVERT_WORKERS, threads=CONVERT_THREADS_PER_JOB):
+    """
+    Picks the number of parallel conversions and ffmpeg threads per conversion so
+    workers x threads fits the CPU.
+    Returns:
+        tuple: (workers, threads_per_job)
+    """
+    cores = os.cpu_count() or 1
+    # Audio extraction barely scales past a couple of threads, so prefer more parallel jobs
+    workers = workers or max(1, min(8, cores // 2))
+    threads = threads or max(1, cores // workers)
+    return workers, threads
+
+
+class ConversionPool:
+    """
+    Bounded set of conversions running in warm worker processes, recorded in the convert ledger.
+    Use as a context manager: leaving the block cancels whatever is still running.
+    """
+
+    def __init__(self, ledger, workers=CONVERT_WORKERS, threads=CONVERT_THREADS_PER_JOB,
+                 max_pending_audio=CONVERT_MAX_PENDING_AUDIO, stop_file=STOP_FILE, control=None):
+        """
+        Args:
+            ledger (JobLedger): The "convert" ledger.
+            workers (int): Conversions run at once (None = from the core count).
+            threads (int): ffmpeg threads per conversion (None = from the core count).
+            max_pending_audio (int): Audio backlog at which new conversions wait (None = no limit).
+            stop_file (Path): submit() gives up waiting once this file exists.
+            control (control.Controller): The process's controller; submit() gives up waiting as
+                soon as it drains or stops.
+        """
+        self.ledger = ledger
+        self.workers, self.threads = pool_settings(workers, threads)
+        self.max_pending_audio = max_pending_audio
+        self.stop_file = stop_file
+        self.control = control
+        self._transcribe_ledger = JobLedger("transcribe") if max_pending_audio else None
+        self._cond = threading.Condition()
+        # Video path -> future of its conversion (None until it has been submitted)
+        self._running = {}
+        self._threads = []
+        self._cancelled = False
+        if control is not None:
+            control.subscribe(self._on_control)
+        # One warm worker per slot, started now so the first video doesn't wait for the imports
+        self._processes = stage_pool("convert", workers=self.workers)
+        self._processes.start()
+        print(f"[video_watcher] Converting up to {self.workers} videos at once, {self.threads} ffmpeg threads each.")
+
+    def __contains__(self, path):
+        with self._cond:
+            return path in self._running
+
+    def __len__(self):
+        """Number of conversions in progress."""
+        with self._cond:
+            return len(self._running)
+
+    def pending_audio(self):
+        """
+        Number of audio files not yet transcribed, plus the conversions in progress.
+        """
+        waiting = sum(1 for pattern in AUDIO_PATTERNS for path in AUDIO_DIR.glob(pattern)
+                      if not self._transcribe_ledger.is_processed(path))
+        return waiting + len(self._running)
+
+    def _on_control(self, state):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _stopping(self):
+        if self._cancelled or self.stop_file.exists():
+            return True
+        return self.control is not None and not self.control.accepting
+
+    def _has_room(self):
+        if len(self._running) >= self.workers:
+            return False
+        return not self.max_pending_audio or self.pending_audio() < self.max_pending_audio
+
+    def wait_for_room(self, video_path):
+        """
+        Blocks until a slot is free and the audio backlog allows another conversion.
+        Returns:
+            bool: True once there is room, False if the pipeline is stopping or draining.
+        """
+        held_back = False
+        with self._cond:
+            while not self._has_room():
+                if self._stopping():
+                    return False
+                if not held_back and len(self._running) < self.workers:
+                    print(f"[video_watcher] {self.max_pending_audio} or more audio files are waiting for "
+                          f"transcription; holding back {video_path.name}.")
+                    held_back = True
+                self._cond.wait(timeout=_WAIT_INTERVAL)
+            return not self._stopping()
+
+    def submit(self, video_path, lease=None):
+        """
+        Starts converting `video_path` once a slot is free and the audio backlog allows it.
+        Args:
+            video_path (Path): The video.
+            lease (leases.Lease): This worker's claim on the video, released when the conversion ends.
+        Returns:
+            bool: True if the conversion was started, False if the pipeline is stopping.
+        """
+        if not self.wait_for_room(video_path):
+            return False
+        with self._cond:
+            self.ledger.mark_started(video_path)
+            self._running[video_path] = None
+        thread = threading.Thread(target=self._run, args=(video_path, lease), name=f"convert-{video_path.stem}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+        return True
+
+    def _run(self, video_path, lease):
+        """
+        Converts one video in a worker process and records the outcome in the ledger.
+        """
+        error = None
+        with self._cond:
+            # Once cancel_all() has begun, the workers are shutting down
+            cancelled = self._cancelled
+            if not cancelled:
+                future = self._running[video_path] = self._processes.submit(
+                    "extract_audio", video_path, threads=self.threads)
+        try:
+            if not cancelled:
+                future.result()
+        except (JobCancelled, CancelledError):
+            cancelled = True
+        except Exception as e:
+            error = e
+        with self._cond:
+            del self._running[video_path]
+            self._cond.notify_all()
+        if cancelled:
+            remove_partial(video_path)
+            self.ledger.mark_queued(video_path)
+            print(f"[video_watcher] Cancelled the conversion of {video_path.name}; it will be converted on the next start.")
+            state = None
+        elif error is not None:
+            print(f"[video_watcher] Error converting {video_path}: {error}")
+            self.ledger.mark_failed(video_path, error)
+            state = FAILED
+        else:
+            self.ledger.mark_done(video_path)
+            state = DONE
+        if lease is not None:
+            lease.release(state)
+
+    def drain(self):
+        """
+        Waits for the conversions in progress to finish while the process is draining. Returns
+        at once otherwise, or as soon as stop-now is requested; cancel_all() then ends them.
+        """
+        with self._cond:
+            while self._running and self.control is not None and self.control.state == DRAINING:
+                self._cond.wait()
+
+    def cancel_all(self):
+        """
+        Terminates every running conversion (killing workers that don't exit within
+        WORKER_KILL_TIMEOUT seconds), waits for the job threads and stops the workers.
+        """
+        with self._cond:
+            self._cancelled = True
+            running = len(self._running)
+            self._cond.notify_all()
+        if running:
+            print(f"[video_watcher] Stop requested during processing. Terminating {running} conversion(s).")
+        self._processes.shutdown(cancel_queued=True, cancel_running=True)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cancel_all()
+        return False
@@ -3,28 +3,70 @@
 """
 converter.py
 ------------
-Converts .mp4 files in the watched folder to .mp3 audio using ffmpeg-python.
-
-This script is called by video_watcher.py when a new .mp4 file is detected.
-It uses ffmpeg-python to extract audio and save it as .mp3 in the audio folder.
+Extracts the audio of .mp4 files in the watched folder using ffmpeg-python.
+
+video_watcher.py runs extract_audio() in a warm worker process (conversion_pool.py, warm_pool.py)
+when a new .mp4 file is detected; it can also be run on its own for a single file.
+It uses ffmpeg-python to extract audio into the audio folder with one of the
+extraction profiles below (AUDIO_PROFILE in config.py). With "auto", the input is
+probed with ffprobe: an AAC or MP3 track is stream-copied with no re-encode, anything
+else is encoded with the low-bitrate "speech" profile, which is all Whisper needs.
+
+ffmpeg writes into a .converting folder inside the audio folder and the file is moved into
+place only once it is complete, so the audio watcher never picks up a half-written file
+(e.g. when a conversion is cancelled on STOP_PIPELINE). The finished file is then marked
+complete (readiness.py), so the audio watcher starts on it without waiting for it to settle.
 """
 
 
 # Standard library imports
+import argparse  # For command-line argument handling
 from pathlib import Path  # For platform-independent file paths
-import sys  # For command-line argument handling
+import sys
+import threading
 
-# Third-party import
+# Third-party imports
 import ffmpeg  # ffmpeg-python package
+import numpy as np
 
 
 
 
 # Import folder paths from config
-from config import WATCHED_VIDEOS_DIR, AUDIO_DIR
+from config import WATCHED_VIDEOS_DIR, AUDIO_DIR, AUDIO_PROFILE
+import dedup
+from media_probe import probe_audio
+import metrics
+from readiness import move_into_place
 # Ensure the audio output directory exists
 AUDIO_DIR.mkdir(exist_ok=True)
 
+# Folder (inside the output folder) that conversions in progress are written to
+PARTIAL_DIR_NAME = ".converting"
+
+# Whisper works on 16 kHz mono audio
+WHISPER_SAMPLE_RATE = 16000
+# Bytes read from ffmpeg's PCM pipe at a time
+_PCM_READ_BYTES = 1024 * 1024
+
+# Extraction profiles: output extension and ffmpeg output options
+PROFILES = {
+    "mp3": {"ext": ".mp3", "options": {"acodec": "libmp3lame"}},
+    "speech": {"ext": ".opus", "options": {
+        # compression_level 0 roughly halves encode time for a negligible size increase
+        "acodec": "libopus", "ac": 1, "ar": WHISPER_SAMPLE_RATE, "audio_bitrate": "24k", "application": "voip",
+        "compression_level": 0,
+    }},
+    "flac": {"ext": ".flac", "options": {"acodec": "flac", "ac": 1, "ar": WHISPER_SAMPLE_RATE}},
+    "copy": {"ext": None, "options": {"acodec": "copy"}},
+}
+
+# Source codecs that can be stream-copied, and the container extension to copy them into
+COPY_EXTENSIONS = {
+    "aac": ".m4a",
+    "mp3": ".mp3",
+}
+
 
 
 def convert_to_mp3(mp4_path):
@@ -58,15 +100,146 @@ def convert_to_mp3(mp4_path):
     return mp3_path
 
 
+def choose_profile(audio_stream):
+    """
+    Picks an extraction profile for an input from its probed audio stream.
+    Returns:
+        str: "copy" if the track can be stream-copied, otherwise "speech".
+    """
+    if audio_stream is not None and audio_stream.get('codec_name') in COPY_EXTENSIONS:
+        return "copy"
+    return "speech"
+
+
+def extract_audio(media_path, profile=AUDIO_PROFILE, output_dir=AUDIO_DIR, quiet=False, threads=None,
+                  reuse_duplicates=True):
+    """
+    Extracts the audio track of a media file using an extraction profile.
+    The conversion is recorded as a "convert" span (metrics.py). If an identical copy of the
+    file was converted before with the same profile, its audio is reused instead (dedup.py).
+    Args:
+        media_path (Path): Path to the input video.
+        profile (str): "auto" or one of PROFILES.
+        output_dir (Path): Folder to write the audio file to.
+        quiet (bool): Hide ffmpeg's own output.
+        threads (int): ffmpeg -threads for decoding and encoding (None = ffmpeg's default).
+        reuse_duplicates (bool): Check for (and record results for) identical copies.
+    Returns:
+        Path: Path to the created audio file.
+    """
+    if reuse_duplicates:
+        reused = dedup.reuse("convert", media_path, profile, output_dir)
+        if reused:
+            return reused[0]
+    with metrics.span("convert", file=media_path.name, threads=threads) as span:
+        out_path = _extract_audio(media_path, profile, output_dir, quiet, threads, span)
+        span["output_bytes"] = out_path.stat().st_size
+    if reuse_duplicates:
+        dedup.remember("convert", media_path, [out_path], profile)
+    return out_path
+
+
+def remove_partial(media_path, output_dir=AUDIO_DIR):
+    """
+    Deletes what an interrupted conversion of `media_path` left in the .converting folder.
+    """
+    for path in (output_dir / PARTIAL_DIR_NAME).glob(media_path.stem + ".*"):
+        try:
+            path.unlink()
+        except OSError as e:
+            print(f"Could not remove partial output {path.name}: {e}")
+
+
+def _extract_audio(media_path, profile, output_dir, quiet, threads, span):
+    audio_stream = None
+    if profile in ("auto", "copy"):
+        try:
+            audio_stream = probe_audio(media_path)
+        except (ffmpeg.Error, OSError) as e:
+            # OSError: ffprobe is not installed
+            print(f"ffprobe error: {e}")
+        if profile == "auto":
+            profile = choose_profile(audio_stream)
+        if audio_stream is not None and audio_stream.get('duration'):
+            span["media_seconds"] = float(audio_stream['duration'])
+    if profile == "copy":
+        ext = COPY_EXTENSIONS.get((audio_stream or {}).get('codec_name'))
+        if ext is None:
+            print(f"Cannot stream-copy the audio of {media_path.name}; using the speech profile instead.")
+            profile = "speech"
+    if profile != "copy":
+        ext = PROFILES[profile]["ext"]
+    out_path = output_dir / (media_path.stem + ext)
+    partial_path = output_dir / PARTIAL_DIR_NAME / out_path.name
+    partial_path.parent.mkdir(exist_ok=True)
+    thread_options = {"threads": threads} if threads else {}
+    span["profile"] = profile
+    try:
+        (
+            ffmpeg
+            .input(str(media_path), **thread_options)
+            .output(str(partial_path), vn=None, **PROFILES[profile]["options"], **thread_options)
+            .overwrite_output()
+            .run(quiet=quiet)
+        )
+        move_into_place(partial_path, out_path)
+        print(f"Extracted audio of {media_path.name} to {out_path.name} ({profile} profile)")
+    except ffmpeg.Error as e:
+        print(f"ffmpeg error: {e}")
+        if profile == "copy":
+            # The container refused the copied track; re-encode instead
+            print(f"Stream copy failed for {media_path.name}; retrying with the speech profile.")
+            return _extract_audio(media_path, "speech", output_dir, quiet, threads, span)
+        raise
+    return out_path
+
+
+def decode_audio_pcm(media_path, sample_rate=WHISPER_SAMPLE_RATE, archive_path=None):
+    """
+    Decodes the audio track of a video (or audio) file straight to mono PCM over a pipe,
+    reading the pipe block by block as ffmpeg produces it.
+    Args:
+        media_path (Path): Path to the input media file.
+        sample_rate (int): Output sample rate in Hz.
+        archive_path (Path): Also encode the audio to .mp3 here, as a second output of the same
+            ffmpeg run, so the video is decoded once for both (None = write nothing to disk).
+    Returns:
+        numpy.ndarray: float32 samples in [-1, 1], the format Whisper's transcribe() accepts.
+    """
+    audio_in = ffmpeg.input(str(media_path)).audio
+    outputs = [audio_in.output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=sample_rate)]
+    if archive_path is not None:
+        outputs.append(audio_in.output(str(archive_path), **PROFILES["mp3"]["options"]))
+    with metrics.span("decode_pcm", file=media_path.name, archive=archive_path is not None) as span:
+        process = ffmpeg.merge_outputs(*outputs).overwrite_output().run_async(pipe_stdout=True, pipe_stderr=True)
+        # Drained alongside, or ffmpeg would stall once the stderr pipe fills up
+        stderr = []
+        drain = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        drain.start()
+        pcm = bytearray()
+        for block in iter(lambda: process.stdout.read(_PCM_READ_BYTES), b""):
+            pcm += block
+        process.wait()
+        drain.join()
+        if process.returncode != 0:
+            error = ffmpeg.Error("ffmpeg", None, stderr[0] if stderr else b"")
+            print(f"ffmpeg error: {error.stderr.decode(errors='ignore')}")
+            raise error
+        audio = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        span["media_seconds"] = len(audio) / sample_rate
+    print(f"Decoded {media_path.name} to {len(audio) / sample_rate:.0f}s of {sample_rate} Hz mono PCM")
+    return audio
+
+
 
 # Entry point for the script
 if __name__ == "__main__":
     # Entry point: expects a .mp4 file path as argument
-    if len(sys.argv) < 2:
-        print("Usage: python converter.py <video_file.mp4>")
-        sys.exit(1)
-    mp4_file = Path(sys.argv[1])
-    if not mp4_file.exists():
-        print(f"File not found: {mp4_file}")
+    parser = argparse.ArgumentParser(description="Extract the audio of a video into the audio folder.")
+    parser.add_argument("video", type=Path, help="Video file (.mp4)")
+    parser.add_argument("--threads", type=int, default=None, help="ffmpeg threads for this conversion")
+    args = parser.parse_args()
+    if not args.video.exists():
+        print(f"File not found: {args.video}")
         sys.exit(1)
-    convert_to_mp3(mp4_file)
+    extract_audio(args.video, threads=args.threads)
@@ -0,0 +1,289 @@
+"""
+dedup.py
+--------
+Content-hash deduplication for every pipeline stage.
+
+The job ledger keys on paths, so a renamed or re-downloaded copy of a recording (which Drive
+sync produces all the time) would otherwise go through ffmpeg, Whisper and Gemini again.
+Instead, each stage fingerprints its input and, if an identical input already went through the
+same stage with the same settings, links (or copies) the earlier outputs under the new name.
+
+Fingerprints:
+    - fast: a hash of the file size and DEDUP_SAMPLE_BLOCKS blocks spread evenly over the file
+      (the whole file if it is small). Cheap enough to compute for every new file.
+    - full: a hash of the whole file, only computed when a fast hash matches an earlier input,
+      for both files, to confirm the match.
+Both are cached in the ledger database by (path, size, mtime), so a file is read at most once.
+Recording a stage's results only needs the fast hash, so a file that is never duplicated is
+never read whole.
+
+Results are stored per (stage, variant, input path); the variant names the settings the output
+depends on (audio profile, Whisper model, prompts/models fingerprint), so changing a setting
+does not reuse outputs made with the old one.
+Outputs of DEDUP_LINK_MIN_BYTES or more are hard-linked (falling back to a copy across
+drives); smaller ones, such as the notes, are copied so editing one does not change its twin.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import LEDGER_DB, DEDUP_ENABLED, DEDUP_SAMPLE_BLOCKS, DEDUP_BLOCK_SIZE, DEDUP_LINK_MIN_BYTES
+from job_ledger import path_key
+from readiness import move_into_place
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fast TEXT NOT NULL,
+    full TEXT
+);
+CREATE TABLE IF NOT EXISTS dedup_outputs (
+    stage TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    fast_hash TEXT NOT NULL,
+    full_hash TEXT,
+    outputs TEXT NOT NULL,
+    recorded_at REAL,
+    PRIMARY KEY (stage, variant, input_path)
+);
+CREATE INDEX IF NOT EXISTS dedup_outputs_fast ON dedup_outputs (stage, variant, fast_hash);
+"""
+
+_READ_SIZE = 1024 * 1024
+# Stages whose outputs a watcher picks up (audio_watcher, transcript_watcher), so reused ones get
+# a completion marker; the notes are not watched
+_WATCHED_OUTPUTS = ("convert", "transcribe")
+
+
+def fast_hash(path, blocks=DEDUP_SAMPLE_BLOCKS, block_size=DEDUP_BLOCK_SIZE):
+    """
+    Hashes the size of a file and `blocks` evenly spaced blocks of it (first and last included;
+    with a single block, just the first). Files no larger than the samples are hashed whole.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= max(blocks, 1) * block_size:
+            digest.update(f.read())
+        elif blocks <= 1:
+            digest.update(f.read(block_size))
+        else:
+            step = (size - block_size) / (blocks - 1)
+            for i in range(blocks):
+                f.seek(int(i * step))
+                digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """
+    Hashes the whole file.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, target, mark=False):
+    """
+    Puts a copy of `source` at `target`: a hard link for large files where possible, else a copy.
+    With `mark`, writes its completion marker (readiness.py) before it appears.
+    """
+    tmp_path = target.with_name(target.name + '.tmp')
+    if tmp_path.exists():
+        tmp_path.unlink()
+    if source.stat().st_size >= DEDUP_LINK_MIN_BYTES:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copy2(source, tmp_path)
+    else:
+        shutil.copy2(source, tmp_path)
+    if mark:
+        move_into_place(tmp_path, target)
+    else:
+        os.replace(tmp_path, target)
+
+
+class ContentIndex:
+    """
+    Fingerprint cache and stage results, stored next to the job ledger.
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, db_path=LEDGER_DB):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def fingerprint(self, path, full=False):
+        """
+        Returns (fast, full) hashes of a file, from the cache when its size and mtime are unchanged.
+        The full hash is None unless `full` is True or it was computed before.
+        """
+        key = path_key(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, fast, full FROM fingerprints WHERE path = ?", (key,)
+            ).fetchone()
+        cached = row is not None and (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns)
+        if cached:
+            fast, full_digest = row[2], row[3]
+        else:
+            fast, full_digest = fast_hash(path), None
+        changed = not cached
+        if full and full_digest is None:
+            full_digest = full_hash(path)
+            changed = True
+        if changed:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, fast, full) VALUES (?, ?, ?, ?, ?)",
+                    (key, stat.st_size, stat.st_mtime_ns, fast, full_digest),
+                )
+        return fast, full_digest
+
+    def find(self, stage, variant, path):
+        """
+        Returns (earlier input path, [output paths]) for an identical input that already went
+        through `stage` with the same variant and whose outputs still exist, or None.
+        """
+        fast, _ = self.fingerprint(path)
+        key = path_key(path)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT input_path, full_hash, outputs FROM dedup_outputs"
+                " WHERE stage = ? AND variant = ? AND fast_hash = ? AND input_path != ?",
+                (stage, variant, fast, key),
+            ).fetchall()
+        full = None
+        for input_path, full_digest, outputs in rows:
+            outputs = [Path(p) for p in json.loads(outputs)]
+            if not all(p.exists() for p in outputs):
+                continue
+            # A sampled match is only a candidate; confirm it with the whole file
+            if full_digest is None:
+                full_digest = self._confirm_full(stage, variant, input_path, fast)
+                if full_digest is None:
+                    continue
+            if full is None:
+                _, full = self.fingerprint(path, full=True)
+            if full_digest == full:
+                return Path(input_path), outputs
+        return None
+
+    def _confirm_full(self, stage, variant, input_path, fast):
+        """
+        Computes the full hash of an earlier input (once; it is stored with its results).
+        Returns None if the file is gone or no longer has the recorded fast hash.
+        """
+        try:
+            current_fast, full = self.fingerprint(input_path, full=True)
+        except OSError:
+            return None
+        if current_fast != fast:
+            return None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE dedup_outputs SET full_hash = ? WHERE stage = ? AND variant = ? AND input_path = ?",
+                (full, stage, variant, input_path),
+            )
+        return full
+
+    def record(self, stage, variant, path, outputs):
+        """
+        Records the outputs a stage produced from `path`. Only the fast hash is needed; the full
+        one is stored too if it is already known, else computed when a later input matches.
+        """
+        fast, full = self.fingerprint(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dedup_outputs (stage, variant, input_path, fast_hash, full_hash, outputs, recorded_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stage, variant, path_key(path), fast, full, json.dumps([str(Path(p)) for p in outputs]), time.time()),
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ContentIndex()
+        return _index
+
+
+def _renamed(output, old_stem, new_stem, output_dir=None):
+    """Output path for the duplicate: the earlier output's name with the input stem swapped."""
+    name = output.name
+    name = new_stem + name[len(old_stem):] if name.startswith(old_stem) else f"{new_stem}_{name}"
+    return (Path(output_dir) if output_dir is not None else output.parent) / name
+
+
+def reuse(stage, input_path, variant="", output_dir=None):
+    """
+    If an identical copy of `input_path` already went through `stage` (same variant), puts its
+    outputs in place under the new input's name and returns their paths; otherwise returns None.
+    Args:
+        stage (str): Stage name, e.g. "convert".
+        input_path (Path): The stage's input file.
+        variant (str): Settings the outputs depend on.
+        output_dir (Path): Folder for the reused outputs (default: next to the earlier ones).
+    Returns:
+        list: Paths of the reused outputs, or None.
+    """
+    if not DEDUP_ENABLED:
+        return None
+    input_path = Path(input_path)
+    try:
+        match = _get_index().find(stage, variant, input_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"[dedup] Could not check {input_path.name} for duplicates: {e}")
+        return None
+    if match is None:
+        return None
+    original, outputs = match
+    targets = []
+    for output in outputs:
+        target = _renamed(output, original.stem, input_path.stem, output_dir)
+        if target != output:
+            _link_or_copy(output, target, mark=stage in _WATCHED_OUTPUTS)
+        targets.append(target)
+    print(f"[dedup] {input_path.name} is identical to {original.name}; reusing its {stage} output "
+          f"({', '.join(f'{t.parent.name}/{t.name}' for t in targets)}).")
+    metrics.count("dedup_hits", stage=stage)
+    remember(stage, input_path, targets, variant)
+    return targets
+
+
+def remember(stage, input_path, outputs, variant=""):
+    """
+    Records the outputs `stage` produced from `input_path`, so identical copies can reuse them.
+    """
+    if not DEDUP_ENABLED:
+        return
+    try:
+        _get_index().record(stage, variant, Path(input_path), outputs)
+    except (OSError, sqlite3.Error) as e:
+        print(f"[dedup] Could not record {Path(input_path).name}: {e}")
@@ -1,24 +1,46 @@
-
 """
 editor.py
 ---------
 Formats a raw transcript text file and generates a summary using Gemini API.
 
-This script is called by transcript_watcher.py when a new transcript is detected.
+transcript_watcher.py runs process_transcript() (or process_stream()) in a warm worker process
+(warm_pool.py) when a new transcript is detected; it can also be run on its own for a single file.
 It uses the Gemini API to:
     - Format the transcript into a well-structured markdown file (formatted_*.md)
     - Generate a summary markdown file (summary_*.md) with key ideas and action items
+
+By default the format and summary chunk requests are sent in parallel through a
+bounded pool (chunk_pool.py), under the shared rate limit (rate_limit.py). The chunk summaries are then merged in a tree
+of parallel calls (reduce_summaries) down to the final summary. Pass --sequential (or set
+EDITOR_CONCURRENT = False) to send one request at a time.
+
+Each chunk result is saved to a checkpoint (checkpoint.py) as soon as it arrives, so a
+re-run after a failure or STOP_PIPELINE only requests the missing chunks and the polish step.
+
+Given a <stem>.segments.jsonl stream instead of a .txt (STREAM_TRANSCRIPTS), the transcript is
+chunked and sent while Whisper is still transcribing it (process_stream).
 """
 
 import sys
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
 
 
 # Import Gemini API call from separate module
-from gemini_api import call_gemini_api
+from gemini_api import call_gemini_api, response_cache
+from chunk_pool import ChunkPool
+from chunker import chunk_transcript, iter_chunks, chunk_stats, default_budget, estimate_tokens
+from checkpoint import EditorCheckpoint, fingerprint, FORMAT, SUMMARY, POLISH
+from segment_stream import follow_segments, is_segments_file, transcript_for
+import dedup
+import job_ledger
+import metrics
 # Import prompts from config
 from config import FORMAT_PROMPT, SUMMARY_PROMPT
-from config import TRANSCRIPTS_DIR
+from config import TRANSCRIPTS_DIR, EDITOR_CONCURRENT, EDITOR_MAX_CONCURRENCY, LLM_MODELS
+from config import SUMMARY_REDUCE_FAN_IN, SUMMARY_REDUCE_CONCURRENCY, SUMMARY_REDUCE_MAX_TOKENS
 
 # Define output directories for formatted and summary notes
 FORMATTED_DIR = TRANSCRIPTS_DIR / "formatted"
@@ -26,59 +48,275 @@ SUMMARY_DIR = TRANSCRIPTS_DIR / "summary"
 FORMATTED_DIR.mkdir(parents=True, exist_ok=True)
 SUMMARY_DIR.mkdir(parents=True, exist_ok=True)
 
+def _chunk_label(index, num_chunks):
+    """"3/9", or just "3" while the number of chunks is not known yet (streaming)."""
+    return f"{index+1}/{num_chunks}" if num_chunks else f"{index+1}"
 
-def main():
-    """
-    Main entry point for formatting and summarizing a transcript file.
-    Chunks the transcript for processing, calls Gemini API for formatting and summary,
-    and writes the results to output folders.
-    """
-    if len(sys.argv) < 2:
-        print("Usage: python editor.py <transcript_file.md>")
-        sys.exit(1)
-    transcript_path = Path(sys.argv[1])
-    if not transcript_path.exists():
-        print(f"File not found: {transcript_path}")
-        sys.exit(1)
-    with open(transcript_path, 'r', encoding='utf-8') as f:
-        transcript_lines = f.readlines()
 
-    # Chunking: process 500 lines at a time
-    chunk_size = 500
-    num_chunks = (len(transcript_lines) + chunk_size - 1) // chunk_size
-    
-    formatted_chunks = []
-    print(f"[editor] Step 1: Formatting transcript in {num_chunks} chunks of {chunk_size} lines each...")
-    for i in range(num_chunks):
-        chunk_lines = transcript_lines[i*chunk_size:(i+1)*chunk_size]
-        chunk_text = ''.join(chunk_lines)
-        print(f"[editor] Formatting chunk {i+1}/{num_chunks}...")
-        formatted_chunk = call_gemini_api(FORMAT_PROMPT, chunk_text)
-        formatted_chunks.append(formatted_chunk)
-    formatted_text = '\n\n'.join(formatted_chunks)
+def format_chunk(index, num_chunks, chunk_text):
+    """Formats one transcript chunk with Gemini."""
+    print(f"[editor] Formatting chunk {_chunk_label(index, num_chunks)}...")
+    return call_gemini_api(FORMAT_PROMPT, chunk_text, LLM_MODELS[FORMAT])
+
+
+def summarize_chunk(index, num_chunks, chunk_text):
+    """Summarizes one transcript chunk with Gemini."""
+    print(f"[editor] Summarizing chunk {_chunk_label(index, num_chunks)}...")
+    return call_gemini_api(SUMMARY_PROMPT, chunk_text, LLM_MODELS[SUMMARY])
+
+
+def write_formatted(transcript_path, formatted_chunks):
+    """Joins formatted chunks and writes them to FORMATTED_DIR. Returns the output path."""
     formatted_path = FORMATTED_DIR / transcript_path.with_suffix('.md').name
     with open(formatted_path, 'w', encoding='utf-8') as f:
-        f.write(formatted_text)
+        f.write('\n\n'.join(formatted_chunks))
     print(f"[editor] Step 1 complete: Formatted notes saved to {formatted_path}")
+    return formatted_path
 
-    
-    # 2. Generate a summary in chunks, then polish
-    print("[editor] Step 2: Generating summary in chunks...")
-    summary_chunks = []
-    for i in range(num_chunks):
-        chunk_lines = transcript_lines[i*chunk_size:(i+1)*chunk_size]
-        chunk_text = ''.join(chunk_lines)
-        print(f"[editor] Summarizing chunk {i+1}/{num_chunks}...")
-        summary_chunk = call_gemini_api(SUMMARY_PROMPT, chunk_text)
-        summary_chunks.append(summary_chunk)
-    concatenated_summary = '\n\n'.join(summary_chunks)
 
-    print("[editor] Step 2: Polishing concatenated summary with Gemini...")
-    polished_summary = call_gemini_api(SUMMARY_PROMPT, concatenated_summary)
+def write_summary(transcript_path, polished_summary):
+    """Writes the polished summary to SUMMARY_DIR. Returns the output path."""
     summary_path = SUMMARY_DIR / transcript_path.with_suffix('.md').name
     with open(summary_path, 'w', encoding='utf-8') as f:
         f.write(polished_summary)
     print(f"[editor] Step 2 complete: Summary notes saved to {summary_path}")
+    return summary_path
+
+
+def polish_summary(summary_chunks):
+    """Polishes the concatenated chunk summaries into the final summary with one Gemini call."""
+    print("[editor] Step 2: Polishing concatenated summary with Gemini...")
+    return call_gemini_api(SUMMARY_PROMPT, '\n\n'.join(summary_chunks), LLM_MODELS[POLISH])
+
+
+def merge_summaries(level, index, num_groups, summaries):
+    """Merges one group of summaries into a single summary with Gemini."""
+    print(f"[editor] Step 2: Merging summaries (level {level}, group {index+1}/{num_groups})...")
+    return call_gemini_api(SUMMARY_PROMPT, '\n\n'.join(summaries), LLM_MODELS[SUMMARY])
+
+
+def _run_checkpointed(pool, checkpoint, concurrency, calls):
+    """
+    Runs (kind, index, input_text, func, *args) calls through the checkpoint and returns their
+    results in order: in the pool with at most `concurrency` in flight, or one by one without a pool.
+    """
+    if pool is None:
+        return [checkpoint.cached(*call) for call in calls]
+    slots = threading.BoundedSemaphore(concurrency)
+    futures = []
+    for call in calls:
+        slots.acquire()
+        future = _submit_checkpointed(pool, checkpoint, *call)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return [f.result() for f in futures]
+
+
+def reduce_summaries(summary_chunks, checkpoint, pool=None, fan_in=SUMMARY_REDUCE_FAN_IN,
+                     concurrency=SUMMARY_REDUCE_CONCURRENCY, max_tokens=SUMMARY_REDUCE_MAX_TOKENS):
+    """
+    Reduces the chunk summaries to the final summary with a tree of Gemini calls.
+    While the summaries are too many (more than `fan_in`) and too long (over `max_tokens`) for one
+    call, they are merged in groups of `fan_in`, the groups of a level running in parallel on
+    `pool`. The remaining summaries then get the final polish call. Short transcripts skip
+    straight to that call, exactly like the single polish call before.
+    Every merge is checkpointed, so a re-run only repeats the merges that did not finish.
+    Args:
+        summary_chunks (list): Chunk summaries in transcript order.
+        checkpoint (EditorCheckpoint): Checkpoint for the transcript.
+        pool (ChunkPool): Pool to run merges in parallel (None = one at a time).
+        fan_in (int): Summaries merged per call.
+        concurrency (int): Maximum merges in flight (None = EDITOR_MAX_CONCURRENCY).
+        max_tokens (int): Input that fits in one call (None = chunker.default_budget()).
+    Returns:
+        str: The polished summary.
+    """
+    fan_in = max(2, fan_in)
+    concurrency = concurrency or EDITOR_MAX_CONCURRENCY
+    max_tokens = max_tokens or default_budget(SUMMARY_PROMPT)
+    summaries = list(summary_chunks)
+    level = 0
+    while len(summaries) > fan_in and estimate_tokens('\n\n'.join(summaries)) > max_tokens:
+        level += 1
+        groups = [summaries[i:i + fan_in] for i in range(0, len(summaries), fan_in)]
+        print(f"[editor] Step 2: Merging {len(summaries)} summaries into {len(groups)} (level {level})...")
+        summaries = _run_checkpointed(pool, checkpoint, concurrency, [
+            (POLISH, f"{level}.{i}", '\n\n'.join(group), merge_summaries, level, i, len(groups), group)
+            for i, group in enumerate(groups)
+        ])
+    return checkpoint.cached(POLISH, 0, '\n\n'.join(summaries), polish_summary, summaries)
+
+
+def process_sequential(transcript_path, chunks, checkpoint):
+    """
+    Formats and summarizes the chunks one request at a time, skipping checkpointed chunks.
+    `chunks` can be a list or a stream of chunks (see process_stream).
+    """
+    num_chunks = len(chunks) if isinstance(chunks, list) else None
+    print("[editor] Step 1: Formatting and summarizing transcript chunk by chunk...")
+    formatted_chunks = []
+    summary_chunks = []
+    for i, chunk in enumerate(chunks):
+        formatted_chunks.append(checkpoint.cached(FORMAT, i, chunk, format_chunk, i, num_chunks, chunk))
+        summary_chunks.append(checkpoint.cached(SUMMARY, i, chunk, summarize_chunk, i, num_chunks, chunk))
+    write_formatted(transcript_path, formatted_chunks)
+    # 2. Reduce the chunk summaries into the final summary
+    write_summary(transcript_path, reduce_summaries(summary_chunks, checkpoint))
+
+
+def _submit_checkpointed(pool, checkpoint, kind, index, input_text, func, *args):
+    """
+    Returns a Future for one result: already resolved if it is in the checkpoint,
+    otherwise the request is submitted to the pool and its result saved when it arrives.
+    """
+    saved = checkpoint.get(kind, index, input_text)
+    if saved is None:
+        return pool.submit(checkpoint.cached, kind, index, input_text, func, *args)
+    future = Future()
+    future.set_result(saved)
+    return future
+
+
+def process_concurrent(transcript_path, chunks, checkpoint):
+    """
+    Sends every format and summary chunk request that is not checkpointed through a ChunkPool.
+    Requests go out as soon as each chunk is available, so with a stream of chunks they overlap
+    with transcription. Results are collected back in chunk order; the summary reduction only
+    waits for the summaries.
+    """
+    num_chunks = len(chunks) if isinstance(chunks, list) else None
+    if num_chunks is None:
+        print("[editor] Formatting and summarizing chunks concurrently as they arrive...")
+    else:
+        print(f"[editor] Formatting and summarizing {num_chunks} chunks concurrently...")
+    with ChunkPool() as pool:
+        format_futures = []
+        summary_futures = []
+        for i, chunk in enumerate(chunks):
+            summary_futures.append(_submit_checkpointed(pool, checkpoint, SUMMARY, i, chunk,
+                                                        summarize_chunk, i, num_chunks, chunk))
+            format_futures.append(_submit_checkpointed(pool, checkpoint, FORMAT, i, chunk,
+                                                       format_chunk, i, num_chunks, chunk))
+        summary_chunks = [f.result() for f in summary_futures]
+        # Format requests keep running in the pool while the summaries are reduced
+        polished = reduce_summaries(summary_chunks, checkpoint, pool)
+        write_formatted(transcript_path, [f.result() for f in format_futures])
+        write_summary(transcript_path, polished)
+
+
+def _print_cache_stats():
+    if response_cache is not None:
+        stats = response_cache.stats()
+        print(f"[editor] Gemini cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['entries']} entries, {stats['bytes'] // 1024} KiB on disk)")
+
+
+def notes_variant():
+    """
+    Fingerprint of the models and prompts the notes depend on (for checkpoints and dedup.py).
+    """
+    return fingerprint([LLM_MODELS[kind] for kind in (FORMAT, SUMMARY, POLISH)])
+
+
+def note_paths(transcript_path):
+    """The formatted and summary notes written for a transcript."""
+    name = transcript_path.with_suffix('.md').name
+    return [FORMATTED_DIR / name, SUMMARY_DIR / name]
+
+
+def _edit(transcript_path, chunks, concurrent, streamed=False):
+    """
+    Runs the format and summary steps with the transcript's checkpoint, timed as an "edit" span.
+    On success, records the notes for deduplication and the end-to-end latency since the file
+    first entered the pipeline.
+    """
+    with metrics.span("edit", file=transcript_path.name, streamed=streamed) as span:
+        checkpoint = EditorCheckpoint(transcript_path, notes_variant())
+        if concurrent:
+            process_concurrent(transcript_path, chunks, checkpoint)
+        else:
+            process_sequential(transcript_path, chunks, checkpoint)
+        checkpoint.remove()
+        if isinstance(chunks, list):
+            span["chunks"] = len(chunks)
+    # A stream ends after its .txt is written, so streamed edits are recorded the same way
+    dedup.remember("edit", transcript_path, note_paths(transcript_path), notes_variant())
+    first_seen = job_ledger.first_seen(transcript_path.stem)
+    if first_seen is not None:
+        metrics.record("end_to_end", time.time() - first_seen, start=first_seen, file=transcript_path.stem)
+
+
+def process_transcript(transcript_path, concurrent=EDITOR_CONCURRENT):
+    """
+    Chunks a transcript, calls Gemini API for formatting and summary,
+    and writes the results to output folders.
+    Args:
+        transcript_path (Path): Path to the transcript .txt file.
+        concurrent (bool): Send chunk requests in parallel instead of one at a time.
+    """
+    # A copy of a transcript that was already edited reuses its notes
+    if dedup.reuse("edit", transcript_path, notes_variant()):
+        return
+    with open(transcript_path, 'r', encoding='utf-8') as f:
+        transcript_text = f.read()
+    # Chunking: pack lines into chunks up to a token budget (see chunker.py)
+    chunks = chunk_transcript(transcript_text)
+    print(f"[editor] Chunked transcript: {chunk_stats(chunks).describe()}")
+    _edit(transcript_path, chunks, concurrent)
+    _print_cache_stats()
+
+
+def process_stream(stream_path, concurrent=EDITOR_CONCURRENT):
+    """
+    Formats and summarizes a transcript while it is still being written, from its segment
+    stream (segment_stream.py). Each chunk is sent as soon as it reaches the token budget;
+    only the last chunk and the polish call wait for transcription to finish.
+    The notes are named after the transcript, exactly as process_transcript() would name them.
+    Args:
+        stream_path (Path): Path to the <stem>.segments.jsonl file.
+        concurrent (bool): Send chunk requests in parallel instead of one at a time.
+    Returns:
+        Path: The transcript the stream belongs to.
+    """
+    transcript_path = transcript_for(stream_path)
+    print(f"[editor] Following segment stream {stream_path.name}...")
+    chunks = []
+
+    def stream_chunks():
+        for chunk in iter_chunks(follow_segments(stream_path)):
+            chunks.append(chunk)
+            yield chunk
+
+    _edit(transcript_path, stream_chunks(), concurrent, streamed=True)
+    print(f"[editor] Chunked transcript: {chunk_stats(chunks).describe()}")
+    _print_cache_stats()
+    return transcript_path
+
+
+def main():
+    """
+    Main entry point for formatting and summarizing a transcript file.
+    Usage: python editor.py [--sequential | --concurrent] <transcript_file.txt | stem.segments.jsonl>
+    """
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    flags = [a for a in sys.argv[1:] if a.startswith('--')]
+    if not args:
+        print("Usage: python editor.py [--sequential | --concurrent] <transcript_file.txt | stem.segments.jsonl>")
+        sys.exit(1)
+    transcript_path = Path(args[0])
+    # A segment stream may not exist yet if the transcriber is just starting
+    if not transcript_path.exists() and not is_segments_file(transcript_path):
+        print(f"File not found: {transcript_path}")
+        sys.exit(1)
+    concurrent = EDITOR_CONCURRENT
+    if '--sequential' in flags:
+        concurrent = False
+    elif '--concurrent' in flags:
+        concurrent = True
+    if is_segments_file(transcript_path):
+        process_stream(transcript_path, concurrent=concurrent)
+    else:
+        process_transcript(transcript_path, concurrent=concurrent)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,288 @@
+"""
+fs_watch.py
+-----------
+Event-driven directory watching shared by the video, audio and transcript watchers.
+
+DirectoryWatcher yields files matching one or more glob patterns as they appear. It uses filesystem
+events from the watchdog package (inotify on Linux, ReadDirectoryChangesW on Windows),
+so new files are picked up within milliseconds and an idle watcher does no directory scans.
+The STOP_PIPELINE file is watched the same way, so stopping does not need a polling loop either.
+Given the process's Controller (control.py), iteration also follows the control commands:
+it holds the next file while paused and ends at once on drain or stop-now.
+
+If watchdog is not installed, or the filesystem can't deliver events (some network and
+cloud-synced drives), it falls back to scanning the directory every WATCH_POLL_INTERVAL seconds.
+Some of those drives accept the observer but never report changes, so an idle watcher using events
+still rescans the directory once a minute; a file found that way was missed by the events, and
+with WATCH_BACKEND = "auto" the watcher switches to polling.
+
+Usage:
+    with DirectoryWatcher(AUDIO_DIR, "*.mp3") as watcher:
+        for path in watcher:          # ends when STOP_PIPELINE appears (or on drain/stop-now)
+            ...
+            watcher.requeue(path, 30)  # try a file again later
+"""
+
+import queue
+import threading
+from pathlib import Path
+
+from config import STOP_FILE, WATCH_BACKEND, WATCH_POLL_INTERVAL
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog is optional; polling still works without it
+    Observer = None
+    FileSystemEventHandler = object
+
+# Queue sentinel meaning "stop iterating"
+_STOP = object()
+# Even with events, re-check the stop file and rescan the directory this often when idle,
+# in case their events were missed
+_STOP_CHECK_INTERVAL = 60
+# Seconds a file found by that rescan is given for its event to arrive before it counts as missed
+_EVENT_GRACE = 2
+
+
+class _EventHandler(FileSystemEventHandler):
+    """
+    Forwards watchdog events for matching files (and the stop file) to a DirectoryWatcher.
+    """
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher._on_path(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher._on_path(event.dest_path)
+
+    def on_closed(self, event):
+        # Emitted on Linux (inotify) when a writer closes the file
+        if not event.is_directory:
+            self.watcher._on_path(event.src_path)
+
+
+class DirectoryWatcher:
+    """
+    Iterates over files matching `patterns` in `directory`: existing ones first, then new ones
+    as they arrive. Iteration ends when the stop file is created.
+    """
+
+    def __init__(self, directory, patterns, stop_file=STOP_FILE, backend=WATCH_BACKEND,
+                 poll_interval=WATCH_POLL_INTERVAL, backlog=None, control=None):
+        """
+        Args:
+            directory (Path): Folder to watch.
+            patterns (str or tuple): Glob pattern(s) for files of interest, e.g. "*.mp4".
+            stop_file (Path): File whose creation ends the iteration.
+            backend (str): "auto", "events" or "polling".
+            poll_interval (float): Seconds between scans when polling.
+            backlog (queue.Queue): Queue for files waiting to be yielded, e.g. a scheduler.JobQueue
+                to yield them shortest job first (default: FIFO).
+            control (control.Controller): The process's controller; the stop file then requests
+                stop-now through it, so the process's other waits end too.
+        """
+        self.directory = Path(directory)
+        self.patterns = (patterns,) if isinstance(patterns, str) else tuple(patterns)
+        self.stop_file = Path(stop_file)
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._queue = backlog if backlog is not None else queue.Queue()
+        self.control = control
+        # Paths currently sitting in the queue, so bursts of events enqueue a file only once
+        self._pending = set()
+        self._known = set()
+        self._lock = threading.Lock()
+        self._observer = None
+        self._poll_thread = None
+        self._closed = threading.Event()
+        self.using_events = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        """
+        Queues the files already in the directory and starts the event or polling backend.
+        """
+        if self.control is not None:
+            self.control.subscribe(self._on_control)
+        if self.backend in ("auto", "events"):
+            self.using_events = self._start_observer()
+            if not self.using_events and self.backend == "events":
+                raise RuntimeError(f"Filesystem events are not available for {self.directory}")
+        if not self.using_events:
+            self._start_polling()
+        # Initial scan after the observer is running, so nothing created in between is missed
+        self._scan()
+        mode = "filesystem events" if self.using_events else f"polling every {self.poll_interval}s"
+        print(f"[fs_watch] Watching {self.directory} for {', '.join(self.patterns)} ({mode})")
+
+    def _start_observer(self):
+        """
+        Starts a watchdog observer on the watched folder and the stop file's folder.
+        Returns:
+            bool: True if events are being delivered, False to fall back to polling.
+        """
+        if Observer is None:
+            print("[fs_watch] watchdog is not installed; falling back to polling.")
+            return False
+        try:
+            observer = Observer()
+            handler = _EventHandler(self)
+            observer.schedule(handler, str(self.directory), recursive=False)
+            if self.stop_file.parent.resolve() != self.directory.resolve():
+                observer.schedule(handler, str(self.stop_file.parent), recursive=False)
+            observer.daemon = True
+            observer.start()
+        except Exception as e:
+            print(f"[fs_watch] Filesystem events unavailable for {self.directory} ({e}); falling back to polling.")
+            return False
+        self._observer = observer
+        return True
+
+    def _start_polling(self):
+        self._poll_thread = threading.Thread(target=self._poll_loop, name="fs-watch-poll", daemon=True)
+        self._poll_thread.start()
+
+    def close(self):
+        """
+        Stops the backend threads.
+        """
+        self._closed.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+
+    def requeue(self, path, delay=0):
+        """
+        Offers a file again after `delay` seconds, e.g. when it was still locked.
+        """
+        if delay <= 0:
+            self._enqueue(Path(path), requeue=True)
+            return
+        timer = threading.Timer(delay, self._enqueue, args=(Path(path),), kwargs={"requeue": True})
+        timer.daemon = True
+        timer.start()
+
+    def __iter__(self):
+        """
+        Yields resolved Paths of matching files until the stop file appears.
+        """
+        timeout = _STOP_CHECK_INTERVAL if self.using_events else self.poll_interval
+        while not self._closed.is_set():
+            if self.stop_file.exists() or (self.control is not None and not self.control.accepting):
+                return
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                if self.using_events:
+                    self._safety_scan()
+                continue
+            if item is _STOP:
+                return
+            with self._lock:
+                self._pending.discard(item)
+            # Hold the file while paused; drop it if the process is draining or stopping
+            # (it is still there on the next start)
+            if self.control is not None and not self.control.wait_until_runnable():
+                return
+            if item.exists():
+                yield item
+
+    def _on_path(self, src_path):
+        """
+        Handles a path reported by an event: the stop file ends iteration, matching files are queued.
+        """
+        path = Path(src_path)
+        if path.name == self.stop_file.name and path.parent.resolve() == self.stop_file.parent.resolve():
+            self._stop_file_created()
+        elif path.parent.resolve() == self.directory.resolve() and any(path.match(p) for p in self.patterns):
+            self._enqueue(path)
+
+    def _stop_file_created(self):
+        if self.control is not None:
+            self.control.request("stop-now")
+        self._queue.put(_STOP)
+
+    def _on_control(self, state):
+        """
+        Ends a blocked iteration as soon as the process starts draining or stopping.
+        """
+        if not self.control.accepting:
+            self._queue.put(_STOP)
+
+    def _enqueue(self, path, requeue=False):
+        path = path.resolve()
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+            self._known.add(path)
+        if requeue and hasattr(self._queue, "requeue"):
+            # A scheduler.JobQueue keeps the file's original queue time
+            self._queue.requeue(path)
+        else:
+            self._queue.put(path)
+
+    def _scan(self):
+        """
+        Globs the directory and queues files that have not been seen before.
+        """
+        for path in self._unseen():
+            self._enqueue(path)
+
+    def _unseen(self):
+        """Returns the matching files in the directory that have not been seen before."""
+        return [path for pattern in self.patterns for path in (f.resolve() for f in self.directory.glob(pattern))
+                if path not in self._known]
+
+    def _safety_scan(self):
+        """
+        Rescans the directory while using events. Files found here were missed by the events;
+        with the "auto" backend the watcher then stops trusting them and polls instead.
+        """
+        try:
+            unseen = self._unseen()
+            if unseen and not self._closed.wait(_EVENT_GRACE):
+                unseen = self._unseen()
+        except OSError as e:
+            print(f"[fs_watch] Error scanning {self.directory}: {e}")
+            return
+        if not unseen:
+            return
+        for path in unseen:
+            self._enqueue(path)
+        print(f"[fs_watch] Filesystem events missed {len(unseen)} file(s) in {self.directory}.")
+        if self.backend == "auto":
+            print(f"[fs_watch] Switching to polling every {self.poll_interval}s.")
+            self.using_events = False
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer = None
+            self._start_polling()
+
+    def _poll_loop(self):
+        """
+        Polling fallback: rescans the directory until closed, and watches for the stop file.
+        """
+        while not self._closed.wait(self.poll_interval):
+            if self.stop_file.exists():
+                self._stop_file_created()
+                return
+            try:
+                self._scan()
+            except OSError as e:
+                print(f"[fs_watch] Error scanning {self.directory}: {e}")
@@ -1,45 +1,103 @@
-
 """
 gemini_api.py
 -------------
 Module for interacting with the Gemini API for text formatting and summarization.
-Uses the google-generativeai package.
+Requests go through the process-wide LLM backend (llm_backend.py), which keeps its client
+and connections alive between calls.
 
 This module is imported by editor.py to call the Gemini LLM for formatting and summarizing transcripts.
+Responses are cached on disk (response_cache.py), so re-running an unchanged transcript
+does not call the API again.
+Requests wait for the shared rate limiter (rate_limit.py), and throttled or transient failures
+are retried with jittered exponential backoff instead of failing the whole transcript.
+Every request is timed as a "gemini_call" span, with its token counts (metrics.py).
 """
 
-import os
-import google.generativeai as genai
+import time
+
+from config import GEMINI_CACHE_ENABLED, LLM_MODEL, LLM_MAX_RETRIES
+from chunker import estimate_tokens
+from llm_backend import LLMError, get_backend
+from rate_limit import SharedRateLimiter, backoff_delay
+from response_cache import ResponseCache
+import metrics
+
+# Default model; editor.py picks one per call type from LLM_MODELS in config.py
+MODEL_NAME = LLM_MODEL
+
+# Shared response cache (None when caching is disabled in config)
+response_cache = ResponseCache() if GEMINI_CACHE_ENABLED else None
 
-# Set your Gemini API key as an environment variable for security
-API_KEY = os.getenv("GOOGLE_API_KEY")  # Set this in your environment
+# Requests/tokens per minute limiter shared with every other pipeline process
+rate_limiter = SharedRateLimiter()
 
-def call_gemini_api(prompt, text):
+
+def _request(backend, model, prompt, text):
     """
-    Calls the Gemini API with a prompt and input text.
-    Args:
-        prompt (str): The instruction for the LLM.
-        text (str): The input text to process.
-    Returns:
-        str: The processed text from Gemini API.
-    Raises:
-        RuntimeError: If the API key is not set.
+    Sends one request, timed as a "gemini_call" span. Returns (text, input tokens).
     """
+    metrics.count("gemini_requests")
+    try:
+        with metrics.span("gemini_call", model=model, backend=backend.name,
+                          input_chars=len(prompt) + len(text)) as span:
+            result, input_tokens, output_tokens = backend.generate(model, prompt, text)
+            if input_tokens is not None:
+                span["input_tokens"] = input_tokens
+                span["output_tokens"] = output_tokens
+                metrics.count("gemini_input_tokens", input_tokens or 0)
+                metrics.count("gemini_output_tokens", output_tokens or 0)
+    except Exception as e:
+        metrics.count("gemini_errors", status=getattr(e, "status", None) or "none")
+        raise
+    return result.strip(), input_tokens
+
+
+def call_gemini_api(prompt, text, model=MODEL_NAME):
     """
     Calls the Gemini API with a prompt and input text.
+    Returns a cached response instead if the same model, prompt and text were sent before.
     Args:
         prompt (str): The instruction for the LLM.
         text (str): The input text to process.
+        model (str): Model name (see LLM_MODELS in config.py).
     Returns:
         str: The processed text from Gemini API.
+    Raises:
+        RuntimeError: If the LLM_BACKEND backend can't be set up on first use (llm_backend.py:
+            no GOOGLE_API_KEY for "gemini", no LLM_HTTP_URL for "http").
+        LLMError: If the request failed and could not be retried (or ran out of retries).
     """
-    if not API_KEY:
-        raise RuntimeError("GOOGLE_API_KEY environment variable not set.")
-
-    genai.configure(api_key=API_KEY)
-    # Use the free Gemini 1.5 Flash model (usually available for all users)
-    model = genai.GenerativeModel("models/gemini-2.5-flash-lite")
-    print("Sent to Gemini API...")
-    response = model.generate_content([prompt, text])
+    if response_cache is not None:
+        cached = response_cache.get(model, prompt, text)
+        if cached is not None:
+            print("Using cached Gemini response.")
+            metrics.count("gemini_cache_hits")
+            return cached
+
+    backend = get_backend()
+    estimated_tokens = estimate_tokens(prompt) + estimate_tokens(text)
+    attempt = 0
+    while True:
+        rate_limiter.acquire(estimated_tokens)
+        print("Sent to Gemini API...")
+        try:
+            result, input_tokens = _request(backend, model, prompt, text)
+            break
+        except LLMError as e:
+            if e.throttled:
+                factor = rate_limiter.throttled(e.retry_after)
+                metrics.count("gemini_throttled")
+                print(f"[gemini_api] Rate limited; request rate now {factor:.0%} of the quota.")
+            if not e.retryable or attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt, e.retry_after)
+            attempt += 1
+            print(f"[gemini_api] {e}; retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s.")
+            metrics.count("gemini_retries")
+            time.sleep(delay)
+    rate_limiter.succeeded()
+    rate_limiter.settle(estimated_tokens, input_tokens)
     print("Received response from Gemini API.")
-    return response.text.strip()
+    if response_cache is not None and result:
+        response_cache.put(model, prompt, text, result)
+    return result
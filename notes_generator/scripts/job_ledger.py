@@ -0,0 +1,265 @@
+"""
+job_ledger.py
+-------------
+SQLite-backed job ledger shared by every pipeline stage.
+
+Replaces the processed_videos.txt / processed_audios.txt / processed_transcripts.txt logs.
+All stages write to one database (LEDGER_DB) in WAL mode, so watchers in separate
+processes can read and write it at the same time. There is one row per (stage, input file)
+holding its state, input size, media duration and start/finish times.
+
+Finished paths for a stage are loaded into memory once, so is_processed() is a set lookup
+(falling back to one primary-key query for files finished by another process) instead of
+re-reading and re-resolving a text file. Writes can be grouped with batch() so
+bulk updates cost a single commit.
+
+On first use of a stage, its old processed_*.txt file is imported automatically.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import (
+    LEDGER_DB, PROCESSED_VIDEOS_FILE, PROCESSED_AUDIO_FILE, PROCESSED_TRANSCRIPTS_FILE,
+)
+
+# Legacy text ledger for each stage, imported on first run
+LEGACY_FILES = {
+    "convert": PROCESSED_VIDEOS_FILE,
+    "transcribe": PROCESSED_AUDIO_FILE,
+    "edit": PROCESSED_TRANSCRIPTS_FILE,
+}
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# States that mean "don't pick this file up again"
+FINISHED_STATES = (DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    input_size INTEGER,
+    media_duration REAL,
+    queued_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    PRIMARY KEY (stage, path)
+);
+CREATE INDEX IF NOT EXISTS jobs_stage_state ON jobs (stage, state);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def path_key(path):
+    """
+    Normalizes a path to the string stored in the ledger.
+    """
+    return str(Path(path).resolve())
+
+
+def _like_escape(text):
+    """Escapes LIKE wildcards (% and _, common in recording names) with a backslash."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def first_seen(stem, db_path=LEDGER_DB):
+    """
+    Returns when a recording first entered the pipeline: the earliest queued or start time
+    of any file named <stem>.* in any stage (video, audio, transcript), or None if unknown.
+    """
+    if not Path(db_path).exists():
+        return None
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    try:
+        rows = conn.execute(
+            "SELECT path, MIN(COALESCE(queued_at, started_at)) FROM jobs WHERE path LIKE ? ESCAPE '\\' GROUP BY path",
+            (f"%{_like_escape(stem)}.%",),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # No stage has opened the ledger yet (the database may hold only other tables)
+        return None
+    finally:
+        conn.close()
+    times = [t for path, t in rows if t is not None and Path(path).stem == stem]
+    return min(times) if times else None
+
+
+class JobLedger:
+    """
+    Ledger view for a single stage ("convert", "transcribe" or "edit").
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, stage, db_path=LEDGER_DB, legacy_file=None, retry_failed=False):
+        """
+        Args:
+            stage (str): Stage name.
+            db_path (Path): SQLite database file.
+            legacy_file (Path): processed_*.txt file to import on first run
+                (defaults to the stage's file from config).
+            retry_failed (bool): Treat failed files as not processed, so they are picked up
+                again on the next run (for stages that can resume cheaply).
+        """
+        self.stage = stage
+        self.db_path = Path(db_path)
+        self.finished_states = (DONE,) if retry_failed else FINISHED_STATES
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate(legacy_file if legacy_file is not None else LEGACY_FILES.get(stage))
+        placeholders = ", ".join("?" * len(self.finished_states))
+        rows = self._conn.execute(
+            f"SELECT path FROM jobs WHERE stage = ? AND state IN ({placeholders})", (stage, *self.finished_states)
+        ).fetchall()
+        self._finished = {row[0] for row in rows}
+
+    def _migrate(self, legacy_file):
+        """
+        Imports a processed_*.txt file once. The text file is left in place.
+        """
+        if legacy_file is None:
+            return
+        marker = f"migrated:{self.stage}"
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return
+        paths = []
+        if legacy_file.exists():
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                paths = [path_key(line.strip()) for line in f if line.strip()]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (stage, path, state) VALUES (?, ?, ?)",
+                [(self.stage, p, DONE) for p in paths],
+            )
+            self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(time.time())))
+        if paths:
+            print(f"[job_ledger] Imported {len(paths)} entries from {legacy_file.name} into the {self.stage} ledger.")
+
+    def _commit(self):
+        if self._batch_depth == 0:
+            self._conn.commit()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups several updates into one commit.
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                self._commit()
+
+    def is_processed(self, path):
+        """
+        Returns True if the file has already finished this stage (done, or failed unless retry_failed).
+        Checks the in-memory set first, then the database for rows written by other processes.
+        """
+        key = path_key(path)
+        if key in self._finished:
+            return True
+        with self._lock:
+            placeholders = ", ".join("?" * len(self.finished_states))
+            row = self._conn.execute(
+                f"SELECT 1 FROM jobs WHERE stage = ? AND path = ? AND state IN ({placeholders})",
+                (self.stage, key, *self.finished_states),
+            ).fetchone()
+        if row:
+            self._finished.add(key)
+        return row is not None
+
+    def state(self, path):
+        """
+        Returns the recorded state for a file, or None if it has never been seen.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM jobs WHERE stage = ? AND path = ?", (self.stage, path_key(path))
+            ).fetchone()
+        return row[0] if row else None
+
+    def _upsert(self, key, state, **fields):
+        columns = ["stage", "path", "state"] + list(fields)
+        values = [self.stage, key, state] + list(fields.values())
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns[2:])
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (stage, path) DO UPDATE SET {updates}",
+                values,
+            )
+            self._commit()
+
+    def mark_queued(self, path):
+        """
+        Records that a file is waiting for this stage.
+        """
+        self._upsert(path_key(path), QUEUED, queued_at=time.time())
+
+    def mark_started(self, path, media_duration=None):
+        """
+        Records that this stage started working on a file, with its current size.
+        """
+        path = Path(path)
+        size = path.stat().st_size if path.exists() else None
+        self._upsert(path_key(path), RUNNING, input_size=size, media_duration=media_duration,
+                     started_at=time.time(), finished_at=None, error=None)
+
+    def mark_done(self, path, media_duration=None):
+        """
+        Records that this stage finished a file successfully.
+        """
+        key = path_key(path)
+        fields = {"finished_at": time.time()}
+        if media_duration is not None:
+            fields["media_duration"] = media_duration
+        self._upsert(key, DONE, **fields)
+        self._finished.add(key)
+
+    def mark_failed(self, path, error):
+        """
+        Records that this stage failed on a file.
+        """
+        key = path_key(path)
+        self._upsert(key, FAILED, finished_at=time.time(), error=str(error))
+        if FAILED in self.finished_states:
+            self._finished.add(key)
+
+    def jobs(self, state=None):
+        """
+        Returns this stage's rows as dicts, optionally only those in one state.
+        """
+        query = "SELECT * FROM jobs WHERE stage = ?"
+        params = [self.stage]
+        if state is not None:
+            query += " AND state = ?"
+            params.append(state)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        """
+        Commits anything pending and closes the database connection.
+        """
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,368 @@
+"""
+leases.py
+---------
+Lease files that let any number of watcher processes, on one machine or on several machines
+sharing a synced drive, work through the same folders without doing a job twice.
+
+Before a worker starts on a file, it claims it by creating
+<folder>/.leases/<file name>.<stage>.lease with O_CREAT | O_EXCL, which only one process can do.
+The lease names the worker, host and PID and holds a heartbeat time that a background thread
+renews every LEASE_HEARTBEAT seconds. When the job ends the lease stays behind with state
+"done" (or "failed"), which tells workers on other machines, whose job ledgers never saw the job,
+that the file is finished. Jobs that can be retried (failed edits, cancelled jobs) have their
+lease removed instead.
+
+A lease has expired when its heartbeat is older than LEASE_TTL, or at once when its worker was a
+process on this machine that no longer runs. The next worker to see it moves it aside with an
+atomic rename (only one rename can succeed) and claims the job afresh. A worker that finds its
+lease taken over stops renewing it and says so in its log.
+
+Every LEASE_PRUNE_INTERVAL seconds, a worker clears out the lease folder it claims from: expired
+leases, leftover temporary files, and finished leases whose file has left the folder. Finished
+leases of files still in the folder stay, since they are how other machines know the job is done.
+
+Leases are only used with DISTRIBUTED_WORKERS on; otherwise claim() hands out a lease that never
+touches the disk. Heartbeats use each machine's clock, so the machines' clocks must roughly agree,
+and on a cloud-synced drive a lease reaches other machines only after the drive syncs it: keep
+LEASE_TTL well above the sync delay.
+"""
+
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+import psutil
+
+from config import DISTRIBUTED_WORKERS, WORKER_ID, LEASE_TTL, LEASE_HEARTBEAT, LEASE_PRUNE_INTERVAL
+from job_ledger import RUNNING, DONE, FAILED
+import pid_registry
+
+# Folder (inside each watched folder) holding the lease files
+LEASE_DIR_NAME = ".leases"
+_HOST = socket.gethostname()
+
+
+class Lease:
+    """
+    A claim on one job. release() ends it; `lost` turns True if another worker took it over.
+    """
+
+    def __init__(self, manager, path, lease_path):
+        self.manager = manager
+        self.path = Path(path)
+        self.lease_path = lease_path
+        self.lost = False
+        # Held across each read-modify-write of the lease file, so a renewal can't write a
+        # RUNNING record back over the outcome release() just wrote
+        self._lock = threading.Lock()
+
+    def release(self, state=None):
+        """
+        Ends the claim: with state DONE or FAILED the lease is kept as a record of the outcome,
+        with None it is removed so the job can be picked up again.
+        """
+        if self.manager is not None:
+            self.manager._release(self, state)
+
+
+class LeaseManager:
+    """
+    Claims and renews the leases of one stage ("convert", "transcribe" or "edit") for this worker.
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, stage, enabled=DISTRIBUTED_WORKERS, worker_id=WORKER_ID, ttl=LEASE_TTL,
+                 heartbeat=LEASE_HEARTBEAT, prune_interval=LEASE_PRUNE_INTERVAL):
+        """
+        Args:
+            stage (str): Ledger stage name.
+            enabled (bool): Use lease files (False: every claim succeeds locally).
+            worker_id (str): Name of this worker (None = <host>-<pid>).
+            ttl (float): Seconds without a heartbeat after which a lease expires.
+            heartbeat (float): Seconds between renewals.
+            prune_interval (float): Seconds between clear-outs of a lease folder (None = never).
+        """
+        self.stage = stage
+        self.enabled = enabled
+        self.worker_id = worker_id or f"{_HOST}-{os.getpid()}"
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.prune_interval = prune_interval
+        self._started = psutil.Process().create_time()
+        self._lock = threading.Lock()
+        # Lease file -> Lease, for the leases this worker holds
+        self._held = {}
+        # Path -> monotonic time of the re-check already scheduled for a job held elsewhere
+        self._rechecks = {}
+        # Lease folder -> monotonic time it was last pruned
+        self._pruned = {}
+        self._thread = None
+        self._closed = threading.Event()
+        if enabled:
+            atexit.register(self.close)
+
+    def lease_path(self, path):
+        path = Path(path)
+        return path.parent / LEASE_DIR_NAME / f"{path.name}.{self.stage}.lease"
+
+    @staticmethod
+    def _read(lease_path):
+        try:
+            with open(lease_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, lease_path, record):
+        tmp_path = lease_path.with_name(f"{lease_path.name}.{self.worker_id}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, lease_path)
+
+    def _record(self, path):
+        now = time.time()
+        return {"stage": self.stage, "file": Path(path).name, "worker": self.worker_id, "host": _HOST,
+                "pid": os.getpid(), "started": self._started, "claimed_at": now, "heartbeat": now,
+                "state": RUNNING}
+
+    def holder(self, path):
+        """
+        Returns the lease record of `path` (worker, host, state, heartbeat, ...), or None.
+        """
+        return self._read(self.lease_path(path)) if self.enabled else None
+
+    def finished(self, path):
+        """True if some worker finished `path` in this stage (lease state done or failed)."""
+        record = self.holder(path)
+        return record is not None and record.get("state") in (DONE, FAILED)
+
+    def expires_in(self, record):
+        """Seconds until a running lease expires (0 if it already has)."""
+        if record.get("host") == _HOST and record.get("pid") and not pid_registry.is_alive(record["pid"], record.get("started", 0)):
+            return 0.0
+        return max(0.0, record.get("heartbeat", 0) + self.ttl - time.time())
+
+    def _expired(self, lease_path, record):
+        if record is None:
+            # Being written right now, or left half-written by a crash: go by the file's age
+            try:
+                return time.time() - os.stat(lease_path).st_mtime > self.ttl
+            except FileNotFoundError:
+                return True
+        return record.get("state") == RUNNING and self.expires_in(record) == 0
+
+    def claim(self, path):
+        """
+        Claims the job for `path`.
+        Returns:
+            Lease: The lease, or None if another worker holds or finished the job (see holder()).
+        """
+        if not self.enabled:
+            return Lease(None, path, None)
+        lease_path = self.lease_path(path)
+        lease_path.parent.mkdir(exist_ok=True)
+        self._maybe_prune(lease_path.parent)
+        for _ in range(2):
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                record = self._read(lease_path)
+                if not self._expired(lease_path, record):
+                    return None
+                # Move the expired lease aside; if several workers try, only one rename succeeds
+                aside = lease_path.with_name(f"{lease_path.name}.{self.worker_id}.expired")
+                try:
+                    os.rename(lease_path, aside)
+                except OSError:
+                    return None
+                if self._read(aside) != record:
+                    # Someone else reclaimed it between our read and the rename: give it back
+                    os.replace(aside, lease_path)
+                    return None
+                owner = record.get("worker") if record else "an unknown worker"
+                print(f"[leases] Lease on {Path(path).name} ({self.stage}) held by {owner} expired; reclaiming it.")
+                try:
+                    os.remove(aside)
+                except OSError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._record(path), f)
+            lease = Lease(self, path, lease_path)
+            with self._lock:
+                self._held[lease_path] = lease
+                self._rechecks.pop(Path(path), None)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._renew_loop, name=f"leases-{self.stage}", daemon=True)
+                    self._thread.start()
+            return lease
+        return None
+
+    def defer(self, path, requeue):
+        """
+        Schedules one re-check of a job another worker holds, for when its lease could have
+        expired; repeated calls while a re-check is pending do nothing.
+        """
+        record = self.holder(path) or {}
+        delay = max(self.heartbeat, self.expires_in(record)) if record else self.heartbeat
+        now = time.monotonic()
+        with self._lock:
+            if self._rechecks.get(Path(path), 0) > now:
+                return
+            self._rechecks[Path(path)] = now + delay
+        print(f"[leases] {Path(path).name} is being processed by {record.get('worker', 'another worker')}; "
+              f"checking again in {delay:.0f}s.")
+        requeue(path, delay)
+
+    def finish(self, path, state=DONE):
+        """
+        Records `path` as finished without running it here (e.g. a transcript whose notes were
+        made from its segment stream), unless another worker holds it.
+        """
+        lease = self.claim(path)
+        if lease is not None:
+            lease.release(state)
+
+    def _still_ours(self, lease):
+        record = self._read(lease.lease_path)
+        if record is not None and record.get("worker") == self.worker_id:
+            return record
+        if not lease.lost:
+            lease.lost = True
+            print(f"[leases] WARNING: lost the lease on {lease.path.name} ({self.stage}) to "
+                  f"{record.get('worker') if record else 'another worker'}; it may be processed twice.")
+        return None
+
+    def _held_now(self, lease):
+        with self._lock:
+            return self._held.get(lease.lease_path) is lease
+
+    def _renew_loop(self):
+        while not self._closed.wait(self.heartbeat):
+            with self._lock:
+                leases = list(self._held.values())
+            for lease in leases:
+                with lease._lock:
+                    # Released since the list was taken: its file now holds the outcome
+                    if not self._held_now(lease):
+                        continue
+                    try:
+                        record = self._still_ours(lease)
+                        if record is None:
+                            with self._lock:
+                                self._held.pop(lease.lease_path, None)
+                            continue
+                        record["heartbeat"] = time.time()
+                        self._write(lease.lease_path, record)
+                    except OSError as e:
+                        print(f"[leases] Could not renew the lease on {lease.path.name}: {e}")
+
+    def _release(self, lease, state):
+        with lease._lock:
+            with self._lock:
+                if self._held.get(lease.lease_path) is not lease:
+                    return
+                del self._held[lease.lease_path]
+            try:
+                record = self._still_ours(lease)
+                if record is None:
+                    return
+                if state is None:
+                    os.remove(lease.lease_path)
+                else:
+                    record.update(state=state, heartbeat=time.time(), finished_at=time.time())
+                    self._write(lease.lease_path, record)
+            except OSError as e:
+                print(f"[leases] Could not release the lease on {lease.path.name}: {e}")
+
+    def _maybe_prune(self, lease_dir):
+        if self.prune_interval is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned.get(lease_dir, float("-inf")) < self.prune_interval:
+                return
+            self._pruned[lease_dir] = now
+        self.prune(lease_dir)
+
+    def prune(self, lease_dir):
+        """
+        Removes this stage's dead files from a lease folder: expired leases, temporary and
+        moved-aside files older than the TTL, and finished leases whose file is gone.
+        Returns:
+            int: Files removed.
+        """
+        suffix = f".{self.stage}.lease"
+        removed = 0
+        try:
+            entries = list(Path(lease_dir).iterdir())
+        except OSError:
+            return 0
+        for lease_path in entries:
+            name = lease_path.name
+            try:
+                if name.endswith(suffix):
+                    with self._lock:
+                        if lease_path in self._held:
+                            continue
+                    record = self._read(lease_path)
+                    source = Path(lease_dir).parent / name[:-len(suffix)]
+                    finished = record is not None and record.get("state") in (DONE, FAILED)
+                    if not (self._expired(lease_path, record) or (finished and not source.exists())):
+                        continue
+                    # Moved aside first, as in claim(): a worker may have just reclaimed it
+                    aside = lease_path.with_name(f"{name}.{self.worker_id}.expired")
+                    os.rename(lease_path, aside)
+                    if self._read(aside) != record:
+                        os.replace(aside, lease_path)
+                        continue
+                    lease_path = aside
+                elif suffix + "." in name and (name.endswith(".tmp") or name.endswith(".expired")):
+                    if time.time() - os.stat(lease_path).st_mtime <= self.ttl:
+                        continue
+                else:
+                    continue
+                os.remove(lease_path)
+                removed += 1
+            except OSError:
+                continue
+        if removed:
+            print(f"[leases] Pruned {removed} old lease file(s) from {lease_dir}.")
+        return removed
+
+    def close(self):
+        """
+        Stops renewing and removes the leases still held (abandoned jobs), so other workers
+        can take them straight away.
+        """
+        self._closed.set()
+        with self._lock:
+            leases = list(self._held.values())
+        for lease in leases:
+            lease.release()
+
+
+def claim_job(leases, path, ledger, requeue):
+    """
+    Claims `path` for this worker, for use in a watcher loop.
+    If another worker already finished it, that is recorded in `ledger`; if another worker is on
+    it, requeue(path, delay) is called to look again once its lease could have expired.
+    Returns:
+        Lease: The claimed lease, or None.
+    """
+    lease = leases.claim(path)
+    if lease is not None:
+        return lease
+    record = leases.holder(path) or {}
+    state = record.get("state")
+    if state == DONE:
+        ledger.mark_done(path)
+    elif state == FAILED:
+        ledger.mark_failed(path, f"failed on {record.get('worker')}")
+    else:
+        leases.defer(path, requeue)
+    return None
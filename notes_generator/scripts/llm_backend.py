@@ -0,0 +1,253 @@
+"""
+llm_backend.py
+--------------
+Long-lived LLM clients behind one interface, used by gemini_api.py.
+
+A backend is created once per process (get_backend()) and reused for every request, so the
+API is configured once, model objects are built once per model name, and HTTP connections
+stay open between requests instead of being set up again for each chunk.
+
+Backends:
+    GeminiBackend: Google Gemini through google-generativeai.
+    HTTPBackend: any local HTTP endpoint that speaks the small JSON protocol of the
+        bench_fakes.py stand-in server (POST {"model", "prompt", "text"} ->
+        {"text", "input_tokens", "output_tokens"}), over keep-alive connections.
+
+LLM_BACKEND in config.py selects the backend ("gemini" or "http"); LLM_HTTP_URL is the endpoint
+of the HTTP backend and LLM_TIMEOUT bounds each request. Every backend offers generate() for
+threads and generate_async() for asyncio code, and reports failures as LLMError with the HTTP
+status, so callers can tell throttling and transient errors (worth retrying) from the rest.
+"""
+
+import asyncio
+import functools
+import http.client
+import json
+import os
+import socket
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from config import LLM_BACKEND, LLM_HTTP_URL, LLM_TIMEOUT
+
+# Text of a response with its token counts (None when the backend does not report them)
+LLMResult = namedtuple("LLMResult", ["text", "input_tokens", "output_tokens"])
+
+# HTTP statuses worth retrying: throttled, or a temporary server-side problem
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class LLMError(RuntimeError):
+    """
+    A failed LLM request.
+    Attributes:
+        status (int): HTTP status, or None for timeouts and connection errors.
+        retry_after (float): Seconds the server asked us to wait, if it said.
+    """
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self):
+        """True for a 429 (quota exceeded)."""
+        return self.status == 429
+
+    @property
+    def retryable(self):
+        """True if the same request may succeed later."""
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+class LLMBackend:
+    """
+    Interface of an LLM backend. Subclasses implement generate(); generate_async() runs it in the
+    event loop's default executor unless the backend has a native async client.
+    """
+
+    name = "base"
+
+    def generate(self, model, prompt, text, timeout=LLM_TIMEOUT):
+        """
+        Sends one request and waits for the response.
+        Args:
+            model (str): Model name, e.g. "models/gemini-2.5-flash-lite".
+            prompt (str): The instruction for the LLM.
+            text (str): The input text to process.
+            timeout (float): Seconds before the request is abandoned.
+        Returns:
+            LLMResult: The response text and token counts.
+        """
+        raise NotImplementedError
+
+    async def generate_async(self, model, prompt, text, timeout=LLM_TIMEOUT):
+        """
+        Awaitable version of generate().
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.generate, model, prompt, text, timeout))
+
+    def close(self):
+        """Releases connections held by the backend."""
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Gemini through google-generativeai. The API key is set once and one GenerativeModel is kept
+    per model name; the library reuses its underlying client (and connections) across requests.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key=None):
+        """
+        Args:
+            api_key (str): Gemini API key (defaults to the GOOGLE_API_KEY environment variable).
+        Raises:
+            RuntimeError: If no API key is available.
+        """
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("GOOGLE_API_KEY environment variable not set.")
+        self._genai = genai
+        self._api_errors = google_exceptions
+        self._genai.configure(api_key=api_key)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model):
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = self._genai.GenerativeModel(model)
+            return self._models[model]
+
+    @staticmethod
+    def _result(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return LLMResult(response.text, None, None)
+        return LLMResult(response.text, usage.prompt_token_count, usage.candidates_token_count)
+
+    def _error(self, e):
+        if isinstance(e, self._api_errors.GoogleAPICallError):
+            return LLMError(f"Gemini API error: {e}", status=e.code)
+        # Retry errors raised before the server answered (deadline, network)
+        return LLMError(f"Gemini request failed: {e}")
+
+    def generate(self, model, prompt, text, timeout=LLM_TIMEOUT):
+        try:
+            response = self._model(model).generate_content([prompt, text], request_options={"timeout": timeout})
+        except (self._api_errors.GoogleAPIError, OSError) as e:
+            raise self._error(e) from e
+        return self._result(response)
+
+    async def generate_async(self, model, prompt, text, timeout=LLM_TIMEOUT):
+        try:
+            response = await self._model(model).generate_content_async([prompt, text],
+                                                                       request_options={"timeout": timeout})
+        except (self._api_errors.GoogleAPIError, OSError) as e:
+            raise self._error(e) from e
+        return self._result(response)
+
+
+class HTTPBackend(LLMBackend):
+    """
+    Local HTTP endpoint (e.g. bench_fakes.FakeLLMServer). Each thread keeps one persistent
+    HTTP/1.1 connection, reconnecting once if the server closed it between requests.
+    """
+
+    name = "http"
+
+    def __init__(self, url=LLM_HTTP_URL):
+        """
+        Args:
+            url (str): Endpoint URL, e.g. "http://127.0.0.1:8765/generate".
+        """
+        if not url:
+            raise RuntimeError("LLM_HTTP_URL is not set.")
+        parts = urlsplit(url)
+        self.url = url
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._netloc = parts.netloc
+        self._path = parts.path or "/"
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self, timeout):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connection_class(self._netloc, timeout=timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def _post(self, body, timeout):
+        connection = self._connection(timeout)
+        try:
+            connection.request("POST", self._path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = response.read()
+        except BaseException:
+            # Never reuse a connection that may still have a response in flight
+            connection.close()
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            connection.close()
+        return response, data
+
+    def generate(self, model, prompt, text, timeout=LLM_TIMEOUT):
+        body = json.dumps({"model": model, "prompt": prompt, "text": text}).encode("utf-8")
+        try:
+            try:
+                response, data = self._post(body, timeout)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server dropped the idle keep-alive connection; retry once on a fresh one
+                response, data = self._post(body, timeout)
+        except (OSError, http.client.HTTPException) as e:
+            kind = "timed out" if isinstance(e, socket.timeout) else f"failed: {e}"
+            raise LLMError(f"LLM endpoint request {kind}") from e
+        if response.status != 200:
+            retry_after = response.getheader("Retry-After")
+            raise LLMError(f"LLM endpoint returned HTTP {response.status}", status=response.status,
+                           retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        reply = json.loads(data)
+        return LLMResult(reply["text"], reply.get("input_tokens"), reply.get("output_tokens"))
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    HTTPBackend.name: HTTPBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the process-wide backend selected by LLM_BACKEND, creating it on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if LLM_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r} (expected one of {', '.join(BACKENDS)})")
+            _backend = BACKENDS[LLM_BACKEND]()
+        return _backend
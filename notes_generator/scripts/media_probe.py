@@ -0,0 +1,33 @@
+"""
+media_probe.py
+--------------
+ffprobe helpers, kept apart from converter.py so the scheduler can size media jobs without
+importing the converter (NumPy, dedup, and its output folder setup).
+
+Usage:
+    duration = probe_duration(path)    # seconds, or None; raises ProbeError
+"""
+
+import ffmpeg  # ffmpeg-python package
+
+# Raised when ffprobe fails on a file (OSError if ffprobe is not installed)
+ProbeError = ffmpeg.Error
+
+
+def probe_audio(media_path):
+    """
+    Runs ffprobe on a media file and returns its first audio stream.
+    Returns:
+        dict: ffprobe stream info (codec_name, sample_rate, channels, ...), or None if there is no audio.
+    """
+    info = ffmpeg.probe(str(media_path), select_streams='a')
+    streams = info.get('streams', [])
+    return streams[0] if streams else None
+
+
+def probe_duration(media_path):
+    """
+    Runs ffprobe on a media file and returns its duration in seconds, or None if not reported.
+    """
+    duration = ffmpeg.probe(str(media_path)).get('format', {}).get('duration')
+    return float(duration) if duration else None
@@ -0,0 +1,210 @@
+"""
+metrics.py
+----------
+Lightweight instrumentation shared by the pipeline scripts.
+
+Two kinds of measurements:
+    - spans: timed operations (an ffmpeg conversion, a Whisper run, a Gemini call), with
+      attributes such as the file name, media seconds processed or token counts;
+    - counters: running totals (requests, errors, cache hits, tokens).
+
+Every span and counter increment is appended as one JSON line to METRICS_FILE, which all
+pipeline processes share and pipeline_dashboard.py reads for its metrics panel. Lines are
+buffered and written in batches by flush(): every METRICS_FLUSH_INTERVAL seconds, once
+METRICS_FLUSH_LINES are waiting, and at exit. Each
+process also keeps totals in memory and rewrites its own Prometheus textfile in METRICS_DIR
+(notes_pipeline_<process>.prom), so node_exporter's textfile collector can scrape them.
+
+Usage:
+    with metrics.span("transcribe", file=path.name) as s:
+        ...
+        s["media_seconds"] = duration
+    metrics.count("gemini_errors")
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import (
+    METRICS_ENABLED, METRICS_DIR, METRICS_FILE, METRICS_PROM_INTERVAL, METRICS_FLUSH_INTERVAL, METRICS_FLUSH_LINES,
+)
+
+_lock = threading.Lock()
+_prom_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+# span name -> [count, total seconds, errors]
+_spans = {}
+_last_prom_write = 0.0
+# JSONL lines not yet written to METRICS_FILE, and the timer that will write them
+_buffer = []
+_flush_timer = None
+
+
+def _process_name():
+    return Path(sys.argv[0]).stem or "python"
+
+
+def _append(record):
+    """Buffers one record for the shared JSONL file."""
+    global _flush_timer
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _lock:
+        _buffer.append(line)
+        full = len(_buffer) >= METRICS_FLUSH_LINES
+        if not full and _flush_timer is None:
+            _flush_timer = threading.Timer(METRICS_FLUSH_INTERVAL, flush)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+    if full:
+        flush()
+
+
+def flush():
+    """
+    Appends the buffered records to METRICS_FILE.
+    """
+    global _flush_timer
+    with _lock:
+        lines = _buffer[:]
+        _buffer.clear()
+        timer, _flush_timer = _flush_timer, None
+    if timer is not None:
+        timer.cancel()
+    if not lines:
+        return
+    try:
+        METRICS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        # One write per batch in append mode, so batches from several processes don't interleave
+        fd = os.open(METRICS_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, "".join(lines).encode("utf-8"))
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"[metrics] Could not write {METRICS_FILE.name}: {e}")
+
+
+def record(name, duration, ok=True, error=None, start=None, **attrs):
+    """
+    Records a span that was timed elsewhere (e.g. queue wait computed from timestamps).
+    Args:
+        name (str): Span name, e.g. "convert" or "gemini_call".
+        duration (float): Seconds.
+        ok (bool): False if the operation failed.
+        error (str): Error message for failed operations.
+        start (float): Start time (time.time()); defaults to now minus duration.
+        **attrs: Extra fields, e.g. file, media_seconds, input_tokens.
+    """
+    if not METRICS_ENABLED:
+        return
+    end = time.time()
+    entry = {"type": "span", "name": name, "start": start if start is not None else end - duration,
+             "end": end, "duration": round(duration, 4), "ok": ok, "process": _process_name(), "pid": os.getpid()}
+    if error is not None:
+        entry["error"] = str(error)[:500]
+    entry.update(attrs)
+    with _lock:
+        stats = _spans.setdefault(name, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] += 0 if ok else 1
+    _append(entry)
+    _maybe_write_prom()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the enclosed block and records it as a span. Yields a dict that the block can add
+    attributes to (e.g. media_seconds once known). Exceptions are recorded and re-raised.
+    """
+    fields = dict(attrs)
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        record(name, time.perf_counter() - t0, ok=False, error=str(e) or type(e).__name__, start=start, **fields)
+        raise
+    record(name, time.perf_counter() - t0, start=start, **fields)
+
+
+def count(name, value=1, **labels):
+    """
+    Adds `value` to a counter, e.g. count("gemini_output_tokens", 812).
+    """
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _append({"type": "counter", "name": name, "value": value, "time": time.time(),
+             "process": _process_name(), "pid": os.getpid(), **labels})
+    _maybe_write_prom()
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (None if it is empty)."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _metric_name(name):
+    return "notes_pipeline_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def write_prom():
+    """
+    Rewrites this process's Prometheus textfile with its current totals.
+    """
+    global _last_prom_write
+    if not METRICS_ENABLED or not (_spans or _counters):
+        return
+    process = _process_name()
+    lines = []
+    with _lock:
+        _last_prom_write = time.monotonic()
+        for name, (n, total, errors) in sorted(_spans.items()):
+            labels = _labels((("span", name), ("process", process)))
+            lines.append(f"notes_pipeline_span_seconds_sum{labels} {total:.6f}")
+            lines.append(f"notes_pipeline_span_seconds_count{labels} {n}")
+            lines.append(f"notes_pipeline_span_errors_total{labels} {errors}")
+        for (name, label_pairs), value in sorted(_counters.items()):
+            labels = _labels(label_pairs + (("process", process),))
+            lines.append(f"{_metric_name(name)}_total{labels} {value}")
+    path = METRICS_DIR / f"notes_pipeline_{process}.prom"
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with _prom_lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[metrics] Could not write {path.name}: {e}")
+
+
+def _maybe_write_prom():
+    if time.monotonic() - _last_prom_write >= METRICS_PROM_INTERVAL:
+        write_prom()
+
+
+atexit.register(write_prom)
+atexit.register(flush)
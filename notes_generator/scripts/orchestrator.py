@@ -0,0 +1,327 @@
+"""
+orchestrator.py
+---------------
+Runs the whole pipeline (convert -> transcribe -> edit) in a single process.
+
+Instead of three watcher processes that each poll a folder and spawn a fresh script per
+file, the orchestrator connects the stages with in-memory queues. Each stage has its own
+pool of worker threads (ORCHESTRATOR_WORKERS in config.py) and hands its output straight
+to the next stage's queue, so no directory rescan sits between stages. Each queue hands out
+the job predicted to be quickest first (scheduler.py), with aging and manual priorities.
+
+The stage functions are the existing ones: converter.extract_audio, transcriber.transcribe
+(with one warm Whisper model per worker thread) and editor.process_transcript.
+The job ledger (job_ledger.py) is shared with the standalone watchers, so the two modes can be
+swapped without reprocessing anything. With DISTRIBUTED_WORKERS, each stage claims its inputs
+through lease files (leases.py), so orchestrators and watchers on several machines can share the
+same folders.
+
+With STREAMING_HANDOFF = True the convert and transcribe steps are merged into one stage
+(stream_handoff.py): the video's audio is decoded straight to PCM and handed to Whisper in
+memory, so each video goes from the first stage directly to the edit stage.
+
+With STREAM_TRANSCRIPTS = True, a file entering transcription also queues its segment stream
+(segment_stream.py) into the edit stage right away, so Gemini formatting runs alongside Whisper
+instead of after it.
+
+On startup, audio files and transcripts left over from earlier runs are queued into
+their stages; new .mp4 files are then fed into the first stage as they appear.
+
+The orchestrator is controlled like the watchers (control.py, used by stop_pipeline.py): pause
+holds every stage's next job, drain lets each stage finish the job it is running and start no
+other, and stop-now (or STOP_PIPELINE) exits at once, abandoning the jobs in progress.
+
+Usage:
+    python orchestrator.py
+"""
+
+import threading
+import time
+
+import setproctitle
+
+from config import (
+    WATCHED_VIDEOS_DIR, AUDIO_DIR, AUDIO_PATTERNS, TRANSCRIPTS_DIR, ORCHESTRATOR_WORKERS, STREAMING_HANDOFF,
+    TRANSCRIBE_SEGMENTED, STREAM_TRANSCRIPTS,
+)
+from fs_watch import DirectoryWatcher
+import control
+import dedup
+import metrics
+from converter import extract_audio
+from transcriber import load_model, model_variant, transcribe, SegmentPool
+from editor import process_transcript, process_stream
+from stream_handoff import convert_and_transcribe
+from job_ledger import JobLedger, DONE, FAILED
+from leases import LeaseManager, claim_job
+from readiness import ReadinessTracker
+from scheduler import new_queue
+from segment_stream import segments_path, is_segments_file, remove_stream
+
+
+class Stage:
+    """
+    One pipeline stage: a queue of input paths and a set of worker threads running `func`.
+    Each successful result is passed to `next_stage`.
+    """
+
+    def __init__(self, name, func, workers, ledger, next_stage=None, leases=None, control=None):
+        """
+        Args:
+            name (str): Stage name used in log lines.
+            func (callable): Takes an input Path, returns the output Path (or None).
+            workers (int): Number of worker threads.
+            ledger (JobLedger): Ledger tracking this stage's inputs.
+            next_stage (Stage): Stage that receives this stage's outputs.
+            leases (LeaseManager): Claims inputs against other workers (default: one for the ledger's stage).
+            control (control.Controller): The process's controller; workers hold their next job while
+                it is paused and exit instead of starting one once it drains or stops.
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.ledger = ledger
+        self.next_stage = next_stage
+        self.leases = leases or LeaseManager(ledger.stage)
+        self.control = control
+        # Shortest predicted job first, with aging and manual priorities (scheduler.py)
+        self.queue = new_queue(ledger.stage, workers)
+        # Inputs queued or in progress, so the same file is never queued twice
+        self._active = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+
+    def start(self):
+        """
+        Starts the worker threads.
+        """
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i+1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Tells the workers to exit once the items already queued are done.
+        """
+        for _ in self._threads:
+            self.queue.put(None)
+
+    def running(self):
+        """Number of jobs in progress."""
+        with self._lock:
+            return self._running
+
+    def join(self):
+        """
+        Waits for the workers to exit after stop(), unless stop-now cuts the wait short.
+        """
+        for thread in self._threads:
+            while thread.is_alive() and not (self.control is not None and self.control.stopping):
+                thread.join(0.2)
+
+    def submit(self, path):
+        """
+        Queues an input file unless it has already been processed or is already queued.
+        Returns:
+            bool: True if the file was queued.
+        """
+        key = str(path.resolve())
+        with self._lock:
+            if self.ledger.is_processed(path) or key in self._active:
+                return False
+            self._active.add(key)
+        self.ledger.mark_queued(path)
+        self.queue.put((path, time.time()))
+        return True
+
+    def _submit_later(self, path, delay):
+        """
+        Queues a file again after `delay` seconds (it is leased to another worker).
+        """
+        timer = threading.Timer(delay, self.submit, args=(path,))
+        timer.daemon = True
+        timer.start()
+
+    def _work(self):
+        """
+        Worker loop: runs the stage function and forwards the result to the next stage.
+        """
+        while True:
+            item = self.queue.get()
+            # Hold the job while paused; leave it queued (it is picked up again on the next start)
+            # once the process drains or stops
+            if item is None or (self.control is not None and not self.control.wait_until_runnable()):
+                break
+            path, queued_at = item
+            metrics.record("queue_wait", time.time() - queued_at, start=queued_at, stage=self.name, file=path.name)
+            lease = claim_job(self.leases, path, self.ledger, self._submit_later)
+            if lease is None:
+                with self._lock:
+                    self._active.discard(str(path.resolve()))
+                continue
+            result = None
+            self.ledger.mark_started(path)
+            with self._lock:
+                self._running += 1
+            try:
+                result = self.func(path)
+            except Exception as e:
+                print(f"[orchestrator] Error in {self.name} stage for {path.name}: {e}")
+                self.ledger.mark_failed(path, e)
+                # Failed edits are retried, so leave them to whichever worker gets there first
+                lease.release(FAILED if FAILED in self.ledger.finished_states else None)
+            else:
+                self.ledger.mark_done(path)
+                lease.release(DONE)
+            with self._lock:
+                self._active.discard(str(path.resolve()))
+                self._running -= 1
+            if result is not None and self.next_stage is not None:
+                self.next_stage.submit(result)
+
+
+_models = threading.local()
+# Shared by all transcribe workers; its processes start on the first long recording
+_segment_pool = SegmentPool() if TRANSCRIBE_SEGMENTED else None
+
+
+def _thread_model():
+    """
+    Returns a Whisper model that stays loaded for the lifetime of the worker thread.
+    """
+    if getattr(_models, "model", None) is None:
+        _models.model = load_model()
+    return _models.model
+
+
+def transcribe_stage(mp3_path):
+    """
+    Transcribes an audio file with the worker thread's model.
+    """
+    return transcribe(mp3_path, model=_thread_model(), segment_pool=_segment_pool)
+
+
+def handoff_stage(mp4_path):
+    """
+    Converts and transcribes a video in one step, passing the audio to Whisper in memory.
+    """
+    return convert_and_transcribe(mp4_path, model=_thread_model(), segment_pool=_segment_pool)
+
+
+def edit_stage(txt_path):
+    """
+    Formats and summarizes a transcript. Last stage, so there is nothing to hand on.
+    """
+    process_transcript(txt_path)
+    return None
+
+
+def streamed(func, edit):
+    """
+    Wraps a transcribing stage function for STREAM_TRANSCRIPTS: the file's segment stream is
+    queued into the edit stage before transcription starts, and the finished .txt is not handed
+    on (its notes are already being written from the stream).
+    """
+    def run(path):
+        # A copy of a recording transcribed before gets no stream; pass its reused .txt on instead
+        reused = dedup.reuse("transcribe", path, model_variant(_thread_model()))
+        if reused:
+            return reused[0]
+        edit.submit(segments_path(path))
+        func(path)
+        return None
+    return run
+
+
+def stream_edit_stage(edit_ledger, edit_leases):
+    """
+    Returns the edit stage function for streaming mode: segment streams are edited while they
+    grow, and on success their .txt is recorded as done so it is not edited again later, and
+    the stream is deleted.
+    """
+    def run(path):
+        if not is_segments_file(path):
+            return edit_stage(path)
+        txt_path = process_stream(path)
+        edit_ledger.mark_done(txt_path)
+        edit_leases.finish(txt_path)
+        remove_stream(path)
+        return None
+    return run
+
+
+def build_pipeline(workers=ORCHESTRATOR_WORKERS, streaming=STREAMING_HANDOFF, stream_transcripts=STREAM_TRANSCRIPTS,
+                   control=None):
+    """
+    Creates the three stages wired together.
+    In streaming mode the first stage converts and transcribes, and feeds the edit stage directly;
+    the transcribe stage then only handles audio files already sitting in AUDIO_DIR.
+    With stream_transcripts, the edit stage works from segment streams while transcription runs.
+    Every stage follows `control`, the process's controller (if given).
+    Returns:
+        tuple: (convert, transcribe, edit) Stage objects.
+    """
+    edit_ledger = JobLedger("edit", retry_failed=True)
+    edit_leases = LeaseManager("edit")
+    if stream_transcripts:
+        edit = Stage("edit", stream_edit_stage(edit_ledger, edit_leases), workers["edit"], edit_ledger,
+                     leases=edit_leases, control=control)
+        transcribe_func, handoff_func = streamed(transcribe_stage, edit), streamed(handoff_stage, edit)
+    else:
+        edit = Stage("edit", edit_stage, workers["edit"], edit_ledger, leases=edit_leases, control=control)
+        transcribe_func, handoff_func = transcribe_stage, handoff_stage
+    transcribe_ = Stage("transcribe", transcribe_func, workers["transcribe"], JobLedger("transcribe"), next_stage=edit,
+                        control=control)
+    if streaming:
+        # Whisper-bound, so it gets the transcribe worker count
+        convert = Stage("convert+transcribe", handoff_func, workers["transcribe"], JobLedger("convert"), next_stage=edit,
+                        control=control)
+    else:
+        convert = Stage("convert", extract_audio, workers["convert"], JobLedger("convert"), next_stage=transcribe_,
+                        control=control)
+    return convert, transcribe_, edit
+
+
+def main():
+    """
+    Starts the stages, queues leftovers from earlier runs and feeds new videos into the pipeline.
+    Exits on stop-now or drain, or when the STOP_PIPELINE file is created.
+    """
+    setproctitle.setproctitle("orchestrator.py")
+    controller = control.serve("orchestrator")
+    convert, transcribe_, edit = stages = build_pipeline(control=controller)
+    controller.in_flight = lambda: sum(stage.running() for stage in stages)
+    for stage in stages:
+        stage.start()
+    # Pick up work the standalone watchers (or an earlier run) left unfinished
+    for pattern in AUDIO_PATTERNS:
+        for file in sorted(AUDIO_DIR.glob(pattern)):
+            transcribe_.submit(file)
+    for file in sorted(TRANSCRIPTS_DIR.glob("*.txt")):
+        edit.submit(file)
+
+    print(f"[orchestrator] Watching {WATCHED_VIDEOS_DIR} for new .mp4 files...")
+    readiness = ReadinessTracker("orchestrator")
+    with DirectoryWatcher(WATCHED_VIDEOS_DIR, '*.mp4', control=controller) as watcher:
+        for file in watcher:
+            if convert.ledger.is_processed(file):
+                continue
+            # Videos still being copied in are re-checked later instead of blocking the feed
+            if not readiness.ready(file, watcher):
+                continue
+            if convert.submit(file):
+                print(f"[orchestrator] New file detected: {file.name}")
+    print("[orchestrator] Stop requested. Exiting orchestrator.")
+    for stage in stages:
+        stage.stop()
+    if controller.state == control.DRAINING:
+        print(f"[orchestrator] Draining: waiting for {controller.in_flight()} job(s) in progress to finish.")
+        for stage in stages:
+            stage.join()
+    # Otherwise, worker threads are daemons: like the watchers, in-flight work is abandoned on exit
+
+
+if __name__ == "__main__":
+    main()
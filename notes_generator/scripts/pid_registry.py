@@ -0,0 +1,114 @@
+"""
+pid_registry.py
+---------------
+Small registry of running pipeline processes, one JSON file per process in PID_DIR.
+
+Each watcher (and the orchestrator) registers itself on startup with its PID, process start
+time and the address of its control channel (control.py), and the file is removed again when
+it exits. The dashboard and stop script can then check a process with a single
+psutil.Process(pid) call instead of scanning every process on the machine, and send it
+commands directly. The start time guards against a recycled PID being mistaken for a
+watcher after a crash left its file behind.
+"""
+
+import atexit
+import json
+import os
+from pathlib import Path
+
+import psutil
+
+from config import PID_DIR
+
+
+def _pid_file(name, pid_dir=PID_DIR):
+    return Path(pid_dir) / f"{name}.json"
+
+
+def register(name, pid_dir=PID_DIR, control=None):
+    """
+    Records the current process under `name` and removes the record again at exit.
+    If another running process is registered under `name` (a second copy of a watcher with
+    DISTRIBUTED_WORKERS), this one is recorded as <name>-<pid> instead.
+    Args:
+        name (str): Process name, e.g. "video_watcher".
+        pid_dir (Path): Registry folder.
+        control (str): Address of the process's control channel (control.py), if it has one.
+    Returns:
+        Path: The registry file.
+    """
+    running, pid = process_status(name, pid_dir)
+    if running and pid != os.getpid():
+        name = f"{name}-{os.getpid()}"
+    path = _pid_file(name, pid_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    record = {"name": name, "pid": os.getpid(), "started": psutil.Process().create_time()}
+    if control is not None:
+        record["control"] = control
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+    atexit.register(unregister, name, pid_dir)
+    return path
+
+
+def unregister(name, pid_dir=PID_DIR):
+    """
+    Removes the record for `name` if it belongs to the current process.
+    """
+    record = read(name, pid_dir)
+    if record is not None and record.get("pid") == os.getpid():
+        try:
+            _pid_file(name, pid_dir).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def read(name, pid_dir=PID_DIR):
+    """
+    Returns the registry record for `name` as a dict, or None if there is none.
+    """
+    try:
+        with open(_pid_file(name, pid_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def registered(pid_dir=PID_DIR):
+    """
+    Returns the records of every registered process, keyed by name.
+    """
+    records = {}
+    for path in sorted(Path(pid_dir).glob("*.json")):
+        record = read(path.stem, pid_dir)
+        if record is not None:
+            records[path.stem] = record
+    return records
+
+
+def process_status(name, pid_dir=PID_DIR):
+    """
+    Checks whether the process registered as `name` is still running.
+    Returns:
+        tuple: (is_running, pid), with pid None if nothing is registered.
+    """
+    record = read(name, pid_dir)
+    if record is None:
+        return False, None
+    return is_alive(record["pid"], record["started"]), record["pid"]
+
+
+def is_alive(pid, started):
+    """
+    Checks whether process `pid`, started at `started` (a psutil create_time), still runs.
+    """
+    try:
+        proc = psutil.Process(pid)
+        # A different start time means the PID now belongs to some other process
+        return abs(proc.create_time() - started) < 1 and proc.status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+    except psutil.AccessDenied:
+        return True
@@ -5,20 +5,28 @@ pipeline_dashboard.py
 TUI Dashboard for Notes Generator Pipeline using rich.
 
 Shows live status of video, audio, and transcript watchers, including their PIDs and recent log output.
+Logs are followed incrementally (LogTailer reads only newly appended bytes), and watcher status
+comes from the PID registry the watchers write on startup (pid_registry.py).
+A second panel shows rolling throughput, p50/p95 latency per stage and error rates from the
+metrics file (metrics.py).
 Press 'q' to stop the pipeline and exit the dashboard (calls stop_pipeline.py).
 """
 
+import json
 import time
+from collections import deque
 from pathlib import Path
 from rich.live import Live
 from rich.table import Table
 from rich.panel import Panel
-from rich.console import Console
+from rich.console import Console, Group
 from rich.text import Text
 import sys
 import threading
 import platform
-import psutil
+import pid_registry
+from config import METRICS_FILE, METRICS_WINDOW_MINUTES
+from metrics import percentile
 if platform.system() == "Windows":
     import msvcrt
 
@@ -38,22 +46,204 @@ def get_logs_dict(log_dir):
 
 console = Console()
 
-def tail_log(path, n=10, filter_errors=False):
+# Lines that look like real errors (matched case-insensitively) in the stderr logs
+ERROR_KEYWORDS = ["error", "fail", "denied", "not found", "exception", "traceback"]
+# How much of an existing log to read when the dashboard starts
+INITIAL_TAIL_BYTES = 256 * 1024
+# How much of the metrics file to read when the dashboard starts
+METRICS_BACKFILL_BYTES = 4 * 1024 * 1024
+
+
+class FileFollower:
     """
-    Returns the last n lines from a log file. Optionally filters for error lines.
+    Incrementally follows a file that is appended to. Keeps the byte offset it has read up to
+    and hands out only the complete lines appended since the last poll, so each refresh costs
+    only the new bytes instead of the whole file.
     """
-    if not path.exists():
-        return ["(no log)"]
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        lines = f.readlines()
-    if filter_errors:
-        # Only keep lines that look like real errors (case-insensitive)
-        error_keywords = ["error", "fail", "denied", "not found", "exception", "traceback"]
-        filtered = [l for l in lines if any(k in l.lower() for k in error_keywords)]
-        lines = filtered if filtered else ["(no errors detected)"]
-    return lines[-n:] if len(lines) >= n else lines
 
-def make_dashboard(logs):
+    def __init__(self, path, backfill_bytes=INITIAL_TAIL_BYTES):
+        """
+        Args:
+            path (Path): File to follow (it may not exist yet).
+            backfill_bytes (int): How much of an existing file to read on the first poll.
+        """
+        self.path = Path(path)
+        self.backfill_bytes = backfill_bytes
+        self._offset = None
+        self._partial = b""
+
+    def reset(self):
+        """Called when the file is (re)opened from scratch; subclasses drop their buffers."""
+
+    def new_lines(self):
+        """
+        Returns the complete lines appended since the last call, as bytes. A file that shrank
+        (truncated or replaced) is read again from the start.
+        """
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            self._offset = None
+            return []
+        skip_first = False
+        if self._offset is None or size < self._offset:
+            self.reset()
+            self._partial = b""
+            # Start near the end of an existing file; the first, partial line is dropped
+            self._offset = max(0, size - self.backfill_bytes)
+            skip_first = self._offset > 0
+        if size == self._offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        self._offset += len(data)
+        *complete, self._partial = (self._partial + data).split(b"\n")
+        if skip_first and complete:
+            complete = complete[1:]
+        return [line.rstrip(b"\r") for line in complete]
+
+
+class LogTailer(FileFollower):
+    """
+    Follows a log file and holds the last `n` lines (or error lines) in a ring buffer.
+    """
+
+    def __init__(self, path, n=10, filter_errors=False):
+        """
+        Args:
+            path (Path): Log file to follow (it may not exist yet).
+            n (int): Number of lines to keep.
+            filter_errors (bool): Only keep lines that look like errors.
+        """
+        super().__init__(path)
+        self.filter_errors = filter_errors
+        self.lines = deque(maxlen=n)
+
+    def reset(self):
+        self.lines.clear()
+
+    def poll(self):
+        """
+        Reads any lines appended since the last call into the ring buffer.
+        """
+        for raw_line in self.new_lines():
+            line = raw_line.decode("utf-8", errors="ignore")
+            if self.filter_errors and not any(k in line.lower() for k in ERROR_KEYWORDS):
+                continue
+            self.lines.append(line + "\n")
+
+    def tail(self):
+        """
+        Returns the buffered lines, or a placeholder if there are none.
+        """
+        if not self.path.exists():
+            return ["(no log)"]
+        if not self.lines and self.filter_errors:
+            return ["(no errors detected)"]
+        return list(self.lines)
+
+
+class MetricsWindow(FileFollower):
+    """
+    Follows the metrics file (metrics.py) and keeps the spans that ended within the last
+    `window_minutes`, to report rolling throughput, latency percentiles and error rates.
+    """
+
+    def __init__(self, path=METRICS_FILE, window_minutes=METRICS_WINDOW_MINUTES):
+        super().__init__(path, backfill_bytes=METRICS_BACKFILL_BYTES)
+        self.window = window_minutes * 60
+        self.spans = deque()
+
+    def reset(self):
+        self.spans.clear()
+
+    def poll(self):
+        """
+        Reads new span records and drops the ones that fell out of the window.
+        """
+        for raw_line in self.new_lines():
+            try:
+                record = json.loads(raw_line)
+            except ValueError:
+                continue
+            if record.get("type") == "span":
+                self.spans.append(record)
+        cutoff = time.time() - self.window
+        while self.spans and self.spans[0]["end"] < cutoff:
+            self.spans.popleft()
+
+    def summary(self):
+        """
+        Returns:
+            dict: Span name -> {count, errors, p50, p95, media_seconds, busy_seconds}.
+        """
+        stats = {}
+        for record in self.spans:
+            s = stats.setdefault(record["name"], {"durations": [], "errors": 0, "media_seconds": 0.0, "busy_seconds": 0.0})
+            if record.get("ok", True):
+                s["durations"].append(record["duration"])
+                if record.get("media_seconds"):
+                    s["media_seconds"] += record["media_seconds"]
+                    s["busy_seconds"] += record["duration"]
+            else:
+                s["errors"] += 1
+        for s in stats.values():
+            durations = sorted(s.pop("durations"))
+            s["count"] = len(durations)
+            s["p50"] = percentile(durations, 0.5)
+            s["p95"] = percentile(durations, 0.95)
+        return stats
+
+    def throughput(self):
+        """
+        Media minutes transcribed per wall-clock minute over the window (or since the first
+        span in it, if that is more recent).
+        """
+        done = [r for r in self.spans if r["name"] == "transcribe" and r.get("ok", True)]
+        if not done:
+            return None
+        elapsed = min(self.window, time.time() - min(r["start"] for r in self.spans))
+        return sum(r.get("media_seconds") or 0 for r in done) / max(elapsed, 1)
+
+
+def make_metrics_panel(window):
+    """
+    Builds a rich Panel with rolling throughput, p50/p95 latency per stage and error rates.
+    """
+    window.poll()
+    stats = window.summary()
+    table = Table(expand=True)
+    table.add_column("Stage", style="bold cyan", no_wrap=True)
+    table.add_column("Done", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Error rate", justify="right")
+    table.add_column("p50 s", justify="right")
+    table.add_column("p95 s", justify="right")
+    table.add_column("x realtime", justify="right")
+    for name, s in sorted(stats.items()):
+        total = s["count"] + s["errors"]
+        realtime = f"{s['media_seconds'] / s['busy_seconds']:.1f}" if s["busy_seconds"] else ""
+        table.add_row(
+            name, str(s["count"]), str(s["errors"]), f"{s['errors'] / total:.0%}" if total else "",
+            f"{s['p50']:.2f}" if s["p50"] is not None else "", f"{s['p95']:.2f}" if s["p95"] is not None else "",
+            realtime,
+        )
+    throughput = window.throughput()
+    rate = f"{throughput:.2f} media min / wall min" if throughput is not None else "no transcriptions yet"
+    minutes = window.window // 60
+    return Panel(table if stats else Text("(no metrics recorded yet)"),
+                 title=f"Last {minutes:.0f} min: {rate}", border_style="blue")
+
+
+def make_tailers(logs, n=10):
+    """
+    Creates one LogTailer per log; only the err logs are filtered for errors.
+    """
+    return {name: LogTailer(path, n, filter_errors=name.endswith("(err)")) for name, path in logs.items()}
+
+
+def make_dashboard(tailers):
     """
     Builds and returns a rich Panel containing a table of watcher status and recent logs.
     """
@@ -62,34 +252,21 @@ def make_dashboard(logs):
     table.add_column("Status", style="bold green", no_wrap=True)
     table.add_column("Last 10 Log Lines", style="white")
 
-    # Helper to check if a watcher process is running
-    def get_watcher_process_info(watcher_name):
-        """Return (is_running, pid) for the first matching process, else (False, '')"""
-        for proc in psutil.process_iter(['cmdline', 'pid']):
-            try:
-                cmdline = ' '.join(proc.info['cmdline']) if proc.info['cmdline'] else ''
-                if watcher_name in cmdline:
-                    return True, proc.info['pid']
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-        return False, ''
-
+    # Names the watchers register under in the PID registry
     watcher_map = {
-        "Video Watcher": "video_watcher.py",
-        "Audio Watcher": "audio_watcher.py",
-        "Transcript Watcher": "transcript_watcher.py",
+        "Video Watcher": "video_watcher",
+        "Audio Watcher": "audio_watcher",
+        "Transcript Watcher": "transcript_watcher",
     }
 
-    for name, log_path in logs.items():
-        # Only filter for errors in err logs
-        filter_errors = name.endswith("(err)")
-        log_lines = tail_log(log_path, 10, filter_errors=filter_errors)
-        log_text = "".join(log_lines).strip()
+    for name, tailer in tailers.items():
+        tailer.poll()
+        log_text = "".join(tailer.tail()).strip()
         # Determine watcher type for status
         base_name = name.split()[0] + " Watcher"
         status = ""
-        if base_name in watcher_map and not filter_errors:
-            is_running, pid = get_watcher_process_info(watcher_map[base_name])
+        if base_name in watcher_map and not tailer.filter_errors:
+            is_running, pid = pid_registry.process_status(watcher_map[base_name])
             if is_running:
                 status = f"Running (PID: {pid})"
             else:
@@ -111,7 +288,7 @@ def main():
     Main entry point for the dashboard. Monitors watcher status and logs, and allows stopping the pipeline with 'q'.
     """
     log_dir = sys.argv[1] if len(sys.argv) > 1 else "notes_generator/logs"
-    logs = get_logs_dict(log_dir)
+    tailers = make_tailers(get_logs_dict(log_dir))
     print("Press 'q' to stop the pipeline and exit dashboard.")
     stop_event = threading.Event()
 
@@ -137,10 +314,15 @@ def main():
     listener_thread.start()
 
 
-    with Live(make_dashboard(logs), refresh_per_second=1, console=console) as live:
+    metrics_window = MetricsWindow()
+
+    def render():
+        return Group(make_dashboard(tailers), make_metrics_panel(metrics_window))
+
+    with Live(render(), refresh_per_second=1, console=console) as live:
         while not stop_event.is_set():
             time.sleep(1)
-            live.update(make_dashboard(logs))
+            live.update(render())
 
     stop_pipeline()
 
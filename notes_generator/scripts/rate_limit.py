@@ -0,0 +1,206 @@
+"""
+rate_limit.py
+-------------
+Adaptive token-bucket rate limiter for LLM requests, shared by every pipeline process.
+
+Two buckets are kept, one for requests per minute and one for (input) tokens per minute, and a
+request may only start when both have room. The bucket levels live in one SQLite row
+(RATE_LIMIT_DB) that every process updates in an immediate transaction, so several editor.py
+runs, the orchestrator and the watchers together stay under one quota instead of each assuming
+it has the whole quota to itself.
+
+The limiter adapts to the quota it actually gets: a 429 response halves the rate (down to
+RATE_LIMIT_MIN_FACTOR of the configured quota) and pauses new requests for the server's
+Retry-After, and every success raises it again by RATE_LIMIT_RECOVERY, up to the full quota.
+backoff_delay() gives the jittered exponential wait before retrying a failed request.
+"""
+
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    RATE_LIMIT_DB, GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE, RATE_LIMIT_BURST_SECONDS,
+    RATE_LIMIT_MIN_FACTOR, RATE_LIMIT_RECOVERY, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    factor REAL NOT NULL,
+    blocked_until REAL NOT NULL,
+    last_decrease REAL NOT NULL
+);
+"""
+
+# 429s that arrive together (several requests in flight) only lower the rate once
+_DECREASE_COOLDOWN = 10.0
+
+
+def backoff_delay(attempt, retry_after=None, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_MAX):
+    """
+    Seconds to wait before retry number `attempt` (0-based): exponential with "equal jitter",
+    i.e. uniformly between half and all of min(cap, base * 2**attempt), and never less than
+    the server's Retry-After.
+    """
+    delay = min(cap, base * 2 ** attempt)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    return max(delay, retry_after or 0)
+
+
+class SharedRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets stored in SQLite.
+    Safe to share between threads; separate processes coordinate through the database.
+    """
+
+    def __init__(self, name="gemini", requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=GEMINI_TOKENS_PER_MINUTE, db_path=RATE_LIMIT_DB):
+        """
+        Args:
+            name (str): Quota name; limiters with the same name share buckets.
+            requests_per_minute (float): Request quota (None or 0 = unlimited).
+            tokens_per_minute (float): Input token quota (None or 0 = unlimited).
+            db_path (Path): SQLite database holding the buckets.
+        """
+        self.name = name
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        self.enabled = bool(self.requests_per_minute or self.tokens_per_minute)
+        self._lock = threading.Lock()
+        self._conn = None
+        if self.enabled:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def _capacity(self, per_minute):
+        return max(1.0, per_minute * RATE_LIMIT_BURST_SECONDS / 60)
+
+    def _update(self, change):
+        """
+        Runs change(state, now) on the refilled bucket state in one immediate transaction and
+        saves the state. Returns what change() returns.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT requests, tokens, updated, factor, blocked_until, last_decrease FROM buckets WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                if row is None:
+                    state = {"requests": self._capacity(self.requests_per_minute),
+                             "tokens": self._capacity(self.tokens_per_minute),
+                             "updated": now, "factor": 1.0, "blocked_until": 0.0, "last_decrease": 0.0}
+                else:
+                    state = dict(zip(("requests", "tokens", "updated", "factor", "blocked_until", "last_decrease"), row))
+                # Refill both buckets at the current (adapted) rate for the time since the last update
+                elapsed = max(0.0, now - state["updated"])
+                for key, per_minute in (("requests", self.requests_per_minute), ("tokens", self.tokens_per_minute)):
+                    if per_minute:
+                        state[key] = min(self._capacity(per_minute),
+                                         state[key] + elapsed * per_minute * state["factor"] / 60)
+                state["updated"] = now
+                result = change(state, now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, requests, tokens, updated, factor, blocked_until, last_decrease)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.name, state["requests"], state["tokens"], state["updated"], state["factor"],
+                     state["blocked_until"], state["last_decrease"]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _take(self, state, now, tokens):
+        """
+        Takes one request and `tokens` tokens if both buckets allow it. Returns 0, or the
+        seconds to wait before trying again.
+        """
+        wait = max(0.0, state["blocked_until"] - now)
+        if self.requests_per_minute and state["requests"] < 1:
+            wait = max(wait, (1 - state["requests"]) * 60 / (self.requests_per_minute * state["factor"]))
+        if self.tokens_per_minute:
+            # A request larger than the bucket goes ahead once the bucket is full, leaving it in debt
+            needed = min(tokens, self._capacity(self.tokens_per_minute))
+            if state["tokens"] < needed:
+                wait = max(wait, (needed - state["tokens"]) * 60 / (self.tokens_per_minute * state["factor"]))
+        if wait > 0:
+            return wait
+        state["requests"] -= 1
+        state["tokens"] -= tokens
+        return 0.0
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until a request using about `tokens` input tokens may start, then takes its share.
+        Returns:
+            float: Seconds spent waiting.
+        """
+        if not self.enabled:
+            return 0.0
+        waited = 0.0
+        while True:
+            wait = self._update(lambda state, now: self._take(state, now, tokens))
+            if not wait:
+                return waited
+            # A little jitter so processes waiting on the same bucket don't wake in lockstep
+            wait += random.uniform(0, min(1.0, wait * 0.1))
+            time.sleep(wait)
+            waited += wait
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """
+        Corrects the token bucket once the real input token count of a request is known.
+        """
+        if not self.enabled or not self.tokens_per_minute or actual_tokens is None:
+            return
+
+        def change(state, now):
+            state["tokens"] += estimated_tokens - actual_tokens
+        self._update(change)
+
+    def succeeded(self):
+        """
+        Raises the rate by RATE_LIMIT_RECOVERY of the quota after a successful request.
+        """
+        if not self.enabled:
+            return
+
+        def change(state, now):
+            state["factor"] = min(1.0, state["factor"] + RATE_LIMIT_RECOVERY)
+        self._update(change)
+
+    def throttled(self, retry_after=None):
+        """
+        Handles a 429: halves the rate (once per burst of 429s), empties the request bucket and
+        pauses new requests for `retry_after` seconds if the server gave one.
+        Returns:
+            float: The new rate as a fraction of the configured quota.
+        """
+        if not self.enabled:
+            return 1.0
+
+        def change(state, now):
+            if now - state["last_decrease"] >= _DECREASE_COOLDOWN:
+                state["factor"] = max(RATE_LIMIT_MIN_FACTOR, state["factor"] / 2)
+                state["last_decrease"] = now
+            state["requests"] = min(state["requests"], 0.0)
+            if retry_after:
+                state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+            return state["factor"]
+        return self._update(change)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
@@ -0,0 +1,174 @@
+"""
+readiness.py
+------------
+Decides when a watched file is complete enough to process, without blocking the watcher.
+
+A file is ready once its size and modification time have stayed the same for
+READY_STABLE_SECONDS across checks (and, where the OS locks files being written, it can be
+opened). Checking never sleeps: ReadinessTracker.ready() re-queues a file that is not ready yet
+for when it may be (DirectoryWatcher.requeue), and the watcher moves on to other files. A file
+that keeps changing has at most one re-check scheduled, however many events it produces.
+
+Stages that write a file themselves can skip the wait with a completion marker: mark_complete()
+records the finished file's size and mtime in a .complete folder next to it, and the tracker
+treats a file with a matching marker as ready straight away. Such files are written elsewhere
+first and moved into the watched folder with move_into_place(), which writes the marker before
+the rename, so the file never appears without it. converter.py marks the audio it extracts,
+transcriber.py the transcripts it writes, and dedup.py the audio and transcripts it reuses.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from config import READY_STABLE_SECONDS, READY_LOCK_RECHECK_SECONDS
+
+# Folder (inside the watched folder) holding completion markers
+COMPLETE_DIR_NAME = ".complete"
+
+
+def _marker_path(path):
+    path = Path(path)
+    return path.parent / COMPLETE_DIR_NAME / path.name
+
+
+def mark_complete(path, written=None):
+    """
+    Records that `path` is fully written, so the next stage's watcher picks it up at once.
+    Args:
+        written (Path): Where the file is now, if it is about to be renamed to `path`
+            (a rename keeps its size and mtime).
+    """
+    stat = os.stat(written if written is not None else path)
+    marker = _marker_path(path)
+    try:
+        marker.parent.mkdir(exist_ok=True)
+        with open(marker, 'w', encoding='utf-8') as f:
+            json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+    except OSError as e:
+        print(f"[readiness] Could not write completion marker for {Path(path).name}: {e}")
+
+
+def has_complete_marker(path, stat):
+    """
+    True if `path` has a completion marker written for its current size and mtime.
+    """
+    try:
+        with open(_marker_path(path), 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return marker.get("size") == stat.st_size and marker.get("mtime_ns") == stat.st_mtime_ns
+
+
+def move_into_place(written, path):
+    """
+    Renames a finished file to `path`, writing its completion marker first.
+    """
+    mark_complete(path, written)
+    try:
+        os.replace(written, path)
+    except OSError:
+        remove_marker(path)
+        raise
+
+
+def remove_marker(path):
+    """Deletes the completion marker of `path`, if any."""
+    try:
+        _marker_path(path).unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[readiness] Could not remove completion marker for {Path(path).name}: {e}")
+
+
+def is_unlocked(path):
+    """
+    Checks once, without retrying, whether a file can be opened for writing. On Windows this
+    fails while another program is still writing it; on Linux it practically always succeeds,
+    which is why the size/mtime window is the main test.
+    """
+    try:
+        with open(path, 'rb+'):
+            return True
+    except OSError:
+        return False
+
+
+class ReadinessTracker:
+    """
+    Remembers (size, mtime) of each candidate file across checks.
+    Used from a single watcher loop; not shared between threads.
+    """
+
+    def __init__(self, name, stable_seconds=READY_STABLE_SECONDS, lock_recheck_seconds=READY_LOCK_RECHECK_SECONDS):
+        """
+        Args:
+            name (str): Log prefix, e.g. "video_watcher".
+            stable_seconds (float): How long size and mtime must stay unchanged.
+            lock_recheck_seconds (float): Delay before re-checking a locked file.
+        """
+        self.name = name
+        self.stable_seconds = stable_seconds
+        self.lock_recheck_seconds = lock_recheck_seconds
+        # Path -> (size, mtime_ns, monotonic time first seen with that size and mtime)
+        self._seen = {}
+        # Path -> monotonic time of the re-check already scheduled for it
+        self._rechecks = {}
+
+    def ready(self, path, watcher):
+        """
+        Returns True if `path` can be processed now. Otherwise schedules a re-check through
+        watcher.requeue() (unless an earlier one is already pending) and returns False.
+        """
+        now = time.monotonic()
+        if self._rechecks.get(path, now + 1) <= now:
+            del self._rechecks[path]
+        wait = self.wait_time(path)
+        if wait is None:
+            self._rechecks.pop(path, None)
+            return False
+        if wait == 0:
+            self._rechecks.pop(path, None)
+            return True
+        due = now + wait
+        if self._rechecks.get(path, due + 1) > due:
+            self._rechecks[path] = due
+            watcher.requeue(path, delay=wait)
+        return False
+
+    def wait_time(self, path):
+        """
+        Checks a file without blocking.
+        Returns:
+            float: 0 if the file is ready, otherwise the seconds until it should be checked again;
+            None if the file no longer exists.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._seen.pop(path, None)
+            return None
+        if has_complete_marker(path, stat):
+            self._ready(path)
+            return 0
+        now = time.monotonic()
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self._seen.get(path)
+        if previous is None or previous[:2] != signature:
+            if previous is None and self.stable_seconds > 0:
+                print(f"[{self.name}] Waiting for {Path(path).name} to stay unchanged for {self.stable_seconds}s...")
+            previous = self._seen[path] = signature + (now,)
+        remaining = self.stable_seconds - (now - previous[2])
+        if remaining > 0:
+            return remaining
+        if not is_unlocked(path):
+            return self.lock_recheck_seconds
+        self._ready(path)
+        return 0
+
+    def _ready(self, path):
+        self._seen.pop(path, None)
+        remove_marker(path)
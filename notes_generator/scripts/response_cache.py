@@ -0,0 +1,136 @@
+"""
+response_cache.py
+-----------------
+Content-addressed on-disk cache for Gemini responses.
+
+Each entry is keyed by a SHA-256 hash of (model name, prompt, input text), so re-running an
+unchanged transcript costs no API calls, while editing a prompt in config.py naturally
+misses the cache for every chunk it affects. Responses are zlib-compressed and stored in a
+single SQLite file (GEMINI_CACHE_FILE). Once the stored size passes GEMINI_CACHE_MAX_BYTES,
+the least recently used entries are evicted.
+
+Hit and miss counters are kept per process and can be read with stats().
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+from config import GEMINI_CACHE_FILE, GEMINI_CACHE_MAX_BYTES
+
+
+def make_key(model_name, prompt, text):
+    """
+    Returns the cache key for a request: SHA-256 over model, prompt and text.
+    """
+    h = hashlib.sha256()
+    for part in (model_name, prompt, text):
+        data = part.encode('utf-8')
+        # Length prefix so ("ab", "c") and ("a", "bc") never collide
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU cache of Gemini responses. Safe to use from several threads.
+    """
+
+    def __init__(self, path=GEMINI_CACHE_FILE, max_bytes=GEMINI_CACHE_MAX_BYTES):
+        """
+        Args:
+            path (Path): SQLite file to store entries in.
+            max_bytes (int): Evict least recently used entries past this total compressed size.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self):
+        # One short-lived connection per operation keeps the cache usable from pool threads
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def get(self, model_name, prompt, text):
+        """
+        Looks up a cached response.
+        Returns:
+            str: The cached response text, or None on a miss.
+        """
+        key = make_key(model_name, prompt, text)
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        finally:
+            conn.close()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, model_name, prompt, text, response):
+        """
+        Stores a response and evicts least recently used entries if the cache is over budget.
+        """
+        key = make_key(model_name, prompt, text)
+        blob = zlib.compress(response.encode('utf-8'))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, model_name, blob, len(blob), time.time()),
+                )
+                self._evict(conn)
+        finally:
+            conn.close()
+
+    def _evict(self, conn):
+        """
+        Deletes the oldest entries until the total stored size fits in max_bytes.
+        """
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        print(f"[response_cache] Evicted {len(stale)} least recently used entries.")
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters for this process plus entry count and stored bytes.
+        """
+        conn = self._connect()
+        try:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        finally:
+            conn.close()
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
@@ -0,0 +1,530 @@
+"""
+scheduler.py
+------------
+Shortest-job-first ordering of each stage's backlog, with aging and manual priorities.
+
+Files used to be processed in the order they were found, so a 10-minute standup could wait
+behind a three-hour all-hands in every stage. Now each stage's backlog is a JobQueue that hands
+out the job predicted to be quickest first:
+
+    - Size of a job: the media duration for convert and transcribe (ffprobe, or an estimate from
+      the file size if ffprobe is missing or fails), the transcript length for edit. Segment
+      streams are edited while they are written, so they always go first. Queuing a job never
+      waits for ffprobe (it is called from the watcher's event thread): the job is queued with
+      the estimate, and re-sorted once a background thread has probed it.
+    - Predicted run time: size x the stage's seconds per unit, learned from its last
+      SCHEDULER_HISTORY finished jobs (SCHEDULER_DEFAULT_RATES until there is history).
+    - Aging: each second a job waits counts as SCHEDULER_AGING seconds less predicted run time,
+      so long recordings still get their turn while short ones keep arriving. A job handed out
+      and put back before it could start (JobQueue.requeue, e.g. a file still being written)
+      keeps its original queue time.
+    - Overrides: a <stem>.priority file next to the recording (or in the videos folder) holding a
+      number puts that recording ahead of every job with a lower number, in every stage (default 0;
+      an empty file means 10, negative numbers push it back).
+
+Each queued job's prediction (run time and completion time) is stored in the ledger database,
+so it can be compared with what actually happened.
+
+Usage:
+    python scheduler.py prioritize <file> [N]   # write <stem>.priority (default 10)
+    python scheduler.py prioritize <file> --clear
+    python scheduler.py report [--stage edit] [--limit 20]
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import queue
+import sqlite3
+import statistics
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    LEDGER_DB, WATCHED_VIDEOS_DIR, SCHEDULER_ENABLED, SCHEDULER_AGING, SCHEDULER_DEFAULT_RATES, SCHEDULER_HISTORY,
+)
+from job_ledger import path_key, DONE, FAILED, QUEUED
+from segment_stream import is_segments_file, transcript_for
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedule (
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    units REAL NOT NULL,
+    predicted_seconds REAL NOT NULL,
+    priority REAL NOT NULL,
+    queued_at REAL NOT NULL,
+    predicted_finish REAL NOT NULL,
+    PRIMARY KEY (stage, path)
+);
+"""
+
+PRIORITY_SUFFIX = ".priority"
+# Priority of an empty priority file, and the default of `prioritize`
+DEFAULT_PRIORITY = 10
+# Stages whose jobs are sized by characters of transcript rather than seconds of media
+TEXT_STAGES = ("edit",)
+# Rough bytes per second of media, for sizing a file ffprobe can't read
+BYTES_PER_SECOND = {
+    ".mp4": 125_000,
+    ".opus": 3_000,
+    ".mp3": 16_000,
+    ".m4a": 16_000,
+    ".flac": 60_000,
+}
+_DEFAULT_BYTES_PER_SECOND = 16_000
+# Seconds between refreshes of a stage's learned rate
+_RATE_REFRESH = 60
+# Sort key of queue items that are not jobs (stop sentinels): after every job
+_CONTROL_KEY = (1, 0, 0)
+
+
+def _job_path(item):
+    """Path of a queued job (a path, or a tuple starting with one), or None for control items."""
+    if isinstance(item, tuple) and item:
+        item = item[0]
+    return Path(item) if isinstance(item, (str, os.PathLike)) else None
+
+
+def recording_stem(path):
+    """Stem shared by a recording's video, audio, transcript and segment stream."""
+    path = Path(path)
+    return transcript_for(path).stem if is_segments_file(path) else path.stem
+
+
+def read_priority(path):
+    """
+    Returns the manual priority of the recording `path` belongs to: the number in
+    <stem>.priority next to it or in the videos folder (DEFAULT_PRIORITY if the file is
+    empty), or 0 if there is none.
+    """
+    path = Path(path)
+    name = recording_stem(path) + PRIORITY_SUFFIX
+    for folder in (path.parent, WATCHED_VIDEOS_DIR):
+        try:
+            text = (Path(folder) / name).read_text(encoding="utf-8").strip()
+        except OSError:
+            continue
+        try:
+            return float(text) if text else float(DEFAULT_PRIORITY)
+        except ValueError:
+            print(f"[scheduler] Ignoring {name}: {text!r} is not a number.")
+    return 0.0
+
+
+def format_duration(seconds):
+    """Formats seconds as e.g. "45s", "12m" or "2h05m"."""
+    if seconds is None:
+        return "-"
+    sign, seconds = ("-" if seconds < 0 else ""), abs(seconds)
+    if seconds < 60:
+        return f"{sign}{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{sign}{seconds / 60:.0f}m"
+    return f"{sign}{int(seconds // 3600)}h{int(seconds % 3600 // 60):02d}m"
+
+
+class JobScheduler:
+    """
+    Sizes, prioritizes and records the jobs of one stage (named as in the job ledger).
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, stage, workers=1, aging=SCHEDULER_AGING, db_path=LEDGER_DB):
+        """
+        Args:
+            stage (str): Ledger stage name ("convert", "transcribe" or "edit").
+            workers (int): Jobs the stage runs at once, for predicting completion times.
+            aging (float): Seconds of predicted run time forgiven per second waited.
+            db_path (Path): Ledger database, where predictions are stored.
+        """
+        self.stage = stage
+        self.workers = max(1, workers)
+        self.aging = aging
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # Path -> (size, mtime_ns, units), so unchanged files are not probed again
+        self._sizes = {}
+        # Path -> time it was first queued, for aging across re-queues
+        self._queued_at = {}
+        # Path -> time it was first queued, for jobs handed out that may be put back
+        self._handed_out = {}
+        # (path, callback) pairs waiting for ffprobe, and the thread running it
+        self._probes = queue.Queue()
+        self._probe_thread = None
+        self._rate = None
+        self._rate_checked = 0.0
+
+    def _known_units(self, path, stat):
+        """Size of a job if it is known without running ffprobe, else None."""
+        cached = self._sizes.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        if is_segments_file(path):
+            return 0.0
+        if self.stage in TEXT_STAGES:
+            # UTF-8 bytes are close enough to characters for ordering
+            return float(stat.st_size)
+        return None
+
+    @staticmethod
+    def _estimate(path, stat):
+        """Seconds of media guessed from the file size."""
+        return stat.st_size / BYTES_PER_SECOND.get(path.suffix.lower(), _DEFAULT_BYTES_PER_SECOND)
+
+    def units(self, path):
+        """
+        Size of a job: characters for edit jobs, seconds of media otherwise (runs ffprobe).
+        """
+        path = Path(path)
+        stat = path.stat()
+        units = self._known_units(path, stat)
+        if units is not None:
+            return units
+        # Imported here: only media stages probe, and only on the probe thread
+        from media_probe import probe_duration, ProbeError
+        try:
+            units = probe_duration(path)
+        except (ProbeError, OSError, ValueError):
+            # OSError: ffprobe is not installed
+            units = None
+        if units is None:
+            units = self._estimate(path, stat)
+        self._sizes[path] = (stat.st_size, stat.st_mtime_ns, units)
+        return units
+
+    def probe_later(self, path, callback):
+        """
+        Sizes a job with ffprobe on the scheduler's probe thread, then calls callback(path, units).
+        """
+        if self._probe_thread is None:
+            self._probe_thread = threading.Thread(target=self._probe_loop, name=f"probe-{self.stage}", daemon=True)
+            self._probe_thread.start()
+        self._probes.put((Path(path), callback))
+
+    def _probe_loop(self):
+        while True:
+            path, callback = self._probes.get()
+            try:
+                units = self.units(path)
+            except OSError:
+                continue  # Gone already
+            try:
+                callback(path, units)
+            except Exception as e:
+                print(f"[scheduler] Could not re-sort {path.name} after probing it: {e}")
+
+    def rate(self):
+        """
+        Seconds of work per unit: the median over the stage's recent finished jobs,
+        or the default rate until there are any.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._rate is not None and now - self._rate_checked < _RATE_REFRESH:
+                return self._rate
+            try:
+                rows = self._conn.execute(
+                    "SELECT (j.finished_at - j.started_at) / s.units FROM jobs j JOIN schedule s"
+                    " ON s.stage = j.stage AND s.path = j.path"
+                    " WHERE j.stage = ? AND j.state = ? AND s.units > 0 AND j.finished_at >= j.started_at"
+                    " ORDER BY j.finished_at DESC LIMIT ?",
+                    (self.stage, DONE, SCHEDULER_HISTORY),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # The job ledger has not been created yet
+                rows = []
+            self._rate = statistics.median(r[0] for r in rows) if rows else SCHEDULER_DEFAULT_RATES.get(self.stage, 1.0)
+            self._rate_checked = now
+            self._forget_finished()
+            return self._rate
+
+    def _forget_finished(self):
+        """
+        Drops the sizes and queue times kept for jobs the ledger records as finished, so they
+        don't pile up in a long-running process. Called with the lock held.
+        """
+        paths = {path_key(p): p for p in set(self._sizes) | set(self._handed_out)}
+        keys = list(paths)
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            try:
+                rows = self._conn.execute(
+                    f"SELECT path FROM jobs WHERE stage = ? AND state IN (?, ?) AND path IN ({', '.join('?' * len(batch))})",
+                    (self.stage, DONE, FAILED, *batch),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return
+            for (key,) in rows:
+                self._sizes.pop(paths[key], None)
+                self._handed_out.pop(paths[key], None)
+
+    def job(self, path, requeued=False):
+        """
+        Sizes a job without running ffprobe and returns its scheduling details as a dict
+        (path, units, predicted_seconds, priority, queued_at, probe). With "probe" True, the
+        size is an estimate from the file size and probe_later() should measure it.
+        Args:
+            requeued (bool): The job was handed out and is being put back; it keeps its queue time.
+        """
+        path = Path(path)
+        probe = False
+        try:
+            stat = path.stat()
+            units = self._known_units(path, stat)
+            if units is None:
+                units, probe = self._estimate(path, stat), True
+        except OSError:
+            # Gone already; the consumer will skip it
+            units = 0.0
+        with self._lock:
+            handed_out = self._handed_out.pop(path, None)
+            if path not in self._queued_at:
+                self._queued_at[path] = handed_out if requeued and handed_out is not None else time.time()
+            queued_at = self._queued_at[path]
+        return {"path": path, "units": units, "predicted_seconds": units * self.rate(),
+                "priority": read_priority(path), "queued_at": queued_at, "probe": probe}
+
+    def sort_key(self, job):
+        """
+        Higher priority first, then the smallest predicted run time less aging. Aging lowers
+        every waiting job's key at the same rate, so the key can be fixed at queue time.
+        """
+        return (0, -job["priority"], job["predicted_seconds"] + self.aging * job["queued_at"])
+
+    def started(self, path):
+        """Sets a job's queue time aside once it has been handed out, in case it is put back."""
+        path = Path(path)
+        with self._lock:
+            queued_at = self._queued_at.pop(path, None)
+            if queued_at is not None:
+                self._handed_out[path] = queued_at
+
+    def record(self, job, predicted_finish):
+        """
+        Stores the prediction for a queued job.
+        """
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO schedule (stage, path, units, predicted_seconds, priority, queued_at, predicted_finish)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.stage, path_key(job["path"]), job["units"], job["predicted_seconds"], job["priority"],
+                     job["queued_at"], predicted_finish),
+                )
+        except sqlite3.Error as e:
+            print(f"[scheduler] Could not record the prediction for {job['path'].name}: {e}")
+
+    def close(self):
+        self._conn.close()
+
+
+class JobQueue(queue.Queue):
+    """
+    queue.Queue that hands out jobs in scheduler order. Items are paths, or tuples starting with
+    a path; anything else (e.g. a stop sentinel) is handed out after every job.
+    Priority files are re-read whenever a folder they can be in changes.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        super().__init__()
+
+    def _init(self, maxsize):
+        # Entries: [sort key, sequence number, item, job dict or None]
+        self._heap = []
+        self._seq = itertools.count()
+        self._folder_mtimes = {}
+
+    def _qsize(self):
+        return len(self._heap)
+
+    def put(self, item, block=True, timeout=None, requeued=False):
+        path = _job_path(item)
+        if path is None:
+            entry = [_CONTROL_KEY, next(self._seq), item, None]
+        else:
+            job = self.scheduler.job(path, requeued)
+            entry = [self.scheduler.sort_key(job), next(self._seq), item, job]
+        super().put(entry, block, timeout)
+        job = entry[3]
+        if job is not None:
+            self.scheduler.record(job, job["predicted_finish"])
+            if job["probe"]:
+                self.scheduler.probe_later(job["path"], self._resize)
+
+    def requeue(self, item):
+        """
+        Puts back a job that was handed out but could not start yet (e.g. its file is still being
+        written, or another worker holds it), keeping its original queue time for aging.
+        """
+        self.put(item, requeued=True)
+
+    def _resize(self, path, units):
+        """Re-sorts the queued jobs for `path` with the size ffprobe measured."""
+        predicted_seconds = units * self.scheduler.rate()
+        resized = []
+        with self.mutex:
+            for entry in self._heap:
+                job = entry[3]
+                if job is not None and job["path"] == path and job["probe"]:
+                    job.update(units=units, predicted_seconds=predicted_seconds, probe=False)
+                    entry[0] = self.scheduler.sort_key(job)
+                    resized.append(entry)
+            if resized:
+                heapq.heapify(self._heap)
+                for entry in resized:
+                    self._predict_finish(entry)
+        for entry in resized:
+            self.scheduler.record(entry[3], entry[3]["predicted_finish"])
+
+    def _put(self, entry):
+        heapq.heappush(self._heap, entry)
+        job = entry[3]
+        if job is None:
+            return
+        for folder in (job["path"].parent, WATCHED_VIDEOS_DIR):
+            if folder not in self._folder_mtimes:
+                self._folder_mtimes[folder] = self._mtime(folder)
+        self._predict_finish(entry)
+
+    def _predict_finish(self, entry):
+        job = entry[3]
+        # Work queued ahead of this job, shared between the stage's workers
+        ahead = sum(e[3]["predicted_seconds"] for e in self._heap if e[3] is not None and e[:2] < entry[:2])
+        job["predicted_finish"] = time.time() + ahead / self.scheduler.workers + job["predicted_seconds"]
+
+    def _get(self):
+        if self._priorities_changed():
+            self._rekey()
+        entry = heapq.heappop(self._heap)
+        job = entry[3]
+        if job is not None:
+            self.scheduler.started(job["path"])
+            overtaken = sum(1 for e in self._heap if e[3] is not None and e[1] < entry[1])
+            if overtaken:
+                print(f"[scheduler] {self.scheduler.stage}: {job['path'].name} (predicted "
+                      f"{format_duration(job['predicted_seconds'])}) goes ahead of {overtaken} earlier job(s).")
+        return entry[2]
+
+    @staticmethod
+    def _mtime(folder):
+        try:
+            return os.stat(folder).st_mtime_ns
+        except OSError:
+            return None
+
+    def _priorities_changed(self):
+        changed = False
+        for folder, mtime in self._folder_mtimes.items():
+            current = self._mtime(folder)
+            if current != mtime:
+                self._folder_mtimes[folder] = current
+                changed = True
+        return changed
+
+    def _rekey(self):
+        for entry in self._heap:
+            job = entry[3]
+            if job is not None:
+                job["priority"] = read_priority(job["path"])
+                entry[0] = self.scheduler.sort_key(job)
+        heapq.heapify(self._heap)
+
+
+def new_queue(stage, workers=1):
+    """
+    Returns the backlog queue for a stage: scheduler-ordered, or plain FIFO with SCHEDULER_ENABLED off.
+    """
+    return JobQueue(JobScheduler(stage, workers)) if SCHEDULER_ENABLED else queue.Queue()
+
+
+def prioritize(path, priority=DEFAULT_PRIORITY, clear=False):
+    """
+    Writes (or with clear, removes) the priority file of the recording `path` belongs to,
+    in the videos folder so it applies to every stage.
+    """
+    target = WATCHED_VIDEOS_DIR / (recording_stem(path) + PRIORITY_SUFFIX)
+    if clear:
+        target.unlink(missing_ok=True)
+        print(f"Removed {target}")
+    else:
+        target.write_text(f"{priority:g}\n", encoding="utf-8")
+        print(f"Priority of {recording_stem(path)} set to {priority:g} ({target})")
+
+
+def report(stage=None, limit=20, db_path=LEDGER_DB):
+    """
+    Prints predicted against actual run and completion times for recently finished jobs,
+    the predictions for jobs still queued, and the mean errors per stage.
+    """
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    query = ("SELECT s.stage, s.path, s.units, s.predicted_seconds, s.priority, s.queued_at, s.predicted_finish,"
+             " j.state, j.started_at, j.finished_at FROM schedule s JOIN jobs j ON j.stage = s.stage AND j.path = s.path")
+    params = []
+    if stage:
+        query += " WHERE s.stage = ?"
+        params.append(stage)
+    try:
+        rows = conn.execute(query + " ORDER BY COALESCE(j.finished_at, s.predicted_finish) DESC", params).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    if not rows:
+        print("No scheduled jobs recorded yet.")
+        return
+    done = [r for r in rows if r[7] == DONE and r[8] and r[9]]
+    queued = [r for r in rows if r[7] == QUEUED]
+
+    if done:
+        print(f"{'stage':<11} {'file':<36} {'prio':>4} {'run pred':>9} {'actual':>8} {'finish pred':>11} {'actual':>8} {'late by':>8}")
+        for r in done[:limit]:
+            stage_, path, _, predicted, priority, queued_at, predicted_finish, _, started_at, finished_at = r
+            print(f"{stage_:<11} {Path(path).name[:36]:<36} {priority:>4g} {format_duration(predicted):>9} "
+                  f"{format_duration(finished_at - started_at):>8} {format_duration(predicted_finish - queued_at):>11} "
+                  f"{format_duration(finished_at - queued_at):>8} {format_duration(finished_at - predicted_finish):>8}")
+    if queued:
+        now = time.time()
+        # Forecasts made when each job was queued; jobs queued later may have overtaken them
+        print(f"\nQueued ({len(queued)}):")
+        for r in sorted(queued, key=lambda r: r[6])[:limit]:
+            print(f"  {r[0]:<11} {Path(r[1]).name[:36]:<36} predicted run {format_duration(r[3])}, "
+                  f"forecast finish {format_duration(r[6] - now)} from now (at queue time)")
+
+    print("\nPer stage (finished jobs): mean |run error|, mean |finish error|, mean turnaround")
+    for name in sorted({r[0] for r in done}):
+        jobs = [r for r in done if r[0] == name]
+        run_error = statistics.mean(abs((r[9] - r[8]) - r[3]) for r in jobs)
+        finish_error = statistics.mean(abs(r[9] - r[6]) for r in jobs)
+        turnaround = statistics.mean(r[9] - r[5] for r in jobs)
+        print(f"  {name:<11} {len(jobs):>4} jobs  {format_duration(run_error):>7}  "
+              f"{format_duration(finish_error):>7}  {format_duration(turnaround):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manual priorities and prediction reports for the job scheduler.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prio = commands.add_parser("prioritize", help="Set or clear the priority of a recording.")
+    prio.add_argument("file", type=Path, help="Any file of the recording (video, audio or transcript), or its name.")
+    prio.add_argument("priority", type=float, nargs="?", default=DEFAULT_PRIORITY,
+                      help=f"Higher goes first (default {DEFAULT_PRIORITY}).")
+    prio.add_argument("--clear", action="store_true", help="Remove the priority file.")
+    rep = commands.add_parser("report", help="Compare predicted and actual completion times.")
+    rep.add_argument("--stage", choices=("convert", "transcribe", "edit"), help="Only this stage.")
+    rep.add_argument("--limit", type=int, default=20, help="Rows to show (default 20).")
+    args = parser.parse_args()
+
+    if args.command == "prioritize":
+        prioritize(args.file, args.priority, args.clear)
+    else:
+        report(args.stage, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+segment_stream.py
+-----------------
+Growing JSONL file of transcript segments, written by the transcriber and read by the editor
+while transcription is still running (STREAM_TRANSCRIPTS in config.py).
+
+The transcriber appends one line per Whisper segment, {"start": ..., "end": ..., "text": ...},
+to TRANSCRIPTS_DIR/<stem>.segments.jsonl as each piece of the recording is finished, and a final
+{"done": true} line (or {"error": ...} if transcription failed). The complete <stem>.txt is still
+written as usual, just before the done line, so it is in place once a reader reaches the end.
+
+follow_segments() tails the file and yields transcript lines exactly as they appear in the .txt,
+so the editor can chunk and send them to Gemini long before the .txt exists. While the stream is
+open the writer touches it every STREAM_HEARTBEAT seconds, so a reader can tell a slow piece
+(a long one on the CPU) from a transcriber that died. Once the notes are written and the .txt
+recorded as edited, remove_stream() deletes the stream.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from config import TRANSCRIPTS_DIR, STREAM_HEARTBEAT, STREAM_IDLE_TIMEOUT, STREAM_POLL_INTERVAL
+
+SEGMENTS_SUFFIX = ".segments.jsonl"
+
+
+def segments_path(source_path):
+    """Returns the segment stream path for a media file, e.g. video.mp4 -> video.segments.jsonl."""
+    return TRANSCRIPTS_DIR / (Path(source_path).stem + SEGMENTS_SUFFIX)
+
+
+def is_segments_file(path):
+    """True if the path is a segment stream rather than a transcript."""
+    return Path(path).name.endswith(SEGMENTS_SUFFIX)
+
+
+def transcript_for(stream_path):
+    """Returns the .txt transcript a segment stream belongs to."""
+    stream_path = Path(stream_path)
+    return stream_path.with_name(stream_path.name[:-len(SEGMENTS_SUFFIX)] + '.txt')
+
+
+def remove_stream(stream_path):
+    """Deletes a segment stream that has been edited."""
+    try:
+        Path(stream_path).unlink(missing_ok=True)
+    except OSError as e:
+        print(f"[segment_stream] Could not remove {Path(stream_path).name}: {e}")
+
+
+class SegmentStream:
+    """
+    Writer side: appends segments to the stream file and flushes after every piece, and touches
+    it every `heartbeat` seconds while open.
+    Use as a context manager; leaving the block with an exception records the error.
+    """
+
+    def __init__(self, source_path, heartbeat=STREAM_HEARTBEAT):
+        self.path = segments_path(source_path)
+        self.heartbeat = heartbeat
+        self._file = None
+        self._closed = threading.Event()
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._closed.clear()
+        threading.Thread(target=self._heartbeat_loop, name="segment-stream-heartbeat", daemon=True).start()
+        return self
+
+    def _heartbeat_loop(self):
+        while not self._closed.wait(self.heartbeat):
+            try:
+                os.utime(self.path)
+            except OSError as e:
+                print(f"[segment_stream] Could not touch {self.path.name}: {e}")
+
+    def __exit__(self, exc_type, exc, tb):
+        self._closed.set()
+        if exc is None:
+            self._write({"done": True})
+        else:
+            self._write({"error": str(exc) or exc_type.__name__})
+        self._file.close()
+        self._file = None
+        return False
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def write(self, segments):
+        """
+        Appends finished segments (dicts with start, end and text) to the stream.
+        """
+        for s in segments:
+            self._file.write(json.dumps({"start": s["start"], "end": s["end"], "text": s["text"]},
+                                        ensure_ascii=False) + '\n')
+        self._file.flush()
+
+
+def follow_segments(stream_path, idle_timeout=STREAM_IDLE_TIMEOUT, poll_interval=STREAM_POLL_INTERVAL):
+    """
+    Tails a segment stream, yielding one transcript line per segment until the done marker.
+    Waits for the file to appear if the transcriber has not created it yet.
+    Raises:
+        RuntimeError: If the transcriber recorded an error.
+        TimeoutError: If the file has had neither new segments nor a heartbeat for
+            `idle_timeout` seconds (the transcriber died without finishing the stream).
+    """
+    stream_path = Path(stream_path)
+    waiting_since = time.time()
+    while not stream_path.exists():
+        if time.time() - waiting_since > idle_timeout:
+            raise TimeoutError(f"{stream_path.name} was never created")
+        time.sleep(poll_interval)
+    buffer = ''
+    with open(stream_path, 'r', encoding='utf-8') as f:
+        while True:
+            data = f.read()
+            if not data:
+                if time.time() - stream_path.stat().st_mtime > idle_timeout:
+                    raise TimeoutError(f"{stream_path.name} has had no new segments or heartbeat for {idle_timeout}s")
+                time.sleep(poll_interval)
+                continue
+            buffer += data
+            # Only parse complete lines; a partial last line waits for the next read
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("done"):
+                    return
+                if "error" in record:
+                    raise RuntimeError(f"Transcription failed: {record['error']}")
+                # Same line format as Whisper's .txt writer
+                yield record["text"].strip() + '\n'
@@ -3,22 +3,44 @@ stop_pipeline.py
 ----------------
 Stop pipeline script for the notes generator system.
 
-This script creates the STOP_PIPELINE file, attempts to gracefully terminate all watcher processes,
-and prints the last 2 log lines from each watcher for a final status update.
+This script sends a command to every running pipeline process (the watchers and the orchestrator)
+through its control channel (control.py), prints each process's acknowledgement and, when stopping
+or draining, waits for the processes to exit and prints the last 2 log lines from each watcher.
 
 How it works:
-  1. Creates STOP_PIPELINE file (signals all watchers to exit at next check).
-  2. Finds all watcher processes by script name and sends terminate signal.
-  3. Waits for watcher processes to exit (with timeout).
-  4. Prints which watchers stopped and which did not.
+  1. Reads the running processes and their control channel addresses from the PID registry
+     (pid_registry.py); no scan of the process list.
+  2. Sends the command and prints the acknowledgement. The processes act on it at once,
+     instead of at their next check of the STOP_PIPELINE file.
+  3. Waits for the processes to exit, by PID.
+  4. Prints which processes stopped and which did not.
   5. Prints the last 2 lines from each watcher's log file (searches recursively for timestamped subfolders).
+
+Commands:
+  (default)  stop-now: cancel the jobs in progress (they are redone on the next start) and exit.
+  --drain    Finish the jobs in progress, take no new ones, then exit. Waits as long as the jobs
+             take, unless --timeout is given.
+  --pause    Take no new jobs until --resume; the jobs in progress carry on.
+  --resume   Take new jobs again.
+  --status   Print each process's state and jobs in progress.
+
+A process that can't be reached on its control channel is stopped the old way: the STOP_PIPELINE
+file is created and the process is terminated (with --drain it is left running instead).
+
+Usage:
+    python stop_pipeline.py [--drain | --pause | --resume | --status] [--timeout 30] [name ...]
 """
 
+import argparse
 import time
 from pathlib import Path
 import psutil
 import glob
 
+from config import STOP_FILE
+import control
+import pid_registry
+
 WATCHERS = {
     "Video Watcher": "video_watcher.py",
     "Audio Watcher": "audio_watcher.py",
@@ -29,61 +51,78 @@ def create_stop_file():
     """
     Creates the STOP_PIPELINE file in the parent directory to signal all watchers to exit.
     """
-    stop_file = Path(__file__).parent.parent / "STOP_PIPELINE"
-    stop_file.touch()
+    STOP_FILE.touch()
     print("[stop_pipeline] STOP_PIPELINE file created.")
 
-def wait_for_watchers(timeout=30):
+def running_processes(names=None):
     """
-    Attempts to terminate all watcher processes by PID and waits for them to exit.
-    Returns a set of watcher names that are still running after the timeout.
+    Returns the PID registry records of the pipeline processes that are running, keyed by name.
+    Args:
+        names (list): Only these processes (a name also matches its <name>-<pid> copies).
     """
-    print("[stop_pipeline] Attempting to terminate watcher processes by PID...")
-    watcher_procs = {}
-    for watcher, script in WATCHERS.items():
-        for proc in psutil.process_iter(['name', 'cmdline', 'pid']):
-            try:
-                cmdline = ' '.join(proc.info['cmdline']) if proc.info['cmdline'] else ''
-                if script in cmdline:
-                    watcher_procs[watcher] = proc
-                    break
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-    # Terminate all found watcher processes
-    for watcher, proc in watcher_procs.items():
+    records = {}
+    for name, record in pid_registry.registered().items():
+        if names and not any(name == n or name.startswith(f"{n}-") for n in names):
+            continue
+        if pid_registry.is_alive(record["pid"], record["started"]):
+            records[name] = record
+    return records
+
+def send_command(records, command):
+    """
+    Sends `command` to each process and prints its acknowledgement.
+    Returns:
+        list: Names of the processes that did not acknowledge it.
+    """
+    unreachable = []
+    for name, record in records.items():
+        address = record.get("control")
+        if address is None:
+            print(f"[stop_pipeline] {name} (PID {record['pid']}) has no control channel.")
+            unreachable.append(name)
+            continue
         try:
-            print(f"Terminating {watcher} (PID: {proc.pid})...")
-            proc.terminate()
-        except Exception as e:
-            print(f"Failed to terminate {watcher} (PID: {proc.pid}): {e}")
-    # Wait for all to exit
-    gone, alive = psutil.wait_procs(list(watcher_procs.values()), timeout=timeout)
-    still_running = set()
-    for proc in alive:
-        for watcher, p in watcher_procs.items():
-            if p.pid == proc.pid:
-                still_running.add(watcher)
-    return still_running
+            start = time.perf_counter()
+            reply = control.send(address, command)
+        except control.ControlError as e:
+            print(f"[stop_pipeline] {name} (PID {record['pid']}) did not acknowledge {command}: {e}")
+            unreachable.append(name)
+            continue
+        in_flight = f", {reply['in_flight']} job(s) in progress" if "in_flight" in reply else ""
+        note = f" ({reply['message']})" if reply.get("message") else ""
+        print(f"[stop_pipeline] {name} (PID {record['pid']}): {reply['state']}{in_flight}{note} "
+              f"[ack in {(time.perf_counter() - start) * 1000:.0f} ms]")
+    return unreachable
 
-def main():
+def wait_for_processes(records, timeout=30, terminate=()):
     """
-    Main entry point for stopping the pipeline and reporting watcher status and logs.
+    Terminates the processes named in `terminate`, then waits for all of `records` to exit.
+    Returns a set of names that are still running after the timeout (None = wait indefinitely).
     """
-    create_stop_file()
-    still_running = wait_for_watchers()
-    stopped = [w for w in WATCHERS if w not in still_running]
-    if stopped:
-        print("\nStopped watcher processes:")
-        for w in stopped:
-            print(f"- {w}")
-    if still_running:
-        print("\n[WARNING] These watcher processes did NOT stop within timeout:")
-        for w in still_running:
-            print(f"- {w}")
-    else:
-        print("\nAll watcher processes stopped successfully.")
+    procs = {}
+    for name, record in records.items():
+        try:
+            procs[name] = psutil.Process(record["pid"])
+        except psutil.NoSuchProcess:
+            continue
+    for name in terminate:
+        if name in procs:
+            try:
+                print(f"Terminating {name} (PID: {procs[name].pid})...")
+                procs[name].terminate()
+            except psutil.NoSuchProcess:
+                pass
+            except Exception as e:
+                print(f"Failed to terminate {name} (PID: {procs[name].pid}): {e}")
+    gone, alive = psutil.wait_procs(list(procs.values()), timeout=timeout)
+    alive_pids = {proc.pid for proc in alive}
+    return {name for name, proc in procs.items() if proc.pid in alive_pids}
 
-    # Print last 2 lines from each watcher's log file (search recursively for timestamped subfolders)
+def print_log_tails():
+    """
+    Prints the last 2 lines from each watcher's log file.
+    """
+    # Search recursively for timestamped subfolders
     print("\n--- Last 2 log lines from each watcher ---")
     log_dir = Path(__file__).parent.parent / "logs"
     for watcher, script in WATCHERS.items():
@@ -104,5 +143,56 @@ def main():
         else:
             print(f"\n[{watcher}]: No log file found.")
 
+def main():
+    """
+    Main entry point for stopping the pipeline and reporting watcher status and logs.
+    """
+    parser = argparse.ArgumentParser(description="Stop, drain, pause or resume the running pipeline processes.")
+    action = parser.add_mutually_exclusive_group()
+    for flag, command, help_text in (
+            ("--drain", "drain", "Finish the jobs in progress, take no new ones, then exit."),
+            ("--pause", "pause", "Take no new jobs until --resume."),
+            ("--resume", "resume", "Take new jobs again after --pause."),
+            ("--status", "status", "Print each process's state.")):
+        action.add_argument(flag, dest="command", action="store_const", const=command, help=help_text)
+    parser.set_defaults(command="stop-now")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds to wait for the processes to exit (default: 30, or no limit with --drain).")
+    parser.add_argument("names", nargs="*", help="Only these processes, e.g. audio_watcher (default: all).")
+    args = parser.parse_args()
+
+    records = running_processes(args.names)
+    if not records:
+        print("[stop_pipeline] No pipeline processes are running.")
+        return
+    unreachable = send_command(records, args.command)
+    if args.command not in ("stop-now", "drain"):
+        return
+
+    if unreachable and args.command == "drain":
+        # The stop file and terminate() would throw their work away: leave them running
+        print(f"[stop_pipeline] Not waiting for {', '.join(unreachable)}; stop them without --drain.")
+        records = {name: record for name, record in records.items() if name not in unreachable}
+        unreachable = []
+    elif unreachable:
+        # Processes without a working control channel still watch for the stop file
+        create_stop_file()
+    timeout = args.timeout if args.timeout is not None else (None if args.command == "drain" else 30)
+    if args.command == "drain":
+        print("[stop_pipeline] Waiting for the jobs in progress to finish...")
+    still_running = wait_for_processes(records, timeout, terminate=unreachable)
+    stopped = [name for name in records if name not in still_running]
+    if stopped:
+        print("\nStopped pipeline processes:")
+        for name in stopped:
+            print(f"- {name}")
+    if still_running:
+        print("\n[WARNING] These pipeline processes did NOT stop within timeout:")
+        for name in sorted(still_running):
+            print(f"- {name}")
+    else:
+        print("\nAll pipeline processes stopped successfully.")
+    print_log_tails()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,145 @@
+"""
+stream_handoff.py
+-----------------
+Combined convert+transcribe step that never touches the disk in between.
+
+The normal path encodes a full-quality .mp3 into AUDIO_DIR (a Drive-synced folder), and
+Whisper then decodes that .mp3 again and resamples it to 16 kHz mono. Here ffmpeg decodes the
+video's audio track directly to 16 kHz mono PCM over a pipe (converter.decode_audio_pcm) and
+the samples go to Whisper as a NumPy array.
+
+Writing the .mp3 is optional (STREAMING_ARCHIVE_MP3), purely for archival. When enabled it is a
+second output of the same ffmpeg run, written to AUDIO_DIR/.converting and moved into place once
+Whisper is done with the video. If the transcription succeeded it is first recorded as already
+transcribed in the job ledger, so audio_watcher does not transcribe it a second time; if it
+failed, audio_watcher transcribes the .mp3 instead. If archiving fails, the partial .mp3 is
+deleted and the video is decoded again without it, so the transcription still goes ahead.
+
+Used by orchestrator.py when STREAMING_HANDOFF = True, or on its own:
+    python stream_handoff.py <video_file.mp4> [--no-mp3]
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+from config import AUDIO_DIR, STREAMING_ARCHIVE_MP3
+import ffmpeg
+from converter import PARTIAL_DIR_NAME, decode_audio_pcm
+from transcriber import model_variant, transcribe_audio
+from job_ledger import JobLedger
+from leases import LeaseManager
+import dedup
+from readiness import move_into_place
+
+_ledger = None
+_leases = None
+_ledger_lock = threading.Lock()
+
+
+def _transcribe_ledger():
+    """Returns the shared "transcribe" stage ledger, opening it on first use."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = JobLedger("transcribe")
+        return _ledger
+
+
+def _transcribe_leases():
+    """Returns the "transcribe" stage lease manager, creating it on first use."""
+    global _leases
+    with _ledger_lock:
+        if _leases is None:
+            _leases = LeaseManager("transcribe")
+        return _leases
+
+
+def _remove_partial(partial_path):
+    try:
+        partial_path.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"[stream_handoff] Could not remove partial output {partial_path.name}: {e}")
+
+
+def decode_with_archive(mp4_path):
+    """
+    Decodes a video's audio for Whisper and writes the archival .mp3 in the same ffmpeg run.
+    The .mp3 stays in AUDIO_DIR/.converting until the transcription's outcome is known
+    (publish_archive()).
+    Returns:
+        tuple: (samples, path of the finished .mp3 in .converting, or None if archiving failed).
+    """
+    mp3_path = AUDIO_DIR / (mp4_path.stem + '.mp3')
+    partial_path = AUDIO_DIR / PARTIAL_DIR_NAME / mp3_path.name
+    partial_path.parent.mkdir(exist_ok=True)
+    try:
+        return decode_audio_pcm(mp4_path, archive_path=partial_path), partial_path
+    except ffmpeg.Error:
+        _remove_partial(partial_path)
+        print(f"[stream_handoff] Archiving {mp3_path.name} failed; decoding {mp4_path.name} without it.")
+        return decode_audio_pcm(mp4_path), None
+
+
+def publish_archive(partial_path, transcribed):
+    """
+    Moves a finished .mp3 from .converting into AUDIO_DIR. If the video was transcribed, the
+    .mp3 is recorded as transcribed first, so audio_watcher skips it (on other machines too);
+    otherwise it is left queued, so audio_watcher transcribes it.
+    """
+    mp3_path = AUDIO_DIR / partial_path.name
+    ledger = _transcribe_ledger()
+    try:
+        if transcribed:
+            ledger.mark_done(mp3_path)
+            _transcribe_leases().finish(mp3_path)
+        else:
+            ledger.mark_queued(mp3_path)
+        move_into_place(partial_path, mp3_path)
+    except OSError as e:
+        print(f"[stream_handoff] Archiving {mp3_path.name} failed: {e}")
+        _remove_partial(partial_path)
+        if transcribed and not mp3_path.exists():
+            ledger.mark_failed(mp3_path, e)
+
+
+def convert_and_transcribe(mp4_path, model=None, archive_mp3=STREAMING_ARCHIVE_MP3, segment_pool=None):
+    """
+    Decodes a video's audio in memory and transcribes it with Whisper.
+    Args:
+        mp4_path (Path): Path to the video file.
+        model (whisper.Whisper, optional): Already loaded model to reuse.
+        archive_mp3 (bool): Also write an .mp3 to AUDIO_DIR, from the same ffmpeg run.
+        segment_pool (SegmentPool, optional): Pool to use if the recording is long.
+    Returns:
+        Path: Path to the created .txt transcript.
+    """
+    # An identical copy of a video that was already transcribed reuses its transcript
+    variant = model_variant(model)
+    reused = dedup.reuse("transcribe", mp4_path, variant)
+    if reused:
+        return reused[0]
+    audio, archive = decode_with_archive(mp4_path) if archive_mp3 else (decode_audio_pcm(mp4_path), None)
+    try:
+        txt_path = transcribe_audio(model, audio, mp4_path, segment_pool)
+    except BaseException:
+        if archive is not None:
+            publish_archive(archive, transcribed=False)
+        raise
+    if archive is not None:
+        publish_archive(archive, transcribed=True)
+    dedup.remember("transcribe", mp4_path, [txt_path], variant)
+    return txt_path
+
+
+if __name__ == "__main__":
+    # Entry point: expects a video file path as argument
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if not args:
+        print("Usage: python stream_handoff.py <video_file.mp4> [--no-mp3]")
+        sys.exit(1)
+    video_file = Path(args[0])
+    if not video_file.exists():
+        print(f"File not found: {video_file}")
+        sys.exit(1)
+    convert_and_transcribe(video_file, archive_mp3=STREAMING_ARCHIVE_MP3 and '--no-mp3' not in sys.argv)
@@ -1,54 +1,499 @@
-
 """
 transcriber.py
 --------------
-Transcribes .mp3 files in the audio folder to text using OpenAI Whisper CLI.
+Transcribes .mp3 files in the audio folder to text using OpenAI Whisper.
+
+This script can be run on its own for a single file, but audio_watcher.py normally
+sends files to the long-lived TranscriptionWorker (transcription_worker.py), which
+uses the helpers below with a model that stays loaded between files.
+The .txt transcript is written to the transcripts folder, same as the Whisper CLI did.
+
+Segmented mode (SegmentPool): long recordings are split at silences into pieces of
+SEGMENT_MIN_SECONDS..SEGMENT_MAX_SECONDS, transcribed in parallel by a pool of worker
+processes (each with its own model and a share of the CPU threads), and stitched back
+together in order. Where no silence is found a piece is cut mid-speech with a small overlap,
+and the words repeated across the cut are removed when stitching.
 
-This script is called by audio_watcher.py when a new .mp3 file is detected.
-It uses the Whisper CLI to generate a .txt transcript in the transcripts folder.
+Streaming mode (STREAM_TRANSCRIPTS): the recording is cut the same way, and each piece's
+segments are appended to <stem>.segments.jsonl as soon as the piece is transcribed, so the
+editor can start formatting while the rest is still being transcribed.
 """
 
 from pathlib import Path
+import argparse
+import os
+import re
 import sys
-import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+import whisper
+from whisper.audio import SAMPLE_RATE
+from whisper.utils import get_writer
 
-# Import transcript directory from config
-from config import TRANSCRIPTS_DIR
+
+# Import transcript directory and model settings from config
+from config import (
+    TRANSCRIPTS_DIR, WHISPER_MODEL, TRANSCRIBE_SEGMENTED, SEGMENTED_MIN_SECONDS,
+    SEGMENT_TARGET_SECONDS, SEGMENT_MIN_SECONDS, SEGMENT_MAX_SECONDS, SEGMENT_OVERLAP_SECONDS,
+    SILENCE_THRESHOLD_DB, SEGMENT_WORKERS, SEGMENT_THREADS_PER_WORKER, STREAM_TRANSCRIPTS,
+)
+from segment_stream import SegmentStream
+import dedup
+import metrics
+from readiness import move_into_place
 # Ensure the transcript directory exists
 TRANSCRIPTS_DIR.mkdir(exist_ok=True)
+# Folder (inside TRANSCRIPTS_DIR) where transcripts are written before being moved into place
+PARTIAL_DIR_NAME = ".writing"
+
+
+def load_model(model_name=WHISPER_MODEL):
+    """
+    Loads a Whisper model into memory.
+    Args:
+        model_name (str): Name of the Whisper model (tiny, base, small, medium, large),
+            or "fake" for the benchmark stand-in (bench_fakes.py).
+    Returns:
+        whisper.Whisper: The loaded model.
+    """
+    print(f"[transcriber] Loading Whisper model '{model_name}'...")
+    return _load(model_name)
+
+
+def _load(model_name, device=None):
+    """Loads a Whisper model, or the benchmark stand-in for "fake"."""
+    if model_name == "fake":
+        from bench_fakes import FakeWhisper
+        model = FakeWhisper()
+    else:
+        model = whisper.load_model(model_name, device=device)
+    # Remembered for model_variant(): the model object does not record its name
+    model.notes_model_name = model_name
+    return model
+
 
-def transcribe(mp3_path):
+def model_variant(model=None):
     """
-    Transcribes a single .mp3 file to text using the Whisper CLI.
+    Name of the Whisper model a transcription uses (the loaded `model`, or the configured one
+    that transcribe() loads without it), which keys its transcripts in dedup.py.
+    """
+    return getattr(model, "notes_model_name", WHISPER_MODEL) if model is not None else WHISPER_MODEL
+
+
+def transcribe_with_model(model, mp3_path):
+    """
+    Transcribes a single audio file with an already loaded Whisper model.
     The output is saved as a .txt file in the transcript directory.
+    Args:
+        model (whisper.Whisper): Model returned by load_model().
+        mp3_path (Path): Path to the audio file.
+    Returns:
+        Path: Path to the created .txt transcript.
+    """
+    print("Transcribing:", mp3_path.name)
+    with metrics.span("transcribe", file=mp3_path.name, mode="whole") as span:
+        # Decode first (Whisper would do the same) so the span knows the media length
+        audio = whisper.load_audio(str(mp3_path))
+        span["media_seconds"] = len(audio) / SAMPLE_RATE
+        # fp16 only works on GPU; on CPU Whisper would warn and fall back anyway
+        result = model.transcribe(audio, verbose=True, fp16=(model.device.type == "cuda"))
+    return write_transcript(result, mp3_path)
+
+
+def transcribe_array(model, audio, source_path):
+    """
+    Transcribes audio that is already decoded in memory (16 kHz mono float32 samples).
+    The transcript is named after source_path, e.g. video.mp4 -> video.txt.
+    Args:
+        model (whisper.Whisper): Model returned by load_model().
+        audio (numpy.ndarray): Samples, e.g. from converter.decode_audio_pcm().
+        source_path (Path): Original media file, used for naming and log lines.
+    Returns:
+        Path: Path to the created .txt transcript.
+    """
+    print("Transcribing (in-memory audio):", source_path.name)
+    result = model.transcribe(audio, verbose=True, fp16=(model.device.type == "cuda"))
+    return write_transcript(result, source_path)
+
+
+def write_transcript(result, source_path):
+    """
+    Writes a Whisper result as <stem>.txt in the transcript directory (in PARTIAL_DIR_NAME
+    first, so the transcript watcher never sees a half-written file).
+    Returns:
+        Path: Path to the created .txt transcript.
+    """
+    partial_dir = TRANSCRIPTS_DIR / PARTIAL_DIR_NAME
+    partial_dir.mkdir(exist_ok=True)
+    write_txt = get_writer("txt", str(partial_dir))
+    write_txt(result, str(source_path))
+    txt_path = TRANSCRIPTS_DIR / (source_path.stem + '.txt')
+    move_into_place(partial_dir / txt_path.name, txt_path)
+    print(f"Transcribed {source_path.name} to {txt_path.name}")
+    return txt_path
+
+
+# --- Segmented mode ---------------------------------------------------------
+
+def find_silences(audio, threshold_db=SILENCE_THRESHOLD_DB, min_silence=0.5, window=0.1):
+    """
+    Finds silent stretches in 16 kHz mono audio by measuring loudness in short windows.
+    Args:
+        audio (numpy.ndarray): Samples in [-1, 1].
+        threshold_db (float): Windows quieter than this (dBFS) count as silent.
+        min_silence (float): Minimum length in seconds of a silent stretch.
+        window (float): Window length in seconds.
+    Returns:
+        list: (start, end) times in seconds of each silent stretch.
+    """
+    hop = int(SAMPLE_RATE * window)
+    n = len(audio) // hop
+    if n == 0:
+        return []
+    frames = audio[:n * hop].reshape(n, hop)
+    rms_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+    silent = np.concatenate(([0], (rms_db < threshold_db).astype(np.int8), [0]))
+    edges = np.diff(silent)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    min_frames = int(min_silence / window)
+    return [(float(s * window), float(e * window)) for s, e in zip(starts, ends) if e - s >= min_frames]
+
+
+def plan_segments(duration, silences, target=SEGMENT_TARGET_SECONDS, min_len=SEGMENT_MIN_SECONDS,
+                  max_len=SEGMENT_MAX_SECONDS, overlap=SEGMENT_OVERLAP_SECONDS):
+    """
+    Chooses where to cut a recording: at the silence closest to `target` seconds into each
+    piece, or at `max_len` (with `overlap` seconds repeated) if there is no silence in range.
+    Returns:
+        list: (audio_start, end, overlapped) per segment, in seconds. `overlapped` is True
+        when the segment starts `overlap` seconds before the previous one ended.
+    """
+    midpoints = [(s + e) / 2 for s, e in silences]
+    segments = []
+    start, overlapped = 0.0, False
+    while duration - start > max_len:
+        candidates = [m for m in midpoints if start + min_len <= m <= start + max_len]
+        audio_start = max(0.0, start - overlap) if overlapped else start
+        if candidates:
+            cut = min(candidates, key=lambda m: abs(m - (start + target)))
+            segments.append((audio_start, cut, overlapped))
+            start, overlapped = cut, False
+        else:
+            cut = start + max_len
+            segments.append((audio_start, cut, overlapped))
+            start, overlapped = cut, True
+    audio_start = max(0.0, start - overlap) if overlapped else start
+    segments.append((audio_start, duration, overlapped))
+    return segments
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def drop_repeated_words(previous_text, text, max_words=30):
+    """
+    Removes words at the start of `text` that repeat the end of `previous_text`
+    (the overlap of a mid-speech cut).
+    Returns:
+        str: `text` without the repeated prefix.
+    """
+    prev_words = [_normalize_word(w) for w in previous_text.split()[-max_words:]]
+    words = text.split()
+    norm = [_normalize_word(w) for w in words[:max_words]]
+    for k in range(min(len(prev_words), len(norm)), 0, -1):
+        if prev_words[-k:] == norm[:k]:
+            return " ".join(words[k:])
+    return text
+
+
+def stitch_piece(previous_segments, offset, overlapped, result):
+    """
+    Shifts one piece's segments to the recording's timeline and removes words repeated
+    across an overlapped cut.
+    Args:
+        previous_segments (list): Segments already stitched before this piece.
+        offset (float): Start of the piece in the recording, in seconds.
+        overlapped (bool): The piece starts inside the previous one.
+        result (dict): Whisper result for the piece.
+    Returns:
+        list: The piece's non-empty segments, ready to append.
+    """
+    piece_segments = [dict(s) for s in result["segments"]]
+    if overlapped and previous_segments and piece_segments:
+        piece_segments[0]["text"] = " " + drop_repeated_words(previous_segments[-1]["text"], piece_segments[0]["text"])
+    stitched = []
+    for s in piece_segments:
+        s["start"] += offset
+        s["end"] += offset
+        if s["text"].strip():
+            stitched.append(s)
+    return stitched
+
+
+def stitch_results(pieces):
+    """
+    Combines per-segment Whisper results into one result dict, in segment order.
+    Args:
+        pieces (list): (index, offset_seconds, overlapped, result) tuples.
+    Returns:
+        dict: {"text", "segments", "language"} like a single Whisper result.
+    """
+    segments = []
+    language = None
+    for _, offset, overlapped, result in sorted(pieces, key=lambda p: p[0]):
+        language = language or result.get("language")
+        segments.extend(stitch_piece(segments, offset, overlapped, result))
+    for i, s in enumerate(segments):
+        s["id"] = i
+    return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": language}
+
+
+def pool_settings(workers=SEGMENT_WORKERS, threads=SEGMENT_THREADS_PER_WORKER):
+    """
+    Picks the worker count and torch threads per worker so workers x threads fits the CPU.
+    Returns:
+        tuple: (workers, threads_per_worker)
+    """
+    cores = os.cpu_count() or 1
+    workers = workers or max(1, min(4, cores // 2))
+    threads = threads or max(1, cores // workers)
+    return workers, threads
+
+
+# Model loaded once in each pool worker process
+_segment_model = None
+
+
+def _init_segment_worker(model_name, threads):
+    """
+    Pool initializer: limits torch to its share of the CPU and loads the model once.
+    """
+    global _segment_model
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Only allowed once per process, before any parallel work
+    _segment_model = _load(model_name, device="cpu")
+
+
+def _transcribe_segment(index, audio):
+    """
+    Pool task: transcribes one segment with the worker's model.
+    """
+    result = _segment_model.transcribe(audio, verbose=None, fp16=False)
+    return index, result
+
+
+class SegmentPool:
+    """
+    Process pool for segmented transcription. Workers (and their models) are started on first
+    use and kept until shutdown(), so several long files in a row only pay the model load once.
+    """
+
+    def __init__(self, model_name=WHISPER_MODEL, workers=SEGMENT_WORKERS, threads=SEGMENT_THREADS_PER_WORKER):
+        self.model_name = model_name
+        self.workers, self.threads = pool_settings(workers, threads)
+        self._executor = None
+        # Several stage threads may share one pool; only the first starts the workers
+        self._executor_lock = threading.Lock()
+
+    def should_segment(self, audio):
+        """
+        True if the audio is long enough to benefit and Whisper is running on the CPU.
+        """
+        import torch
+        return len(audio) >= SEGMENTED_MIN_SECONDS * SAMPLE_RATE and not torch.cuda.is_available()
+
+    def iter_pieces(self, audio, plan):
+        """
+        Transcribes the planned pieces in parallel and yields them in order as they finish.
+        Yields:
+            tuple: (index, offset_seconds, overlapped, result) per piece.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_segment_worker,
+                    initargs=(self.model_name, self.threads),
+                )
+            executor = self._executor
+        futures = []
+        for index, (start, end, _) in enumerate(plan):
+            piece = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+            futures.append(executor.submit(_transcribe_segment, index, piece))
+        for future in futures:
+            index, result = future.result()
+            start, _, overlapped = plan[index]
+            print(f"[transcriber] Segment {index+1}/{len(plan)} done")
+            yield index, start, overlapped, result
+
+    def transcribe(self, audio, source_path):
+        """
+        Splits audio at silences, transcribes the pieces in parallel and writes the stitched transcript.
+        Args:
+            audio (numpy.ndarray): 16 kHz mono samples.
+            source_path (Path): Original media file, used for naming and log lines.
+        Returns:
+            Path: Path to the created .txt transcript.
+        """
+        duration = len(audio) / SAMPLE_RATE
+        plan = plan_segments(duration, find_silences(audio))
+        print(f"[transcriber] Segmented mode: {source_path.name} ({duration / 60:.0f} min) in {len(plan)} pieces "
+              f"across {self.workers} workers x {self.threads} threads")
+        pieces = list(self.iter_pieces(audio, plan))
+        return write_transcript(stitch_results(pieces), source_path)
+
+    def shutdown(self):
+        """
+        Stops the worker processes and frees their models.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+# --- Streaming mode ---------------------------------------------------------
+
+def _iter_pieces_sequential(model, audio, plan):
+    """
+    Transcribes the planned pieces one after another with a single model.
+    Each piece is prompted with the end of the previous one, so Whisper keeps its context
+    across the cuts as it would within one long transcription.
+    Yields:
+        tuple: (index, offset_seconds, overlapped, result) per piece.
+    """
+    previous_text = ""
+    for index, (start, end, overlapped) in enumerate(plan):
+        piece = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+        result = model.transcribe(piece, verbose=None, fp16=(model.device.type == "cuda"),
+                                  initial_prompt=previous_text[-200:] or None)
+        previous_text = result["text"]
+        print(f"[transcriber] Piece {index+1}/{len(plan)} done")
+        yield index, start, overlapped, result
+
+
+def transcribe_streaming(model, audio, source_path, segment_pool=None):
+    """
+    Transcribes audio piece by piece, appending each finished piece's segments to the segment
+    stream (segment_stream.py) so the editor can start before the whole recording is done.
+    The pieces are cut at silences like in segmented mode; with a SegmentPool and a long
+    recording they are transcribed in parallel, otherwise one after another with `model`.
+    Args:
+        model (whisper.Whisper): Model for sequential transcription (loaded if None and needed).
+        audio (numpy.ndarray): 16 kHz mono samples.
+        source_path (Path): Original media file, used for naming and log lines.
+        segment_pool (SegmentPool, optional): Pool to use if the recording is long.
+    Returns:
+        Path: Path to the created .txt transcript.
+    """
+    duration = len(audio) / SAMPLE_RATE
+    plan = plan_segments(duration, find_silences(audio))
+    stream = SegmentStream(source_path)
+    print(f"[transcriber] Streaming {source_path.name} ({duration / 60:.0f} min) in {len(plan)} pieces to {stream.path.name}")
+    if segment_pool is not None and segment_pool.should_segment(audio):
+        pieces = segment_pool.iter_pieces(audio, plan)
+    else:
+        if model is None:
+            model = load_model()
+        pieces = _iter_pieces_sequential(model, audio, plan)
+    segments = []
+    language = None
+    with stream:
+        for _, offset, overlapped, result in pieces:
+            language = language or result.get("language")
+            stitched = stitch_piece(segments, offset, overlapped, result)
+            stream.write(stitched)
+            segments.extend(stitched)
+        for i, s in enumerate(segments):
+            s["id"] = i
+        result = {"text": "".join(s["text"] for s in segments), "segments": segments, "language": language}
+        # Written before the done marker, so the editor finds the .txt once the stream ends
+        return write_transcript(result, source_path)
+
+
+def transcribe_audio(model, audio, source_path, segment_pool=None, stream=STREAM_TRANSCRIPTS):
     """
+    Transcribes decoded audio with whichever mode applies: streaming, segmented or whole.
+    Args:
+        model (whisper.Whisper): Already loaded model, or None to load the configured one if needed.
+        audio (numpy.ndarray): 16 kHz mono samples.
+        source_path (Path): Original media file, used for naming and log lines.
+        segment_pool (SegmentPool, optional): Pool to use if the recording is long.
+        stream (bool): Write a segment stream for the editor while transcribing.
+    Returns:
+        Path: Path to the created .txt transcript.
     """
-    Transcribes a single .mp3 file to markdown using the Whisper CLI.
-    The output is saved as a .md file in the TRANSCRIPT_DIR.
-    """
-    print ("Transcribing:", mp3_path.name)
-    # Build the whisper CLI command
-    cmd = [
-        'whisper', str(mp3_path), '--model', 'tiny', '--output_format', 'txt', '--output_dir', str(TRANSCRIPTS_DIR)
-    ]
-    # Run the whisper command to generate a .txt transcript and show progress in real time
-    process = subprocess.Popen(cmd, stdout=sys.stdout, stderr=sys.stderr)
-    process.communicate()
-    if process.returncode != 0:
-        raise subprocess.CalledProcessError(process.returncode, cmd)
-    txt_path = TRANSCRIPTS_DIR / (mp3_path.stem + '.txt')
-    print(f"Transcribed {mp3_path.name} to {txt_path.name}")
+    if stream:
+        mode = "stream"
+    elif segment_pool is not None and segment_pool.should_segment(audio):
+        mode = "segmented"
+    else:
+        mode = "whole"
+    with metrics.span("transcribe", file=source_path.name, mode=mode,
+                      media_seconds=len(audio) / SAMPLE_RATE):
+        if mode == "stream":
+            return transcribe_streaming(model, audio, source_path, segment_pool)
+        if mode == "segmented":
+            return segment_pool.transcribe(audio, source_path)
+        if model is None:
+            model = load_model()
+        return transcribe_array(model, audio, source_path)
+
+
+def transcribe(mp3_path, model=None, segment_pool=None, stream=STREAM_TRANSCRIPTS):
+    """
+    Transcribes a single .mp3 file to text using Whisper.
+    Loads the configured model if one is not passed in. If a SegmentPool is given and the
+    recording is long, it is transcribed in parallel segments instead. An identical copy of a
+    file that was already transcribed reuses its transcript (dedup.py).
+    Args:
+        mp3_path (Path): Path to the .mp3 file.
+        model (whisper.Whisper, optional): Already loaded model to reuse.
+        segment_pool (SegmentPool, optional): Pool to use for long recordings.
+        stream (bool): Write a segment stream for the editor while transcribing.
+    Returns:
+        Path: Path to the created .txt transcript.
+    """
+    variant = model_variant(model)
+    reused = dedup.reuse("transcribe", mp3_path, variant)
+    if reused:
+        return reused[0]
+    if segment_pool is not None or stream:
+        txt_path = transcribe_audio(model, whisper.load_audio(str(mp3_path)), mp3_path, segment_pool, stream)
+    else:
+        if model is None:
+            model = load_model()
+        txt_path = transcribe_with_model(model, mp3_path)
+    dedup.remember("transcribe", mp3_path, [txt_path], variant)
     return txt_path
 
+
 if __name__ == "__main__":
     # Entry point: expects a .mp3 file path as argument
-    if len(sys.argv) < 2:
-        print("Usage: python transcriber.py <audio_file.mp3>")
-        sys.exit(1)
-    mp3_file = Path(sys.argv[1])
-    if not mp3_file.exists():
-        print(f"File not found: {mp3_file}")
+    parser = argparse.ArgumentParser(description="Transcribe an audio file into the transcripts folder.")
+    parser.add_argument("audio", type=Path, help="Audio file (.mp3)")
+    parser.add_argument("--segmented", action=argparse.BooleanOptionalAction, default=TRANSCRIBE_SEGMENTED,
+                        help="Transcribe long recordings in parallel pieces (default: TRANSCRIBE_SEGMENTED)")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=STREAM_TRANSCRIPTS,
+                        help="Write the pieces to a .segments.jsonl stream as they finish (default: STREAM_TRANSCRIPTS)")
+    args = parser.parse_args()
+    if not args.audio.exists():
+        print(f"File not found: {args.audio}")
         sys.exit(1)
     # Transcribe the provided .mp3 file
-    transcribe(mp3_file)
\ No newline at end of file
+    if args.segmented:
+        pool = SegmentPool()
+        try:
+            transcribe(args.audio, segment_pool=pool, stream=args.stream)
+        finally:
+            pool.shutdown()
+    else:
+        transcribe(args.audio, stream=args.stream)
@@ -7,121 +7,127 @@ transcript_watcher.py
 ---------------------
 Watches the transcripts folder for new .txt files and triggers formatting/summarization.
 
-This script continuously monitors the transcripts folder for new .txt files.
-When a new file is detected, it triggers the formatting/summarization process (editor.py).
-Processed files are tracked to avoid duplicate processing.
-The watcher can be stopped gracefully by creating a STOP_PIPELINE file in the parent directory.
+This script monitors the transcripts folder for new .txt files using filesystem events
+(fs_watch.py), falling back to periodic scans where events are unavailable.
+When a new file is detected and complete (readiness.py), it triggers the formatting/summarization
+process (editor.py), run in a warm worker process (warm_pool.py) that is started with the watcher and
+has the Gemini client imported already.
+Waiting transcripts are edited shortest first, with aging and manual priorities (scheduler.py).
+Processed files are tracked in the shared job ledger (job_ledger.py) to avoid duplicate processing.
+With DISTRIBUTED_WORKERS, several transcript watchers (here or on other machines) can share the
+folder, each claiming a file with a lease (leases.py) before editing it.
+The watcher is stopped, drained or paused through its control channel (control.py, used by
+stop_pipeline.py), or stopped by creating a STOP_PIPELINE file in the parent directory.
+A drain lets the edit in progress finish; stop-now cancels it.
+
+With STREAM_TRANSCRIPTS, the transcriber also writes a <stem>.segments.jsonl stream as soon as it
+starts. The watcher hands that stream to editor.py right away, and once the notes are written
+the matching .txt is recorded as done too, so it is not edited a second time, and the stream
+is deleted. A .txt that arrives while its stream is still being edited (by this watcher or one
+on another machine) waits for that edit instead of starting its own.
 """
 
 
-import time
-from pathlib import Path
-import subprocess
-import sys
-
-def is_file_unlocked(filepath, retries=6, delay=5):
-    """
-    Utility function to check if a file is unlocked (not in use by another process).
-    Retries a few times before giving up.
-    """
-    """
-    Checks if a file can be opened for exclusive access. Retries if locked.
-    Args:
-        filepath (Path): Path to the file.
-        retries (int): Number of times to retry.
-        delay (int): Seconds to wait between retries.
-    Returns:
-        bool: True if file is unlocked, False otherwise.
-    """
-    for attempt in range(retries):
-        try:
-            with open(filepath, 'rb+'):
-                return True
-        except (PermissionError, OSError):
-            if attempt < retries - 1:
-                print(f"[transcript_watcher] File {filepath.name} is locked (attempt {attempt+1}/{retries}), retrying in {delay}s...")
-                time.sleep(delay)
-    print(f"[transcript_watcher] File {filepath.name} is still locked after {retries} attempts. Skipping for now.")
-    return False
-
+from concurrent.futures import CancelledError
 
 # Import folder paths from config
-from config import TRANSCRIPTS_DIR, PROCESSED_TRANSCRIPTS_FILE
-
+from config import TRANSCRIPTS_DIR
+from fs_watch import DirectoryWatcher
+import control
+from job_ledger import JobLedger, DONE, FAILED
+from leases import LeaseManager, claim_job
+from readiness import ReadinessTracker
+from scheduler import new_queue
+from segment_stream import SEGMENTS_SUFFIX, is_segments_file, remove_stream, segments_path, transcript_for
+from warm_pool import stage_pool, JobCancelled
 
-def get_processed_files():
-    """
-    Reads the list of already processed files from the processed_editor file.
-    Returns a set of normalized absolute file paths as strings.
-    """
-    """
-    Reads the list of already processed files from the processed_editor file.
-    Returns a set of normalized absolute file paths as strings.
-    """
-    if not PROCESSED_TRANSCRIPTS_FILE.exists():
-        return set()
-    with open(PROCESSED_TRANSCRIPTS_FILE, "r", encoding="utf-8") as f:
-        lines = [line.strip() for line in f if line.strip()]
-    return set(str(Path(line).resolve()) for line in lines)
+# Seconds before a transcript whose segment stream is still being edited is looked at again
+_STREAM_RECHECK_SECONDS = 30
 
 
-def save_processed_file(filename):
+def stream_pending(txt_path, ledger, leases):
     """
-    Appends a processed filename to the processed_editor file.
+    True if the transcript's segment stream is still there and has not failed: the stream's
+    edit (here, or by a watcher on another machine) writes the notes for this .txt too.
     """
-    """
-    Appends a processed filename to the processed_editor file.
-    """
-    with open(PROCESSED_TRANSCRIPTS_FILE, "a", encoding="utf-8") as f:
-        f.write(str(Path(filename).resolve()) + "\n")
-
+    stream = segments_path(txt_path)
+    if not stream.exists() or ledger.state(stream) == FAILED:
+        return False
+    record = leases.holder(stream)
+    return not (record is not None and record.get("state") == FAILED)
 
 
 def main():
     setproctitle.setproctitle("transcript_watcher.py")
+    controller = control.serve("transcript_watcher")
     """
     Main loop that watches the TRANSCRIPTS_DIR for new .txt files.
     When a new file is found, triggers editor.py and marks the file as processed.
-    Exits cleanly if STOP_PIPELINE file is detected.
+    Exits cleanly on stop-now or drain, or if STOP_PIPELINE file is detected.
     """
     print(f"[transcript_watcher] Watching folder: {TRANSCRIPTS_DIR}")
-    processed = get_processed_files()
-    stop_file = Path(__file__).parent.parent / "STOP_PIPELINE"
-    while True:
-        if stop_file.exists():
-            print("[transcript_watcher] STOP_PIPELINE detected. Exiting watcher.")
-            break
-        for file in TRANSCRIPTS_DIR.glob("*.txt"):
-            file_path = str(file.resolve())
-            if file_path not in processed:
+    ledger = JobLedger("edit", retry_failed=True)
+    readiness = ReadinessTracker("transcript_watcher")
+    leases = LeaseManager("edit")
+    backlog = new_queue("edit")
+    future = None
+    controller.in_flight = lambda: int(future is not None and not future.done())
+    with DirectoryWatcher(TRANSCRIPTS_DIR, ("*.txt", "*" + SEGMENTS_SUFFIX), backlog=backlog, control=controller) as watcher, \
+            stage_pool("edit") as editors:
+        for file in watcher:
+            if ledger.is_processed(file):
+                continue
+            streaming = is_segments_file(file)
+            if streaming and (ledger.is_processed(transcript_for(file)) or leases.finished(transcript_for(file))):
+                # Left over from a run (here or elsewhere) whose transcript was already edited
+                ledger.mark_done(file)
+                remove_stream(file)
+                continue
+            # A stream is read while it is still being written; a .txt must be complete first
+            if not streaming and not readiness.ready(file, watcher):
+                continue
+            if not streaming and stream_pending(file, ledger, leases):
+                # Recorded as done once its stream's edit finishes; check again then
+                watcher.requeue(file, _STREAM_RECHECK_SECONDS)
+                continue
+            lease = claim_job(leases, file, ledger, watcher.requeue)
+            if lease is None:
+                continue
+            if streaming:
+                print(f"[transcript_watcher] New segment stream detected: {file.name}")
+            else:
                 print(f"[transcript_watcher] New transcript detected: {file.name}")
-                # Check if file is unlocked before processing
-                if not is_file_unlocked(file, retries=6, delay=5):
-                    print(f"[transcript_watcher] Skipping {file.name} for now (still locked). Will check again later.")
-                    continue
-                editor_path = Path(__file__).parent / "editor.py"
-                try:
-                    process = subprocess.Popen(
-                        [sys.executable, str(editor_path), str(file)],
-                        stdout=sys.stdout,
-                        stderr=sys.stderr
-                    )
-                    # While the formatting/summarization runs, check for STOP_PIPELINE
-                    while process.poll() is None:
-                        if stop_file.exists():
-                            print("[transcript_watcher] STOP_PIPELINE detected during processing. Terminating subprocess.")
-                            process.terminate()
-                            process.wait(timeout=5)
-                            break
-                        time.sleep(1)
-                    if process.returncode not in (0, None):
-                        print(f"[transcript_watcher] Error: editor.py exited with code {process.returncode} for {file}")
-                except Exception as e:
-                    print(f"[transcript_watcher] Error running editor.py for {file}: {e}")
-                file_path = str(file.resolve())
-                save_processed_file(file_path)
-                processed.add(file_path)
-        time.sleep(5)  # Check every 5 seconds
+            ledger.mark_started(file)
+            error, cancelled = None, False
+            future = editors.submit("process_stream" if streaming else "process_transcript", file)
+            # Returns early only on stop-now (or STOP_PIPELINE); a drain waits for the edit to finish
+            if not controller.wait_for(future):
+                print("[transcript_watcher] Stop requested during processing. Cancelling the edit.")
+                editors.cancel(future)
+            try:
+                future.result()
+            except (JobCancelled, CancelledError):
+                cancelled = True
+            except Exception as e:
+                error = e
+                print(f"[transcript_watcher] Error editing {file}: {e}")
+            if cancelled:
+                # Not a failure: edited again on the next start, resuming from the editor checkpoint
+                ledger.mark_queued(file)
+                lease.release()
+                print(f"[transcript_watcher] Cancelled the edit of {file.name}; it will be edited on the next start.")
+            elif error is None:
+                ledger.mark_done(file)
+                lease.release(DONE)
+                if streaming:
+                    ledger.mark_done(transcript_for(file))
+                    leases.finish(transcript_for(file))
+                    remove_stream(file)
+            else:
+                # Failed edits are retried on the next start, resuming from the editor checkpoint
+                ledger.mark_failed(file, error)
+                lease.release()
+    print("[transcript_watcher] Stop requested. Exiting watcher.")
 
 if __name__ == "__main__":
     main()
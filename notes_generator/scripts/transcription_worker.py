@@ -0,0 +1,102 @@
+"""
+transcription_worker.py
+-----------------------
+Long-lived transcription worker that keeps a Whisper model loaded between files.
+
+Spawning the Whisper CLI for every .mp3 means paying for Python startup, the torch import
+and loading the model from disk each time. The worker is a warm worker process (warm_pool.py)
+that loads the configured model as soon as it starts and transcribes queued files with it.
+If no job arrives for WHISPER_IDLE_TIMEOUT seconds the process exits to free the model's memory,
+and a new one loads the model again on the next job.
+Because it runs in its own process, a transcription that crashes (e.g. runs out of memory)
+fails on its own without taking the watcher down, and cancel() stops one straight away.
+With TRANSCRIBE_SEGMENTED, long recordings go to a SegmentPool (transcriber.py) inside the
+worker, whose own worker processes are likewise kept warm.
+
+Usage (from audio_watcher.py):
+    worker = TranscriptionWorker()
+    worker.start()
+    future = worker.submit(mp3_path)
+    txt_path = future.result()
+"""
+
+from config import WHISPER_MODEL, WHISPER_IDLE_TIMEOUT, TRANSCRIBE_SEGMENTED
+from warm_pool import stage_pool
+
+# Loaded in the worker process by init_worker()
+_model = None
+_segment_pool = None
+
+
+def init_worker(model_name=WHISPER_MODEL, segmented=TRANSCRIBE_SEGMENTED):
+    """
+    Worker process initializer: loads the model once, before the first job.
+    """
+    global _model, _segment_pool
+    # Imported here, so the watcher process itself never loads torch
+    from transcriber import load_model, SegmentPool
+    _model = load_model(model_name)
+    _segment_pool = SegmentPool(model_name) if segmented else None
+
+
+def transcribe_job(mp3_path):
+    """
+    Worker job: transcribes one file with the loaded model.
+    """
+    from transcriber import transcribe
+    return transcribe(mp3_path, model=_model, segment_pool=_segment_pool)
+
+
+def close_worker():
+    """
+    Worker process finalizer: stops the segment pool's processes.
+    """
+    if _segment_pool is not None:
+        _segment_pool.shutdown()
+
+
+class TranscriptionWorker:
+    """
+    Runs transcription jobs one at a time in a worker process with a warm model.
+    """
+
+    def __init__(self, model_name=WHISPER_MODEL, idle_timeout=WHISPER_IDLE_TIMEOUT, segmented=TRANSCRIBE_SEGMENTED):
+        """
+        Args:
+            model_name (str): Whisper model to load.
+            idle_timeout (float): Seconds without jobs before the worker exits and frees the model.
+                None keeps the model loaded for the lifetime of the worker.
+            segmented (bool): Transcribe long recordings in parallel segments.
+        """
+        self.model_name = model_name
+        self.idle_timeout = idle_timeout
+        self._pool = stage_pool("transcribe", initargs=(model_name, segmented), idle_timeout=idle_timeout)
+
+    def start(self):
+        """
+        Starts the worker process, which loads the model right away.
+        """
+        self._pool.start()
+
+    def submit(self, mp3_path):
+        """
+        Queues an audio file for transcription.
+        Args:
+            mp3_path (Path): Path to the audio file.
+        Returns:
+            Future: Resolves to the Path of the .txt transcript, or raises the transcription error
+            (warm_pool.JobCancelled if it was cancelled, warm_pool.WorkerCrashed if the worker died).
+        """
+        return self._pool.submit("transcribe_job", mp3_path)
+
+    def cancel(self, future):
+        """
+        Stops a transcription: a queued one is dropped, a running one's worker is terminated.
+        """
+        return self._pool.cancel(future)
+
+    def stop(self, cancel=False):
+        """
+        Stops the worker after the current job (with cancel=True: at once). Queued jobs are cancelled.
+        """
+        self._pool.shutdown(cancel_queued=True, cancel_running=cancel)
@@ -0,0 +1,455 @@
+"""
+warm_pool.py
+------------
+Long-lived worker processes that run pipeline jobs as function calls.
+
+Starting `python converter.py` or `python editor.py` for every file pays for Python startup,
+the heavy imports (ffmpeg-python and numpy, torch and Whisper, the Gemini client) and the folder
+creation in config.py and the stage modules, every time. A WarmPool starts its workers together
+with the watcher. Each worker imports its stage module once and runs an optional initializer,
+such as loading the Whisper model. It then runs jobs as calls to the module's functions and
+sends back the result or the error.
+
+Where the OS supports it, workers are started with multiprocessing's "forkserver" method. The
+third-party modules a stage lists in `preload` are imported once in the fork server, and every
+worker is forked from it ready-made, including the replacements below. Elsewhere (Windows)
+workers are spawned and import everything themselves: once per worker, not once per file.
+
+Jobs still run apart from the watcher:
+    - A job that takes its worker down (a crash in a native library, the out-of-memory killer)
+      fails with WorkerCrashed. A fresh worker takes its place; the pool and the other jobs
+      carry on.
+    - cancel() drops a queued job. A running job's worker is terminated and replaced. On POSIX
+      each worker leads its own process group, so whatever the job started (ffmpeg, Whisper's
+      segment workers) is terminated with it. The job's future raises JobCancelled.
+Workers idle for `idle_timeout` seconds exit to free their memory and are started again for
+the next job. With WORKER_MAX_JOBS, a worker is replaced after that many jobs.
+
+Usage:
+    pool = stage_pool("convert", workers=2)
+    pool.start()
+    future = pool.submit("extract_audio", video_path, threads=2)
+    audio_path = future.result()
+    pool.shutdown()
+"""
+
+import atexit
+import importlib
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from pathlib import Path
+
+import setproctitle
+
+from config import WORKER_START_METHOD, WORKER_MAX_JOBS, WORKER_KILL_TIMEOUT
+import metrics
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+# What each stage's workers load: the module whose functions run as jobs, the third-party modules
+# the fork server imports for it, and the module functions run when a worker starts and exits
+STAGES = {
+    "convert": {"module": "converter", "preload": ("numpy", "ffmpeg")},
+    "transcribe": {"module": "transcription_worker", "preload": ("numpy", "torch", "whisper"),
+                   "initializer": "init_worker", "finalizer": "close_worker"},
+    "edit": {"module": "editor", "preload": ("google.generativeai",)},
+}
+
+# Modules asked to be preloaded into this process's fork server (it only reads them when it starts)
+_preload = set()
+
+
+class JobCancelled(Exception):
+    """Raised by the future of a job that was cancelled while it ran."""
+
+
+class WorkerCrashed(Exception):
+    """Raised by the future of a job whose worker exited or failed to start."""
+
+
+class RemoteTraceback(Exception):
+    """The traceback of an error raised in a worker, attached to it as __cause__."""
+
+    def __init__(self, tb):
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _portable(error):
+    """Returns `error` if it survives pickling, else a RuntimeError describing it."""
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+def _worker_main(conn, name, module_name, initializer, initargs, finalizer):
+    """
+    Worker process: imports the stage module, then runs the jobs sent over `conn` until it is
+    told to stop or the pool goes away.
+    """
+    if hasattr(os, "setpgrp"):
+        # Its own process group: cancelling a job also stops what it started, and Ctrl+C in the
+        # watcher's terminal is left to the watcher
+        os.setpgrp()
+    setproctitle.setproctitle(f"notes worker: {name}")
+    # Log lines and metrics name the process after its stage module, as when it ran as a script
+    sys.argv = [str(SCRIPTS_DIR / f"{module_name}.py")]
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    try:
+        module = importlib.import_module(module_name)
+        if initializer:
+            getattr(module, initializer)(*initargs)
+    except BaseException:
+        conn.send(("failed", traceback.format_exc()))
+        return
+    conn.send(("ready", os.getpid()))
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break  # The watcher is gone
+            if job is None:
+                break
+            func, args, kwargs = job
+            try:
+                # No function: a ping, answered with the worker's PID
+                message = ("ok", os.getpid() if func is None else getattr(module, func)(*args, **kwargs))
+            except BaseException as e:
+                message = ("error", _portable(e), traceback.format_exc())
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Worker processes end without running atexit handlers
+            metrics.flush()
+            try:
+                conn.send(message)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                conn.send(("error", RuntimeError(f"{func} returned a result that cannot be sent back: {e}"), ""))
+    finally:
+        if finalizer:
+            getattr(module, finalizer)()
+        metrics.flush()
+
+
+def _signal_group(process, sig):
+    """Sends `sig` to a worker and (on POSIX) every process it started."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, sig)
+            return
+        except ProcessLookupError:
+            pass  # Gone, or just started and not leading its own group yet
+    if process.is_alive():
+        if sig == signal.SIGTERM:
+            process.terminate()
+        else:
+            process.kill()
+
+
+class _Worker:
+    """
+    One worker process and the thread in the watcher that feeds it jobs.
+    """
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.process = None
+        self.conn = None
+        self.jobs_run = 0
+        # The job running in the process, and whether cancel() stopped it
+        self.future = None
+        self.cancelled = False
+        self.thread = threading.Thread(target=self._loop, name=f"{pool.name}-worker-{index+1}", daemon=True)
+
+    def _start_process(self):
+        pool = self.pool
+        conn, child_conn = pool._context.Pipe()
+        process = pool._context.Process(
+            target=_worker_main, name=f"{pool.name}-worker",
+            args=(child_conn, pool.name, pool.module, pool.initializer, pool.initargs, pool.finalizer),
+        )
+        process.start()
+        child_conn.close()
+        self.process, self.conn, self.jobs_run = process, conn, 0
+
+    def _stop_process(self):
+        """Asks an idle worker to exit, and kills it if it doesn't."""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(WORKER_KILL_TIMEOUT)
+        if self.process.is_alive():
+            _signal_group(self.process, getattr(signal, "SIGKILL", signal.SIGTERM))
+            self.process.join()
+        self._discard()
+
+    def _discard(self):
+        self.conn.close()
+        self.process.join()
+        self.process = self.conn = None
+
+    def _loop(self):
+        pool = self.pool
+        self._start_process()
+        while True:
+            try:
+                job = pool._jobs.get(timeout=pool.idle_timeout if self.process is not None else None)
+            except queue.Empty:
+                print(f"[warm_pool] {pool.name} worker idle for {pool.idle_timeout}s; stopping it to free memory.")
+                self._stop_process()
+                continue
+            if job is None:
+                break
+            self._run(*job)
+        self._stop_process()
+
+    def _receive(self):
+        """
+        Waits for the worker's next message other than "ready".
+        Returns:
+            tuple: The message, or None if the worker exited.
+        """
+        while True:
+            ready = wait([self.conn, self.process.sentinel])
+            if self.conn not in ready:
+                return None
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                return None
+            except Exception as e:
+                return ("error", RuntimeError(f"could not read the result from the {self.pool.name} worker: {e}"), "")
+            if message[0] != "ready":
+                return message
+
+    def _run(self, future, func, args, kwargs):
+        pool = self.pool
+        if self.process is not None and not self.process.is_alive():
+            self._discard()
+        if self.process is None:
+            self._start_process()
+        with pool._lock:
+            if not future.set_running_or_notify_cancel():
+                return
+            self.future, self.cancelled = future, False
+        try:
+            self.conn.send((func, args, kwargs))
+            message = self._receive()
+        except OSError:
+            message = None
+        with pool._lock:
+            self.future = None
+            cancelled = self.cancelled
+        if message is not None and message[0] == "ok":
+            future.set_result(message[1])
+        elif message is not None and message[0] == "error":
+            error = message[1]
+            if message[2]:
+                error.__cause__ = RemoteTraceback(message[2])
+            future.set_exception(error)
+        else:
+            # The worker is gone (or never started): fail this job alone and replace the worker
+            if message is not None:
+                error = WorkerCrashed(f"the {pool.name} worker failed to start: {message[1].strip().splitlines()[-1]}")
+                error.__cause__ = RemoteTraceback(message[1])
+            elif cancelled:
+                error = JobCancelled(f"{func} cancelled")
+            else:
+                self.process.join(WORKER_KILL_TIMEOUT)
+                error = WorkerCrashed(f"the {pool.name} worker (PID {self.process.pid}) exited with code "
+                                      f"{self.process.exitcode} while running {func}")
+                print(f"[warm_pool] {error}; starting a new one.")
+            _signal_group(self.process, getattr(signal, "SIGKILL", signal.SIGTERM))
+            self._discard()
+            future.set_exception(error)
+            if message is None and not pool._closed:
+                self._start_process()
+            return
+        self.jobs_run += 1
+        if pool.max_jobs and self.jobs_run >= pool.max_jobs:
+            self._stop_process()
+            if not pool._closed:
+                self._start_process()
+
+
+class WarmPool:
+    """
+    A fixed number of worker processes running the functions of one module.
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, name, module, workers=1, preload=(), initializer=None, initargs=(), finalizer=None,
+                 idle_timeout=None, max_jobs=WORKER_MAX_JOBS, start_method=WORKER_START_METHOD):
+        """
+        Args:
+            name (str): Stage name, for log lines and process titles.
+            module (str): Module (in the scripts folder) whose functions run as jobs.
+            workers (int): Jobs run at once.
+            preload (tuple): Third-party modules for the fork server to import before forking.
+            initializer (str): Function of `module` each worker runs once after importing it.
+            initargs (tuple): Arguments for the initializer.
+            finalizer (str): Function of `module` each worker runs before it exits.
+            idle_timeout (float): Seconds without jobs before a worker exits (None = never).
+            max_jobs (int): Jobs a worker runs before it is replaced (None = no limit).
+            start_method (str): multiprocessing start method (None = forkserver if available, else spawn).
+        """
+        self.name = name
+        self.module = module
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self.finalizer = finalizer
+        self.idle_timeout = idle_timeout
+        self.max_jobs = max_jobs
+        methods = multiprocessing.get_all_start_methods()
+        self.start_method = start_method or ("forkserver" if "forkserver" in methods else "spawn")
+        self._context = multiprocessing.get_context(self.start_method)
+        if self.start_method == "forkserver":
+            _preload.update(preload)
+            self._context.set_forkserver_preload(sorted(_preload))
+        self._jobs = queue.Queue()
+        # Reentrant: cancelling a future runs its done callback (_done) in the same thread
+        self._lock = threading.RLock()
+        self._workers = [_Worker(self, i) for i in range(workers)]
+        self._started = False
+        self._closed = False
+        self._pending = set()
+
+    def start(self):
+        """
+        Starts the workers, so they have finished importing by the time the first job arrives.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        atexit.register(self.shutdown, cancel_queued=True, cancel_running=True)
+        for worker in self._workers:
+            worker.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues a call to `func` (a function name in the pool's module) in a worker.
+        Returns:
+            Future: Resolves to the function's return value, or raises its error (with the worker's
+            traceback as __cause__), JobCancelled or WorkerCrashed.
+        """
+        self.start()
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"the {self.name} pool has been shut down")
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        self._jobs.put((future, func, args, kwargs))
+        return future
+
+    def ping(self):
+        """
+        Sends an empty job through a worker (benchmark_startup.py).
+        Returns:
+            Future: Resolves to the PID of the worker that answered.
+        """
+        return self.submit(None)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def cancel(self, future):
+        """
+        Cancels one job: drops it if it is still queued, or stops its worker if it is running.
+        Returns:
+            bool: False if the job had already finished.
+        """
+        return self._cancel([future])
+
+    def cancel_all(self):
+        """
+        Cancels every queued and running job.
+        """
+        with self._lock:
+            futures = list(self._pending)
+        self._cancel(futures)
+
+    def _cancel(self, futures):
+        stopping = []
+        cancelled = False
+        with self._lock:
+            for future in futures:
+                if future.cancel():
+                    cancelled = True
+                    continue
+                for worker in self._workers:
+                    if worker.future is future and not future.done():
+                        worker.cancelled = True
+                        stopping.append(worker.process)
+                        cancelled = True
+        # Signal every worker first, then give them WORKER_KILL_TIMEOUT together to exit
+        for process in stopping:
+            _signal_group(process, signal.SIGTERM)
+        deadline = time.monotonic() + WORKER_KILL_TIMEOUT
+        for process in stopping:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                _signal_group(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+        return cancelled
+
+    def shutdown(self, cancel_queued=False, cancel_running=False):
+        """
+        Stops the workers once the jobs already submitted are done, and waits for them.
+        Args:
+            cancel_queued (bool): Drop the jobs that have not started.
+            cancel_running (bool): Also stop the jobs in progress.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            futures = list(self._pending)
+        if cancel_running:
+            self._cancel(futures)
+        elif cancel_queued:
+            for future in futures:
+                future.cancel()
+        if not self._started:
+            return
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(cancel_queued=exc_type is not None, cancel_running=exc_type is not None)
+        return False
+
+
+def stage_pool(stage, workers=1, **options):
+    """
+    Returns a WarmPool for a pipeline stage ("convert", "transcribe" or "edit"; see STAGES).
+    Keyword arguments override or add to the stage's settings (initargs, idle_timeout, ...).
+    """
+    settings = dict(STAGES[stage])
+    settings.update(options)
+    return WarmPool(stage, workers=workers, **settings)